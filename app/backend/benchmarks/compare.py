@@ -0,0 +1,54 @@
+"""
+Compare two `serve_bench` reports, e.g. from two commits.
+
+    python -m benchmarks.compare base.json head.json --threshold 0.1
+
+Exits with status 1 if throughput dropped or a tail latency grew by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = (("rps", "rps", 1), ("p50", "latency_ms", -1), ("p95", "latency_ms", -1), ("p99", "latency_ms", -1))
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple[list[str], bool]:
+    """
+    Compare the overall and per-kind numbers of two reports.
+    :param base: dict, the reference report
+    :param head: dict, the report to check
+    :param threshold: float, tolerated relative change in the worse direction
+    :return: tuple[list[str], bool], table lines and whether a regression was found
+    """
+    lines = [f"{'kind':<8} {'metric':<6} {'base':>12} {'head':>12} {'change':>8}"]
+    regressed = False
+    sections = {"overall": (base["overall"], head["overall"])}
+    for kind in sorted(set(base["by_kind"]) & set(head["by_kind"])):
+        sections[kind] = (base["by_kind"][kind], head["by_kind"][kind])
+
+    for kind, (b, h) in sections.items():
+        for name, group, direction in METRICS:
+            bv = b[name] if group == "rps" else b[group][name]
+            hv = h[name] if group == "rps" else h[group][name]
+            change = (hv - bv) / bv if bv else 0.0
+            worse = -direction * change > threshold
+            regressed |= worse
+            lines.append(f"{kind:<8} {name:<6} {bv:>12.2f} {hv:>12.2f} {change:>+7.1%}{' !' if worse else ''}")
+    return lines, regressed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", type=Path)
+    parser.add_argument("head", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    lines, regressed = compare(json.loads(args.base.read_text()), json.loads(args.head.read_text()), args.threshold)
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark of the density estimators balancing Tiny RoMa match sampling (see TinyRoMa.sample).
+
+Every estimator is compared to the exact kernel density over all candidate matches:
+    density_error  mean |d - d_exact| / d_exact over the candidates
+    sampling_tv    total variation distance between the balanced sampling distributions, p = 1 / (d + 1)
+                   with the same `density < 10` cut-off as `sample`
+"exact/8" is the estimate `sample` runs on CPU with the exact estimator (every 8th match only).
+
+    python -m benchmarks.kde_bench --candidates 20000 --repeat 3
+    # on the candidates of real matches between consecutive dataset-preview frames
+    python -m benchmarks.kde_bench --model base
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from src.third_party.romatch.utils.kde import grid_kde, hash_kde, kde
+
+ESTIMATORS = {
+    "exact/8": lambda x: kde(x, std=0.1, half=False, down=8) * 8,
+    "grid": lambda x: grid_kde(x, std=0.1),
+    "hash": lambda x: hash_kde(x, std=0.1),
+}
+
+
+def synthetic_candidates(n: int, seed: int = 0) -> torch.Tensor:
+    """
+    Candidate matches of a smooth warp: a dense cluster and a uniform spread in the first image, an affine map
+    with noise to the second image, and a share of uniform outliers.
+    :param n: int, number of candidates
+    :param seed: int, random seed
+    :return: torch.Tensor, (n, 4) matches in normalized coordinates
+    """
+    generator = torch.Generator().manual_seed(seed)
+    a = torch.rand(n, 2, generator=generator) * 2 - 1
+    a[:2 * n // 5] = a[:2 * n // 5] * 0.3 + 0.2
+    b = a @ torch.tensor([[0.9, 0.1], [-0.1, 0.9]]) + 0.05 + 0.01 * torch.randn(n, 2, generator=generator)
+    b[n - n // 7:] = torch.rand(n // 7, 2, generator=generator) * 2 - 1
+    return torch.cat([a, b], dim=1)
+
+
+def model_candidates(model_name: str, n: int) -> torch.Tensor:
+    """
+    Candidate matches drawn by certainty, as in `TinyRoMa.sample`, from the warp between the first two
+    dataset-preview frames.
+    """
+    import cv2
+
+    from src.model_mangers.roma_manager import RomaManager
+    from src.utils.precision import calibration_frames
+
+    model = RomaManager(cache=None)._load_model(model_name, device="cpu")
+    imA, imB = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in calibration_frames(limit=2)]
+    with torch.no_grad():
+        warp, certainty = model.match(imA, imB, batched=False)
+    certainty = certainty.float().clone()
+    certainty[certainty > model.sample_thresh] = 1
+    samples = torch.multinomial(certainty.reshape(-1), num_samples=n, replacement=False)
+    return warp.float().reshape(-1, 4)[samples]
+
+
+def _sampling_distribution(density: torch.Tensor) -> torch.Tensor:
+    p = 1 / (density + 1)
+    p[density < 10] = 1e-7
+    return p / p.sum()
+
+
+def bench(candidates: torch.Tensor, repeat: int) -> dict:
+    """
+    Time every estimator and compare its density and sampling distribution to the exact ones.
+    :return: dict, timings in milliseconds and errors
+    """
+    started = time.perf_counter()
+    exact = kde(candidates, std=0.1, half=False)
+    report = {"candidates": len(candidates), "exact_ms": (time.perf_counter() - started) * 1000, "estimators": []}
+    p_exact = _sampling_distribution(exact)
+    for name, estimator in ESTIMATORS.items():
+        estimator(candidates)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            density = estimator(candidates)
+        ms = (time.perf_counter() - started) / repeat * 1000
+        report["estimators"].append({
+            "name": name,
+            "ms": ms,
+            "speedup": report["exact_ms"] / ms,
+            "density_error": float(((density - exact).abs() / exact).mean()),
+            "sampling_tv": float((_sampling_distribution(density) - p_exact).abs().sum() / 2),
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=20000, help="4 x the 5000 matches sampled per prediction")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", default=None, help="Tiny RoMa model producing the candidates, synthetic if omitted")
+    args = parser.parse_args(argv)
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    if args.model is None:
+        candidates = synthetic_candidates(args.candidates)
+    else:
+        candidates = model_candidates(args.model, args.candidates)
+    report = bench(candidates, args.repeat)
+    print(f"exact    {report['exact_ms']:9.1f} ms")
+    for row in report["estimators"]:
+        print(f"{row['name']:8s} {row['ms']:9.1f} ms  {row['speedup']:6.1f}x  "
+              f"density error {row['density_error']:.4f}  sampling TV {row['sampling_tv']:.4f}")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Accuracy-regression report of the inference precision modes (see src/utils/precision.py).
+
+Every mode is compared to fp32 on the colour frames of `dataset-preview/`:
+    depth  AbsRel drift, mean |d - d_fp32| / d_fp32 over the pixels, per frame
+    RoMa   inlier-count drift, |n - n_fp32| / n_fp32 of the RANSAC inliers, per consecutive frame pair
+The fastest mode whose drift stays within tolerance is recommended for each model.
+
+    python -m benchmarks.precision_report --depth-models base_vitb --roma-models base --output precision.json
+    # without checkpoints, on seeded random weights (latency only, the drift is not meaningful)
+    python -m benchmarks.precision_report --random-weights
+"""
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from benchmarks.stand_ins import _seeded
+from src.config import DEPTH_BASE_MODEL, PRECISION, ROMA_BASE_MODEL
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.roma_manager import NUM_SAMPLES, RANSAC_PARAMS, RomaManager
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.precision import PRECISIONS, apply_precision, calibration_frames, precision_context
+
+
+def _load_fp32(model_type: str, model_name: str, random_weights: bool):
+    if not random_weights:
+        if model_type == "depth":
+            return DepthManager(batching={}, cache=None)._load_model(model_name, device="cpu", precision="fp32")
+        return RomaManager(cache=None)._load_model(model_name, device="cpu", precision="fp32")
+    if model_type == "depth":
+        build = lambda: DepthAnythingV2(encoder='vits', features=64, out_channels=[48, 96, 192, 384])
+    else:
+        build = lambda: tiny_roma_v1_model(xfeat=XFeatModel())
+    return _seeded(build, model_name).eval()
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _depth_outputs(model, frames: list[np.ndarray]) -> tuple[list[np.ndarray], float]:
+    outputs, times = [], []
+    with precision_context(model):
+        for frame in frames:
+            depth, ms = _timed(lambda: model.infer_image(frame))
+            outputs.append(depth)
+            times.append(ms)
+    return outputs, float(np.median(times))
+
+
+def _inliers(model, frames: list[np.ndarray]) -> tuple[list[int], float]:
+    rgb = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in frames]
+    counts, times = [], []
+    for imA, imB in zip(rgb, rgb[1:]):
+        torch.manual_seed(0)
+        cv2.setRNGSeed(0)
+        with torch.no_grad(), precision_context(model):
+            (warp, certainty), ms = _timed(lambda: model.match(imA, imB, batched=False))
+            matches, _ = model.sample(warp.float(), certainty.float(), num=NUM_SAMPLES)
+        kptsA, kptsB = model.to_pixel_coordinates(matches, *imA.shape[:2], *imB.shape[:2])
+        _, mask = cv2.findFundamentalMat(kptsA.cpu().numpy(), kptsB.cpu().numpy(), **RANSAC_PARAMS)
+        counts.append(int(mask.sum()) if mask is not None else 0)
+        times.append(ms)
+    return counts, float(np.median(times))
+
+
+def abs_rel(pred: np.ndarray, ref: np.ndarray) -> float:
+    """
+    Mean absolute relative difference over the pixels where the reference is positive.
+    """
+    valid = ref > 1e-6
+    return float(np.mean(np.abs(pred[valid] - ref[valid]) / ref[valid])) if valid.any() else 0.0
+
+
+def report(model_type: str, model_name: str, precisions: list[str], frames: list[np.ndarray],
+           calibration: list[np.ndarray], tolerance: float, random_weights: bool) -> dict:
+    """
+    Measure the latency and drift of every precision mode of one model.
+    :param model_type: str, 'depth' or 'roma'
+    :param model_name: str, name of the model in DEPTH_MODELS / ROMA_MODELS
+    :param precisions: list[str], modes to measure, fp32 is always measured as the reference
+    :param frames: list[np.ndarray], BGR evaluation frames
+    :param calibration: list[np.ndarray], BGR frames for int8_static calibration
+    :param tolerance: float, largest accepted drift
+    :param random_weights: bool, use seeded random weights instead of the checkpoint
+    :return: dict, per-mode results and the recommended mode
+    """
+    base = _load_fp32(model_type, model_name, random_weights)
+    manager = DepthManager if model_type == "depth" else RomaManager
+    measure = _depth_outputs if model_type == "depth" else _inliers
+
+    reference, reference_ms = measure(base, frames)
+    modes = {"fp32": {"latency_ms": reference_ms, "drift": 0.0}}
+    for precision in [p for p in precisions if p != "fp32"]:
+        model = apply_precision(copy.deepcopy(base), precision,
+                                calibrate=lambda m: manager.calibrate(m, calibration))
+        outputs, ms = measure(model, frames)
+        if model_type == "depth":
+            drift = float(np.mean([abs_rel(d, r) for d, r in zip(outputs, reference)]))
+        else:
+            drift = float(np.mean([abs(n - r) / max(r, 1) for n, r in zip(outputs, reference)]))
+        modes[precision] = {"latency_ms": ms, "drift": drift}
+
+    accepted = [p for p, m in modes.items() if m["drift"] <= tolerance]
+    return {
+        "model_type": model_type,
+        "model_name": model_name,
+        "metric": "abs_rel" if model_type == "depth" else "inlier_count",
+        "tolerance": tolerance,
+        "modes": modes,
+        "recommended": min(accepted, key=lambda p: modes[p]["latency_ms"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth-models", default=DEPTH_BASE_MODEL, help="comma-separated, empty to skip")
+    parser.add_argument("--roma-models", default=ROMA_BASE_MODEL, help="comma-separated, empty to skip")
+    parser.add_argument("--precisions", default=",".join(PRECISIONS))
+    parser.add_argument("--frames", type=Path, default=PRECISION['calibration_dir'])
+    parser.add_argument("--num-frames", type=int, default=16)
+    parser.add_argument("--depth-tolerance", type=float, default=0.02, help="largest accepted AbsRel drift")
+    parser.add_argument("--inlier-tolerance", type=float, default=0.1, help="largest accepted inlier-count drift")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args(argv)
+
+    frames = calibration_frames(args.frames, args.num_frames, PRECISION['calibration_max_side'])
+    calibration = calibration_frames(args.frames, PRECISION['calibration_frames'], PRECISION['calibration_max_side'])
+    precisions = args.precisions.split(",")
+    jobs = [("depth", name, args.depth_tolerance) for name in filter(None, args.depth_models.split(","))]
+    jobs += [("roma", name, args.inlier_tolerance) for name in filter(None, args.roma_models.split(","))]
+
+    results = []
+    for model_type, name, tolerance in jobs:
+        result = report(model_type, name, precisions, frames, calibration, tolerance, args.random_weights)
+        results.append(result)
+        for precision, mode in result["modes"].items():
+            flag = " *" if precision == result["recommended"] else ""
+            print(f"{model_type:<6} {name:<12} {precision:<13} {mode['latency_ms']:9.1f} ms  "
+                  f"{result['metric']} drift {mode['drift']:7.4f}{flag}")
+
+    output = {"frames": len(frames), "calibration_frames": len(calibration), "results": results}
+    if args.output is not None:
+        args.output.write_text(json.dumps(output, indent=2))
+    print(json.dumps({f"{r['model_type']}/{r['model_name']}": r["recommended"] for r in results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of the Depth-Anything-V2 preprocessing: the tensor pipeline (`image2tensor`)
+against the original NumPy/OpenCV one (`image2tensor_numpy`), and the cached position embeddings.
+
+    python -m benchmarks.preprocess_bench --sizes 480x640,1080x1920,2160x3840 --repeat 20
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+
+
+def _time_ms(fn, repeat: int) -> float:
+    fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def bench(sizes: list[tuple[int, int]], repeat: int, batch: int, device: str) -> dict:
+    """
+    Time both preprocessing paths per image size, and the position-embedding interpolation with
+    and without its cache.
+    :return: dict, timings in milliseconds
+    """
+    model = DepthAnythingV2(encoder='vits', features=64, out_channels=[48, 96, 192, 384]).to(device).eval()
+    rng = np.random.default_rng(0)
+    report = {"device": device, "preprocess": [], "pos_embed": []}
+
+    for h, w in sizes:
+        images = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(batch)]
+        numpy_ms = _time_ms(lambda: [model.image2tensor_numpy(image) for image in images], repeat)
+        tensor_ms = _time_ms(lambda: model.images2tensor(images), repeat)
+        report["preprocess"].append({
+            "size": f"{h}x{w}", "batch": batch, "numpy_ms": numpy_ms, "tensor_ms": tensor_ms,
+            "speedup": numpy_ms / tensor_ms,
+        })
+
+        x, _ = model.image2tensor(images[0])
+        tokens = model.pretrained.prepare_tokens_with_masks
+        with torch.no_grad():
+            cached_ms = _time_ms(lambda: tokens(x), repeat)
+            model.pretrained._pos_embed_cache.clear()
+            uncached_ms = _time_ms(lambda: (model.pretrained._pos_embed_cache.clear(), tokens(x)), repeat)
+        report["pos_embed"].append({
+            "size": f"{x.shape[-2]}x{x.shape[-1]}", "uncached_ms": uncached_ms, "cached_ms": cached_ms,
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="480x640,1080x1920,2160x3840")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",")]
+    report = bench(sizes, args.repeat, args.batch, args.device)
+    for row in report["preprocess"]:
+        print(f"{row['size']:>10} x{row['batch']}  numpy {row['numpy_ms']:8.2f} ms  "
+              f"tensor {row['tensor_ms']:8.2f} ms  {row['speedup']:5.2f}x")
+    for row in report["pos_embed"]:
+        print(f"{row['size']:>10} patch tokens  uncached {row['uncached_ms']:7.2f} ms  cached {row['cached_ms']:7.2f} ms")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
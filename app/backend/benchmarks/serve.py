@@ -0,0 +1,25 @@
+"""
+Run the FastAPI app with deterministic stand-in models, as a target for `serve_bench --url`.
+
+    python -m benchmarks.serve --port 8000
+"""
+import argparse
+
+import uvicorn
+
+from benchmarks import stand_ins
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    stand_ins.install()
+    from main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Load test for the FastAPI app.
+
+Drives `main.app` in-process (through an ASGI transport) or a server over HTTP with a configurable
+concurrency and request mix, and reports latency percentiles, throughput and peak RSS as JSON.
+
+    python -m benchmarks.serve_bench --stand-ins --requests 200 --concurrency 8 --output bench.json
+    python -m benchmarks.serve_bench --url http://127.0.0.1:8000 --mix depth=1,roma=1
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import httpx
+import numpy as np
+import torch
+
+from src.config import BASE_DIR, DEPTH_BASE_MODEL, RESULT_CACHE, ROMA_BASE_MODEL
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DATASET_DIR = BASE_DIR.parent.parent / "dataset-preview"
+
+
+@dataclass
+class Request:
+    kind: str
+    method: str
+    path: str
+    files: dict = field(default_factory=dict)
+    json: Optional[dict] = None
+
+
+def load_scenes(root: Path, max_side: Optional[int] = None) -> dict[str, list[bytes]]:
+    """
+    Load the frames of every scene as JPEG bytes.
+    Color frames are used as they are; scenes that only ship depth maps contribute colorized depth maps,
+    so the benchmark still covers their resolution.
+    :param root: Path, dataset directory with one sub-directory per scene
+    :param max_side: int, downscale frames whose longest side exceeds this, keep the original size if None
+    :return: dict[str, list[bytes]], encoded frames per scene
+    """
+    scenes = {}
+    for scene in sorted(p for p in root.iterdir() if p.is_dir()):
+        color = sorted(scene.glob("*.color.*")) or sorted(
+            p for p in scene.glob("*") if p.suffix.lower() in (".jpg", ".jpeg"))
+        frames = []
+        for path in color or sorted(scene.glob("*.depth.png")):
+            img = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+            if img is None:
+                continue
+            if img.ndim == 2:
+                d = img.astype(np.float32)
+                d = (d - d.min()) / max(float(d.max() - d.min()), 1e-6) * 255.0
+                img = cv2.applyColorMap(d.astype(np.uint8), cv2.COLORMAP_INFERNO)
+            if max_side and max(img.shape[:2]) > max_side:
+                scale = max_side / max(img.shape[:2])
+                img = cv2.resize(img, (round(img.shape[1] * scale), round(img.shape[0] * scale)),
+                                 interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            if ok:
+                frames.append(buf.tobytes())
+        if frames:
+            scenes[scene.name] = frames
+    if not scenes:
+        raise ValueError(f"No images found in {root}")
+    return scenes
+
+
+def build_plan(scenes: dict[str, list[bytes]], requests: int, mix: dict[str, float], switch_every: int,
+               depth_models: list[str], roma_models: list[str], depth_format: str, roma_format: str,
+               seed: int) -> list[Request]:
+    """
+    Build a deterministic sequence of requests.
+    :param scenes: dict[str, list[bytes]], encoded frames per scene
+    :param requests: int, number of prediction requests
+    :param mix: dict[str, float], relative weight of 'depth' and 'roma' predictions
+    :param switch_every: int, insert a model selection after this many predictions, never if 0
+    :param depth_models: list[str], depth models the selections cycle through
+    :param roma_models: list[str], roma models the selections cycle through
+    :param depth_format: str, response format requested from the depth route
+    :param roma_format: str, response format requested from the roma route
+    :param seed: int, seed of the request sequence
+    :return: list[Request], the plan
+    """
+    rng = random.Random(seed)
+    frames = [frame for scene in scenes.values() for frame in scene]
+    pairs = [(scene[i], scene[i + 1]) for scene in scenes.values() for i in range(len(scene) - 1)]
+    if mix.get("roma", 0) > 0 and not pairs:
+        raise ValueError("RoMa requests need a scene with at least two frames")
+
+    kinds = [k for k in ("depth", "roma") if mix.get(k, 0) > 0]
+    weights = [mix[k] for k in kinds]
+    switches = []
+    for i in range(max(len(depth_models), len(roma_models))):
+        if "depth" in kinds:
+            switches.append(("/depth-anything-v2/select", depth_models[(i + 1) % len(depth_models)]))
+        if "roma" in kinds:
+            switches.append(("/tiny-roma/select", roma_models[(i + 1) % len(roma_models)]))
+
+    plan = []
+    for i in range(requests):
+        if switch_every and i and i % switch_every == 0:
+            path, model_name = switches[(i // switch_every - 1) % len(switches)]
+            plan.append(Request("select", "POST", path, json={"model_name": model_name}))
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "depth":
+            frame = rng.choice(frames)
+            plan.append(Request("depth", "POST", f"/depth-anything-v2/predict?format={depth_format}",
+                                files={"file": ("frame.jpg", frame, "image/jpeg")}))
+        else:
+            a, b = rng.choice(pairs)
+            plan.append(Request("roma", "POST", f"/tiny-roma/predict?format={roma_format}",
+                                files={"file1": ("a.jpg", a, "image/jpeg"), "file2": ("b.jpg", b, "image/jpeg")}))
+    return plan
+
+
+async def run_plan(client: httpx.AsyncClient, plan: list[Request], concurrency: int) -> list[tuple[str, float, int]]:
+    """
+    Send the requests of a plan with at most `concurrency` in flight.
+    :return: list[tuple[str, float, int]], kind, latency in seconds and status code of every request
+    """
+    samples = []
+    it = iter(plan)
+
+    async def worker():
+        for req in it:
+            started = time.perf_counter()
+            try:
+                res = await client.request(req.method, req.path, files=req.files or None, json=req.json)
+                status = res.status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append((req.kind, time.perf_counter() - started, status))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100.0 * len(values)) - 1)]
+
+
+def summarize(samples: list[tuple[str, float, int]], elapsed: float) -> dict:
+    def stats(rows):
+        latencies = sorted(lat for _, lat, _ in rows)
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for _, _, status in rows if status != 200),
+            "rps": len(rows) / elapsed if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": 1000.0 * percentile(latencies, 50),
+                "p95": 1000.0 * percentile(latencies, 95),
+                "p99": 1000.0 * percentile(latencies, 99),
+                "mean": 1000.0 * sum(latencies) / len(latencies) if latencies else 0.0,
+                "max": 1000.0 * latencies[-1] if latencies else 0.0,
+            },
+        }
+
+    kinds = sorted({kind for kind, _, _ in samples})
+    return {
+        "elapsed_s": elapsed,
+        "overall": stats(samples),
+        "by_kind": {kind: stats([s for s in samples if s[0] == kind]) for kind in kinds},
+    }
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+async def bench(client: httpx.AsyncClient, plan: list[Request], warmup: list[Request], concurrency: int) -> dict:
+    if warmup:
+        await run_plan(client, warmup, concurrency)
+    started = time.perf_counter()
+    samples = await run_plan(client, plan, concurrency)
+    report = summarize(samples, time.perf_counter() - started)
+
+    server = {}
+    for name, path in (("depth", "/depth-anything-v2/stats"), ("roma", "/tiny-roma/stats")):
+        try:
+            res = await client.get(path)
+            server[name] = res.json().get("stats") if res.status_code == 200 else None
+        except (httpx.HTTPError, ValueError):
+            server[name] = None
+    report["server_stats"] = server
+    return report
+
+
+def _parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("depth", "roma"):
+            raise argparse.ArgumentTypeError(f"Unknown request kind '{kind}'")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of main.app in-process")
+    parser.add_argument("--stand-ins", action="store_true",
+                        help="serve deterministic stand-in models instead of checkpoints (in-process only)")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache enabled (in-process only)")
+    parser.add_argument("--requests", type=int, default=100, help="number of prediction requests")
+    parser.add_argument("--warmup", type=int, default=4, help="unmeasured requests sent first")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mix", type=_parse_mix, default={"depth": 3.0, "roma": 1.0},
+                        help="relative weights of the request kinds, e.g. depth=3,roma=1")
+    parser.add_argument("--switch-every", type=int, default=0, help="select another model after N requests")
+    parser.add_argument("--depth-models", default=DEPTH_BASE_MODEL, help="comma separated depth models to cycle")
+    parser.add_argument("--roma-models", default=ROMA_BASE_MODEL, help="comma separated roma models to cycle")
+    parser.add_argument("--depth-format", default="json", help="response format of the depth route (json, f32, ...)")
+    parser.add_argument("--roma-format", default="json", help="response format of the roma route (json, columnar)")
+    parser.add_argument("--dataset", type=Path, default=DATASET_DIR, help="directory with one folder per scene")
+    parser.add_argument("--max-side", type=int, default=640, help="downscale larger frames, 0 keeps the original size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    scenes = load_scenes(args.dataset, args.max_side or None)
+    plan_args = dict(mix=args.mix, switch_every=args.switch_every,
+                     depth_models=args.depth_models.split(","), roma_models=args.roma_models.split(","),
+                     depth_format=args.depth_format, roma_format=args.roma_format)
+    plan = build_plan(scenes, args.requests, seed=args.seed, **plan_args)
+    warmup = build_plan(scenes, args.warmup, seed=args.seed + 1, **plan_args)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        if args.stand_ins:
+            from benchmarks import stand_ins
+            stand_ins.install()
+        RESULT_CACHE['enabled'] = args.cache
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    async def run():
+        async with client:
+            return await bench(client, plan, warmup, args.concurrency)
+
+    report = asyncio.run(run())
+    report["peak_rss_bytes"] = peak_rss_bytes()
+    report["meta"] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "target": args.url or "in-process",
+        "rss_scope": "client" if args.url else "server",
+        "stand_ins": bool(args.stand_ins and not args.url),
+        "cache": args.cache,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "mix": args.mix,
+        "switch_every": args.switch_every,
+        "depth_format": args.depth_format,
+        "roma_format": args.roma_format,
+        "seed": args.seed,
+        "frame_sizes": sorted({cv2.imdecode(np.frombuffer(f, np.uint8), cv2.IMREAD_COLOR).shape[:2]
+                               for frames in scenes.values() for f in frames}),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Deterministic lightweight stand-ins for the served models, so the benchmarks run on CPU-only
+machines without checkpoints. The stand-ins keep the real pre- and post-processing paths:
+the depth stand-in reuses the DepthAnythingV2 inference methods around a tiny network and the
+RoMa stand-in is a real TinyRoMa with randomly initialized weights.
+Weights are seeded from the model name, so every run serves identical models.
+"""
+import zlib
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from src.config import DEPTH_MODELS, DEVICE, ROMA_MODELS
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+
+
+class StandInDepthAnything(nn.Module):
+    """
+    A patch embedding and a small convolutional head behind the DepthAnythingV2 inference interface.
+    """
+    image2tensor = DepthAnythingV2.image2tensor
+    images2tensor = DepthAnythingV2.images2tensor
+    infer_image = DepthAnythingV2.infer_image
+    infer_tensor = DepthAnythingV2.infer_tensor
+    infer_batch = DepthAnythingV2.infer_batch
+    input_shape = staticmethod(DepthAnythingV2.input_shape)
+    _resize_transform = staticmethod(DepthAnythingV2._resize_transform)
+
+    def __init__(self, features: int = 32):
+        super().__init__()
+        self.patch_embed = nn.Conv2d(3, features, kernel_size=14, stride=14)
+        self.head = nn.Sequential(
+            nn.Conv2d(features, features, kernel_size=3, padding=1),
+            nn.ReLU(True),
+            nn.Conv2d(features, 1, kernel_size=1),
+        )
+
+    def forward(self, x):
+        h, w = x.shape[-2:]
+        depth = self.head(F.gelu(self.patch_embed(x)))
+        depth = F.interpolate(depth, (h, w), mode="bilinear", align_corners=True)
+        return F.relu(depth).squeeze(1)
+
+
+def _seeded(build, model_name: str) -> nn.Module:
+    """
+    Build a model with weights derived from its name, without touching the global RNG state.
+    """
+    with torch.random.fork_rng(devices=[]):
+        torch.manual_seed(zlib.crc32(model_name.encode()))
+        return build()
+
+
+def load_depth_stand_in(self, model_name: str, device=DEVICE) -> StandInDepthAnything:
+    if model_name not in DEPTH_MODELS:
+        raise ValueError(f"Model '{model_name}' not found in DEPTH_MODELS")
+    return _seeded(StandInDepthAnything, model_name).to(device).eval()
+
+
+def load_roma_stand_in(self, model_name: str, device=DEVICE):
+    if model_name not in ROMA_MODELS:
+        raise ValueError(f"Model '{model_name}' not found in ROMA_MODELS")
+    return _seeded(lambda: tiny_roma_v1_model(xfeat=XFeatModel()), model_name).to(device).eval()
+
+
+def install() -> None:
+    """
+    Make the model managers load stand-ins instead of checkpoints.
+    Must be called before the first model is loaded.
+    """
+    DepthManager._load_model = load_depth_stand_in
+    RomaManager._load_model = load_roma_stand_in
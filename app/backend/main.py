@@ -1,12 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from src.config import MODEL_WARMUP
+from src.model_mangers import registry
 from src.routes.depth_route import depth_router
+from src.routes.health_route import health_router
+from src.routes.metrics_route import metrics_router
 from src.routes.roma_route import roma_router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MODEL_WARMUP['enabled']:
+        registry.start_warmup()
+    yield
+
+
 app = FastAPI(
     title="NeRF-Augmented ViT Training API",
     description="Swap models and run inference on demand",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -19,3 +34,5 @@ app.add_middleware(
 
 app.include_router(depth_router)
 app.include_router(roma_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
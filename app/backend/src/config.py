@@ -7,6 +7,13 @@ CHECKPOINT_DIR = BASE_DIR / "checkpoints"
 ROMA_CHECKPOINT_DIR = CHECKPOINT_DIR / "tiny_RoMa"
 DEPTH_CHECKPOINT_DIR = CHECKPOINT_DIR / "Depth-Anything-V2"
 
+# Local content-addressed artifact store (see src/utils/artifact_store.py). Model specs below may name
+# an 'artifact' instead of a 'checkpoint' path, and may pin a 'sha256' that is checked when `verify` is set.
+ARTIFACT_STORE = {
+    'dir': CHECKPOINT_DIR / "artifacts",
+    'verify': True,
+}
+
 DEPTH_BASE_MODEL = 'base_vitb'
 DEPTH_MODELS = {
     'base_vitl': {
@@ -35,6 +42,87 @@ DEPTH_MODELS = {
     }
 }
 
+# Byte budget for the depth models kept resident at the same time (least recently used are evicted).
+DEPTH_POOL_BUDGET_BYTES = 3 * 1024 ** 3
+
+# Inference execution: `replicas` independent copies of every resident depth model and
+# `workers` threads running predictions off the event loop.
+DEPTH_EXECUTION = {
+    'replicas': 1,
+    'workers': 2,
+}
+
+# Dynamic micro-batching of concurrent depth requests.
+# Requests arriving within `max_wait_ms` of each other that resize to the same
+# network input shape are run through a single forward pass.
+DEPTH_BATCHING = {
+    'enabled': True,
+    'max_batch_size': 8,
+    'max_wait_ms': 10,
+}
+
+# WebSocket depth streaming (/depth-anything-v2/stream): frames waiting for decoding beyond
+# `queue_size` are handled by `policy` (drop_oldest, drop_newest or block).
+# Streams decode and encode frames on their own `workers` threads, only the forward pass
+# runs on the DEPTH_EXECUTION pool shared with /predict.
+DEPTH_STREAMING = {
+    'queue_size': 2,
+    'policy': 'drop_oldest',
+    'format': 'f16',
+    'workers': 2,
+}
+
+# Tiled high-resolution depth inference: overlapping `tile_size` tiles at native resolution, aligned to
+# a whole-image prediction and blended across `overlap`. Used on request (?tiled=true), or automatically
+# when `auto` is set and the longest image side reaches `auto_min_side`. `max_side` caps the working
+# resolution (None for native) and `memory_cap_bytes` bounds the activations of a batch of tiles.
+DEPTH_TILING = {
+    'auto': False,
+    'auto_min_side': 1536,
+    'tile_size': 518,
+    'overlap': 0.25,
+    'max_side': None,
+    'memory_cap_bytes': 2 * 1024 ** 3,
+}
+
+# Inference precision (see src/utils/precision.py): fp32, bf16 (autocast), int8_dynamic or int8_static.
+# `default` applies to every entry of DEPTH_MODELS / ROMA_MODELS without a 'precision' of its own. int8_static
+# calibrates its activation ranges on up to `calibration_frames` colour frames found under `calibration_dir`.
+PRECISION = {
+    'default': 'fp32',
+    'calibration_dir': BASE_DIR.parent.parent / "dataset-preview",
+    'calibration_frames': 8,
+    'calibration_max_side': 640,
+}
+
+# Compiled inference graphs (see src/model_mangers/compiled.py): `backend` is eager, export (torch.export graphs)
+# or aoti (AOTInductor native code). Graphs are built for the image sizes listed per model type, cached in
+# `cache_dir` by checkpoint sha256, and other sizes run eagerly. Only fp32 models are compiled.
+INFERENCE_BACKEND = {
+    'backend': 'eager',
+    'cache_dir': CHECKPOINT_DIR / "compiled",
+    'sizes': {
+        'depth_anything': [(480, 640), (720, 1280)],
+        'tiny_roma': [(480, 640)],
+    },
+}
+
+# Opt-in per-stage latency histograms, replica wait time and peak memory, exported on GET /metrics
+# in the Prometheus text format. Timing hooks are no-ops while disabled.
+METRICS = {
+    'enabled': False,
+    'buckets': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+# Content-addressed cache of prediction results, keyed by the image bytes, model and parameters.
+# `disk_dir` enables a memory-mapped on-disk tier that survives restarts (e.g. BASE_DIR / "cache").
+RESULT_CACHE = {
+    'enabled': True,
+    'max_bytes': 256 * 1024 ** 2,
+    'disk_dir': None,
+    'disk_max_bytes': 4 * 1024 ** 3,
+}
+
 ROMA_BASE_MODEL = 'base'
 ROMA_MODELS = {
     'base': {
@@ -51,6 +139,81 @@ ROMA_MODELS = {
     }
 }
 
+# Byte budget for the Tiny RoMa models kept resident at the same time.
+ROMA_POOL_BUDGET_BYTES = 512 * 1024 ** 2
+
+# Inference execution for Tiny RoMa, see DEPTH_EXECUTION.
+ROMA_EXECUTION = {
+    'replicas': 1,
+    'workers': 2,
+}
+
+# Tiny RoMa match sampling (see TinyRoMa.sample): `kde_mode` is the density estimator balancing the sampled
+# matches, exact (the original pairwise estimate) or the binned grid / hash estimators, which are ~10x faster
+# (see benchmarks/kde_bench.py). `sparse_points` draws that many points by certainty on the fine flow instead of
+# upsampling the full-resolution warp (see TinyRoMa.sample_points), e.g. 20000 (4x the matches sampled);
+# None samples the dense warp. Part of the result cache and match store keys.
+ROMA_SAMPLING = {
+    'kde_mode': 'exact',
+    'sparse_points': None,
+}
+
+# Coarse correlation of Tiny RoMa: volumes larger than `max_bytes` (4 bytes per pixel pair of the 1/8 resolution
+# feature maps, ~90 MB per 480x640 pair, ~830 MB at 720x1280) are correlated and embedded a chunk of rows at a time,
+# each chunk staying under `max_bytes`. None always materializes the whole volume.
+ROMA_CORRELATION = {
+    'max_bytes': 128 * 1024 ** 2,
+}
+
+# One-to-many matching (RomaManager.predict_many, POST /tiny-roma/predict-many). References of the same size are
+# matched `max_batch_size` at a time (each 480x640 reference adds a ~90 MB correlation volume to the batch).
+# XFeat features of the query and references are kept in an LRU cache of `feature_cache_bytes` keyed by image hash.
+ROMA_MATCH_MANY = {
+    'max_batch_size': 4,
+    'feature_cache_bytes': 256 * 1024 ** 2,
+}
+
+# Query-keypoint matching (RomaManager.match_keypoints, POST /tiny-roma/match-keypoints): the correspondences of up to
+# `max_points` pixel coordinates of image A are read off the fine flow, without the dense warp or the sampling.
+ROMA_MATCH_KEYPOINTS = {
+    'max_points': 100_000,
+}
+
+# Robust geometry stage of Tiny RoMa (src/model_mangers/geometry.py). Sampled matches are verified on a pool of
+# `workers` processes once the model replica is released, 0 verifies them on the request thread. `default` holds the
+# per-request parameters: `estimator` 'F', 'E' (needs the intrinsics of both images), 'H' or 'none', the inlier
+# `threshold` in pixels, the early-exit `confidence`, the `max_iters` budget, and the `time_budget` in seconds a
+# request waits for its verification (None waits for it), after which the matches are returned unverified.
+ROMA_GEOMETRY = {
+    'workers': 2,
+    'default': {
+        'estimator': 'F',
+        'threshold': 0.2,
+        'confidence': 0.999999,
+        'max_iters': 10000,
+        'time_budget': None,
+    },
+}
+
+# Scene pair matching job (python -m src.jobs.pair_matching): every image is matched to its `top_k` best candidates,
+# ranked by camera poses when the scene has them (`*.pose.txt` / `cameras.json`) and by global descriptors pooled
+# from the Tiny RoMa coarse features otherwise. Matches are written `chunk_pairs` pairs at a time.
+PAIR_MATCHING = {
+    'top_k': 5,
+    'ranking': 'auto',
+    'chunk_pairs': 64,
+}
+
+# Models loaded in the background once the server has started, so health checks are answered at once
+# and the first requests do not pay the cold start. Other models still load lazily on first use.
+MODEL_WARMUP = {
+    'enabled': True,
+    'models': {
+        'depth_anything': [DEPTH_BASE_MODEL],
+        'tiny_roma': [ROMA_BASE_MODEL],
+    },
+}
+
 if torch.cuda.is_available():
     DEVICE = "cuda"
 elif torch.backends.mps.is_available():
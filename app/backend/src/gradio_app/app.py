@@ -1,5 +1,7 @@
 import gradio as gr
 
+from src.config import MODEL_WARMUP
+from src.model_mangers import registry
 from src.gradio_app.depth_ui import get_depth_ui
 from src.gradio_app.roma_ui import get_roma_ui
 
@@ -9,4 +11,6 @@ with gr.Blocks(title="NeRF-Augmented ViT Training") as demo:
         tiny_roma_tab = get_roma_ui()
 
 if __name__ == "__main__":
+    if MODEL_WARMUP['enabled']:
+        registry.start_warmup()
     demo.launch()
@@ -2,11 +2,11 @@ import io
 from PIL import Image
 import gradio as gr
 
-from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers import registry
 from src.utils.depth_visualizer import depth_to_colormap, colormaps
 from src.config import DEPTH_MODELS, DEPTH_BASE_MODEL
 
-depth_manager = DepthManager()
+depth_manager = registry.get_depth_manager()
 
 
 def _select_model(model_name: str):
@@ -1,14 +1,13 @@
-import os
-import tempfile
 from PIL import Image
 import gradio as gr
 
 from src.config import ROMA_MODELS
 
-from src.model_mangers.roma_manager import RomaManager, RomaPrediction
+from src.model_mangers import registry
+from src.model_mangers.roma_manager import RomaPrediction
 from src.utils.matcher_visualizer import draw_matches
 
-roma_manager = RomaManager()
+roma_manager = registry.get_roma_manager()
 
 
 def _select_model(model_name: str):
@@ -22,22 +21,9 @@ def _apply_k_slider(match_data: RomaPrediction, imgA_data: Image, imgB_data: Ima
 
 
 def _run_feature_matching(imgA: Image, imgB: Image, k: int):
-    path1 = path2 = None
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f1, \
-                tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f2:
-            imgA.save(f1.name, format="JPEG")
-            imgB.save(f2.name, format="JPEG")
-            path1, path2 = f1.name, f2.name
-
-        match_data = roma_manager.predict(path1, path2)
-        output_img = draw_matches(imgA, imgB, match_data, k=k)
-        return match_data, imgA, imgB, output_img
-    finally:
-        if path1 and os.path.exists(path1):
-            os.remove(path1)
-        if path2 and os.path.exists(path2):
-            os.remove(path2)
+    match_data = roma_manager.predict(imgA.convert("RGB"), imgB.convert("RGB"))
+    output_img = draw_matches(imgA, imgB, match_data, k=k)
+    return match_data, imgA, imgB, output_img
 
 
 def get_roma_ui():
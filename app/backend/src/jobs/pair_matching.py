@@ -0,0 +1,207 @@
+"""
+Match the images of a scene to their most likely overlapping neighbours and store the matches on disk.
+
+Instead of all N^2 pairs, every image is matched to its `top_k` best candidates, ranked by
+    poses        distance between camera centres plus viewing-direction difference, from the 7-Scenes
+                 `frame-XXXXXX.pose.txt` files or the NeRF `cameras.json` transforms
+    descriptors  cosine similarity of global descriptors pooled from the Tiny RoMa coarse features (see
+                 `RomaManager.describe`), centred on the scene mean
+Matches, certainties and fundamental matrices go to a chunked `MatchStore` (see src/utils/match_store.py).
+Running the job again on the same store only matches the pairs that are not stored yet.
+
+    python -m src.jobs.pair_matching ../../dataset-preview/fire --store matches/fire --top-k 3
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Literal, Optional, TypedDict
+
+import numpy as np
+
+from src.config import PAIR_MATCHING, ROMA_SAMPLING
+from src.model_mangers.roma_manager import NUM_SAMPLES, RomaManager
+from src.utils.match_store import MatchStore
+from src.utils.precision import CALIBRATION_PATTERNS
+
+Ranking = Literal["auto", "poses", "descriptors"]
+
+
+class PairMatchingReport(TypedDict):
+    images: int
+    ranking: str
+    candidates: int
+    matched: int
+    skipped: int
+    seconds: float
+
+
+def scene_images(scene_dir: Path) -> list[Path]:
+    """
+    Returns the colour frames of a scene, depth maps are skipped.
+    :param scene_dir: Path, the scene directory, searched recursively
+    :return: list[Path], the sorted frame paths
+    """
+    paths = sorted({p for pattern in CALIBRATION_PATTERNS for p in Path(scene_dir).rglob(pattern)})
+    if not paths:
+        raise FileNotFoundError(f"No colour frames found under '{scene_dir}'")
+    return paths
+
+
+def scene_poses(scene_dir: Path, images: list[Path]) -> Optional[np.ndarray]:
+    """
+    Camera-to-world poses of the images, from a `<frame>.pose.txt` next to each image or the `transform_matrix`
+    of its entry in a `cameras.json` of the scene.
+    :param scene_dir: Path, the scene directory
+    :param images: list[Path], the images
+    :return: np.ndarray, (N, 4, 4) poses, None unless every image has one
+    """
+    transforms = {}
+    for cameras in Path(scene_dir).rglob("cameras.json"):
+        for frame in json.loads(cameras.read_text()).get("frames", []):
+            transforms[Path(frame["file_path"]).name] = frame["transform_matrix"]
+
+    poses = []
+    for image in images:
+        pose_path = image.with_name(f"{image.name.split('.')[0]}.pose.txt")
+        if pose_path.is_file():
+            poses.append(np.loadtxt(pose_path).reshape(4, 4))
+        elif image.name in transforms:
+            poses.append(np.asarray(transforms[image.name], dtype=np.float64).reshape(4, 4))
+        else:
+            return None
+    return np.stack(poses)
+
+
+def pose_costs(poses: np.ndarray) -> np.ndarray:
+    """
+    Pairwise cost of matching two views: the distance between their camera centres, relative to the median
+    distance of the scene, plus one minus the cosine between their viewing axes.
+    :param poses: np.ndarray, (N, 4, 4) camera-to-world poses
+    :return: np.ndarray, (N, N) costs, lower is more overlap
+    """
+    centres, axes = poses[:, :3, 3], poses[:, :3, 2]
+    distances = np.linalg.norm(centres[:, None] - centres[None], axis=-1)
+    scale = np.median(distances[distances > 0]) if (distances > 0).any() else 1.0
+    axes = axes / np.linalg.norm(axes, axis=1, keepdims=True)
+    return distances / scale + (1 - axes @ axes.T)
+
+
+def descriptor_costs(descriptors: np.ndarray) -> np.ndarray:
+    """
+    Pairwise cost of matching two views from their global descriptors: one minus the cosine similarity
+    of the descriptors once the mean descriptor of the scene, which every view shares, is removed.
+    :param descriptors: np.ndarray, (N, C) descriptors
+    :return: np.ndarray, (N, N) costs, lower is more similar
+    """
+    centred = descriptors - descriptors.mean(axis=0, keepdims=True)
+    centred /= np.maximum(np.linalg.norm(centred, axis=1, keepdims=True), 1e-12)
+    return 1 - centred @ centred.T
+
+
+def top_k_pairs(costs: np.ndarray, k: int) -> list[tuple[int, int]]:
+    """
+    The k lowest-cost partners of every image, as unordered pairs.
+    :param costs: np.ndarray, (N, N) pairwise costs
+    :param k: int, number of partners per image
+    :return: list[tuple[int, int]], sorted (i, j) pairs with i < j
+    """
+    costs = np.array(costs, dtype=np.float64)
+    np.fill_diagonal(costs, np.inf)
+    k = min(k, len(costs) - 1)
+    pairs = set()
+    for i, row in enumerate(costs):
+        for j in np.argsort(row, kind="stable")[:k]:
+            pairs.add((min(i, int(j)), max(i, int(j))))
+    return sorted(pairs)
+
+
+def match_scene(scene_dir: Path, store_dir: Path, manager: RomaManager, top_k: int = PAIR_MATCHING['top_k'],
+                ranking: Ranking = PAIR_MATCHING['ranking'], chunk_pairs: int = PAIR_MATCHING['chunk_pairs'],
+                model_name: Optional[str] = None,
+                progress: Optional[Callable[[int, int], None]] = None) -> PairMatchingReport:
+    """
+    Match every image of a scene to its top-k candidates and write the matches to a match store.
+    Pairs already in the store are skipped, so an interrupted job resumes where it stopped.
+    :param scene_dir: Path, the scene directory
+    :param store_dir: Path, the match store directory
+    :param manager: RomaManager, the manager running the matches
+    :param top_k: int, number of candidates per image
+    :param ranking: Ranking, 'poses', 'descriptors' or 'auto' (poses when every image has one)
+    :param chunk_pairs: int, number of pairs written per chunk
+    :param model_name: str, name of the model to use, the selected model if None
+    :param progress: callable, called with (matched, pending) after every chunk
+    :return: PairMatchingReport, what was matched
+    """
+    if ranking not in ("auto", "poses", "descriptors"):
+        raise ValueError(f"Unsupported ranking '{ranking}'")
+    started = time.perf_counter()
+    scene_dir = Path(scene_dir)
+    images = scene_images(scene_dir)
+    model_name = model_name or manager.get_spec()["model_name"]
+    # the geometry the matches are verified with, as stored (JSON lists); the time budget does not change results
+    geometry = json.loads(json.dumps({k: v for k, v in manager.geometry_params().items() if k != "time_budget"}))
+    params = {"model_name": model_name, "checkpoint": manager.checkpoint_digest(model_name),
+              "backend": manager.backend(), "precision": manager.precision(model_name), "num_samples": NUM_SAMPLES,
+              "sampling": dict(ROMA_SAMPLING), "geometry": geometry}
+    store = MatchStore(store_dir, [p.relative_to(scene_dir).as_posix() for p in images], params)
+
+    poses = scene_poses(scene_dir, images) if ranking != "descriptors" else None
+    if poses is not None:
+        costs, ranking = pose_costs(poses), "poses"
+    elif ranking == "poses":
+        raise ValueError(f"Not every image under '{scene_dir}' has a pose")
+    else:
+        costs, ranking = descriptor_costs(manager.describe(images, model_name=model_name)), "descriptors"
+
+    candidates = top_k_pairs(costs, top_k)
+    pending = [pair for pair in candidates if pair not in store]
+    by_query: dict[int, list[int]] = {}
+    for i, j in pending:
+        by_query.setdefault(i, []).append(j)
+
+    buffer, matched = [], 0
+    for i, refs in by_query.items():
+        predictions = manager.predict_many(images[i], [images[j] for j in refs], as_numpy=True, model_name=model_name)
+        buffer.extend((i, j, prediction) for j, prediction in zip(refs, predictions))
+        if len(buffer) >= chunk_pairs:
+            store.write(buffer)
+            matched += len(buffer)
+            buffer = []
+            if progress is not None:
+                progress(matched, len(pending))
+    if buffer:
+        store.write(buffer)
+        matched += len(buffer)
+        if progress is not None:
+            progress(matched, len(pending))
+
+    return {
+        "images": len(images),
+        "ranking": ranking,
+        "candidates": len(candidates),
+        "matched": matched,
+        "skipped": len(candidates) - len(pending),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scene", type=Path, help="scene directory")
+    parser.add_argument("--store", type=Path, required=True, help="match store directory")
+    parser.add_argument("--top-k", type=int, default=PAIR_MATCHING['top_k'])
+    parser.add_argument("--ranking", choices=["auto", "poses", "descriptors"], default=PAIR_MATCHING['ranking'])
+    parser.add_argument("--chunk-pairs", type=int, default=PAIR_MATCHING['chunk_pairs'])
+    parser.add_argument("--model", default=None, help="Tiny RoMa model name, the base model if omitted")
+    args = parser.parse_args()
+
+    manager = RomaManager(cache=None)
+    report = match_scene(args.scene, args.store, manager, top_k=args.top_k, ranking=args.ranking,
+                         chunk_pairs=args.chunk_pairs, model_name=args.model,
+                         progress=lambda done, total: print(f"{done}/{total} pairs", flush=True))
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, TypedDict
+
+
+class BatchStats(TypedDict):
+    requests: int
+    batches: int
+    avg_batch_size: float
+    max_batch_size: int
+    max_wait_ms: float
+    avg_wait_ms: float
+    p95_wait_ms: float
+    avg_batch_ms: float
+    throughput_rps: float
+    pending: int
+
+
+def completed(value: Any) -> Future:
+    """
+    Returns a future already resolved with a value.
+    """
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def then(future: Future, fn: Callable[[Any], Any]) -> Future:
+    """
+    Chain a function on the result of a future without waiting for it.
+    fn runs in the thread that resolves `future`, its exceptions (and those of `future`) resolve the returned future.
+    :param future: Future, the future to chain on
+    :param fn: callable(result) -> value
+    :return: Future, resolved with fn(future.result())
+    """
+    chained = Future()
+
+    def done(f: Future) -> None:
+        try:
+            chained.set_result(fn(f.result()))
+        except BaseException as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
+
+
+class _Pending:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Gathers requests that arrive within a short time window into batches.
+    Requests are grouped by a key and every batch only contains requests with the same key,
+    so the batch function can stack them into a single forward pass.
+    """
+
+    def __init__(self,
+                 run_batch: Callable[[Hashable, list], list],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0,
+                 name: str = "micro-batcher",
+                 window: int = 1024,
+                 workers: int = 1):
+        """
+        :param run_batch: callable(key, items) -> results, must return one result per item, in order
+        :param max_batch_size: int, maximum number of requests in a single batch
+        :param max_wait_ms: float, maximum time the oldest request of a group waits for more requests
+        :param name: str, name of the worker thread
+        :param window: int, number of recent requests/batches kept for the latency statistics
+        :param workers: int, number of threads running batches concurrently (one per model replica)
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be non-negative")
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        self._run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._name = name
+        self._num_workers = workers
+
+        self._cond = threading.Condition()
+        self._groups: "OrderedDict[Hashable, list[_Pending]]" = OrderedDict()
+        self._workers: list[threading.Thread] = []
+        self._closed = False
+
+        self._requests = 0
+        self._batches = 0
+        self._first_request_at: float | None = None
+        self._last_done_at: float | None = None
+        self._waits = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._batch_times = deque(maxlen=window)
+
+    def submit(self, key: Hashable, item: Any) -> Future:
+        """
+        Queue an item for batched execution.
+        :param key: Hashable, grouping key, only items with equal keys are batched together
+        :param item: Any, the item passed to the batch function
+        :return: Future, resolved with the result for this item
+        """
+        pending = _Pending(item)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self._name} is closed")
+            if not self._workers:
+                self._workers = [
+                    threading.Thread(target=self._loop, name=f"{self._name}-{i}", daemon=True)
+                    for i in range(self._num_workers)
+                ]
+                for worker in self._workers:
+                    worker.start()
+            if self._first_request_at is None:
+                self._first_request_at = pending.enqueued_at
+            self._groups.setdefault(key, []).append(pending)
+            self._cond.notify()
+        return pending.future
+
+    def close(self) -> None:
+        """
+        Stop the worker threads once all queued requests have been processed.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self) -> BatchStats:
+        """
+        Returns throughput and added-latency statistics over the recent window.
+        :return: BatchStats, a dictionary with the batching statistics
+        """
+        with self._cond:
+            waits = sorted(self._waits)
+            sizes = list(self._batch_sizes)
+            times = list(self._batch_times)
+            elapsed = 0.0
+            if self._first_request_at is not None and self._last_done_at is not None:
+                elapsed = self._last_done_at - self._first_request_at
+            pending = sum(len(group) for group in self._groups.values())
+
+            return {
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "avg_wait_ms": 1000.0 * sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait_ms": 1000.0 * waits[math.ceil(0.95 * len(waits)) - 1] if waits else 0.0,
+                "avg_batch_ms": 1000.0 * sum(times) / len(times) if times else 0.0,
+                "throughput_rps": self._requests / elapsed if elapsed > 0 else 0.0,
+                "pending": pending,
+            }
+
+    def _next_batch(self) -> tuple[Hashable, list[_Pending]] | None:
+        """
+        Blocks until a group is full or its oldest request has waited long enough.
+        Must be called with the condition held.
+        """
+        while True:
+            if not self._groups:
+                if self._closed:
+                    return None
+                self._cond.wait()
+                continue
+
+            now = time.perf_counter()
+            deadline = None
+            for key, group in self._groups.items():
+                due = group[0].enqueued_at + self.max_wait
+                if len(group) >= self.max_batch_size or due <= now or self._closed:
+                    batch = group[:self.max_batch_size]
+                    del group[:self.max_batch_size]
+                    if not group:
+                        del self._groups[key]
+                    return key, batch
+                deadline = due if deadline is None else min(deadline, due)
+
+            self._cond.wait(timeout=deadline - now)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                nxt = self._next_batch()
+            if nxt is None:
+                return
+
+            key, batch = nxt
+            started = time.perf_counter()
+            try:
+                results = self._run_batch(key, [p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} items")
+            except BaseException as e:
+                for p in batch:
+                    p.future.set_exception(e)
+            else:
+                for p, result in zip(batch, results):
+                    p.future.set_result(result)
+            done = time.perf_counter()
+
+            with self._cond:
+                self._requests += len(batch)
+                self._batches += 1
+                self._last_done_at = done
+                self._batch_sizes.append(len(batch))
+                self._batch_times.append(done - started)
+                self._waits.extend(started - p.enqueued_at for p in batch)
@@ -0,0 +1,256 @@
+"""
+Exported and ahead-of-time compiled inference graphs for the served models.
+
+Backends:
+    eager   the PyTorch modules as they are
+    export  a `torch.export` graph per input shape, run as a flat FX graph without the Python module code
+    aoti    the exported graph compiled to native code by AOTInductor
+
+A graph is built for every configured input shape and saved under the cache directory, keyed by the
+sha256 of the checkpoint, the backend, the shape, the device and the torch version, so a warm restart
+only loads it. The compiled graphs replace the forward of the model: inputs of a compiled shape run the
+graph, any other shape (or a call with gradients enabled) falls back to the eager forward.
+"""
+import copy
+import os
+import tempfile
+import threading
+import warnings
+from pathlib import Path
+from typing import Callable, Literal, Optional, TypedDict
+
+import torch
+import torch.nn as nn
+
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+
+Backend = Literal["eager", "export", "aoti"]
+BACKENDS = ("eager", "export", "aoti")
+Shape = tuple[int, int]
+
+
+class CompiledStats(TypedDict):
+    backend: Backend
+    shapes: list[str]
+    failed: dict[str, str]
+    compiled_calls: int
+    eager_calls: int
+
+
+class DepthGraph(nn.Module):
+    """
+    Depth-Anything-V2 forward pass on a (1, 3, H, W) network input.
+    """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return type(self.model).forward(self.model, x)
+
+    @staticmethod
+    def input_shape(h: int, w: int) -> Shape:
+        return DepthAnythingV2.input_shape(h, w)
+
+    @staticmethod
+    def example_inputs(shape: Shape, device) -> tuple:
+        return (torch.zeros(1, 3, *shape, device=device),)
+
+    @staticmethod
+    def inputs(x) -> Optional[tuple]:
+        return (x,) if isinstance(x, torch.Tensor) and x.dim() == 4 and x.shape[0] == 1 else None
+
+    @staticmethod
+    def outputs(depth):
+        return depth
+
+
+class RomaGraph(nn.Module):
+    """
+    Tiny RoMa forward pass on two (1, 3, H, W) images of the same size, returning the finest flow and certainty.
+    """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, im_A, im_B):
+        corresps = type(self.model).forward(self.model, {"im_A": im_A, "im_B": im_B})
+        return corresps[4]["flow"], corresps[4]["certainty"]
+
+    @staticmethod
+    def input_shape(h: int, w: int) -> Shape:
+        return h, w
+
+    @staticmethod
+    def example_inputs(shape: Shape, device) -> tuple:
+        return torch.zeros(1, 3, *shape, device=device), torch.zeros(1, 3, *shape, device=device)
+
+    @staticmethod
+    def inputs(batch) -> Optional[tuple]:
+        im_A, im_B = batch.get("im_A"), batch.get("im_B")
+        if im_A is None or im_B is None or im_A.shape != im_B.shape or im_A.shape[0] != 1:
+            return None
+        return im_A, im_B
+
+    @staticmethod
+    def outputs(result) -> dict:
+        flow, certainty = result
+        return {4: {"flow": flow, "certainty": certainty}}
+
+
+GRAPHS = {"depth_anything": DepthGraph, "tiny_roma": RomaGraph}
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compiled = 0
+        self.eager = 0
+
+
+class CompiledForward:
+    """
+    Stands in for the forward of a model, dispatching on the input shape to a compiled graph or to the
+    eager forward. Replicas of the model (deep copies) share the graphs, except AOTInductor graphs,
+    which are loaded once per replica so that replicas run concurrently.
+    """
+
+    def __init__(self, eager: Callable, graph_cls: type, backend: Backend, paths: dict[Shape, Path],
+                 graphs: dict[Shape, Callable], failed: dict[str, str], counters: Optional[_Counters] = None):
+        self._eager = eager
+        self._graph_cls = graph_cls
+        self._backend = backend
+        self._paths = paths
+        self._graphs = graphs
+        self._failed = failed
+        self._counters = counters or _Counters()
+
+    def __call__(self, *args, **kwargs):
+        inputs = None if kwargs or torch.is_grad_enabled() else self._graph_cls.inputs(*args)
+        graph = None
+        if inputs is not None and all(x.dtype == torch.float32 for x in inputs):
+            graph = self._graphs.get(tuple(inputs[0].shape[-2:]))
+        with self._counters.lock:
+            if graph is None:
+                self._counters.eager += 1
+            else:
+                self._counters.compiled += 1
+        if graph is None:
+            return self._eager(*args, **kwargs)
+        return self._graph_cls.outputs(graph(*inputs))
+
+    def __deepcopy__(self, memo):
+        graphs = self._graphs
+        if self._backend == "aoti":
+            graphs = {shape: _load(path, self._backend) for shape, path in self._paths.items()}
+        return CompiledForward(copy.deepcopy(self._eager, memo), self._graph_cls, self._backend, self._paths,
+                               graphs, self._failed, self._counters)
+
+    def stats(self) -> CompiledStats:
+        with self._counters.lock:
+            return {
+                "backend": self._backend,
+                "shapes": [f"{h}x{w}" for h, w in self._graphs],
+                "failed": dict(self._failed),
+                "compiled_calls": self._counters.compiled,
+                "eager_calls": self._counters.eager,
+            }
+
+
+def artifact_path(cache_dir: Path, model_type: str, digest: str, backend: Backend, shape: Shape, device) -> Path:
+    """
+    Returns the file a compiled graph is cached in.
+    :param cache_dir: Path, the cache directory
+    :param model_type: str, the type of model
+    :param digest: str, sha256 of the checkpoint the graph was built from
+    :param backend: Backend, 'export' or 'aoti'
+    :param shape: Shape, the (h, w) input shape
+    :param device: str or torch.device, the device the graph runs on
+    :return: Path, the cached graph
+    """
+    version = torch.__version__.split("+")[0]
+    name = f"{model_type}-{digest[:16]}-{backend}-{shape[0]}x{shape[1]}-{torch.device(device).type}-torch{version}.pt2"
+    return Path(cache_dir) / name
+
+
+def _load(path: Path, backend: Backend) -> Callable:
+    if backend == "export":
+        return torch.export.load(path).module()
+    return torch._inductor.aoti_load_package(str(path))
+
+
+def _build(graph: nn.Module, inputs: tuple, path: Path, backend: Backend) -> None:
+    """
+    Export the graph for one input shape and write the artifact atomically.
+    """
+    with torch.no_grad():
+        program = torch.export.export(graph, inputs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".pt2")
+    os.close(fd)
+    try:
+        if backend == "export":
+            torch.export.save(program, tmp)
+        else:
+            torch._inductor.aoti_compile_and_package(program, package_path=tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def compile_model(model: nn.Module, model_type: str, digest: str, backend: Backend, sizes: list[Shape],
+                  cache_dir: Path) -> nn.Module:
+    """
+    Build or load the compiled graphs of a model and install them in front of its eager forward.
+    Only float32 models are compiled, other precision modes keep the eager forward.
+    A shape that fails to compile is reported in the stats and runs eagerly.
+    :param model: nn.Module, a Depth-Anything-V2 or Tiny RoMa model in eval mode on its device
+    :param model_type: str, 'depth_anything' or 'tiny_roma'
+    :param digest: str, sha256 of the checkpoint the model was loaded from
+    :param backend: Backend, one of BACKENDS
+    :param sizes: list[Shape], image (h, w) sizes to compile for
+    :param cache_dir: Path, where compiled graphs are cached
+    :return: nn.Module, the model
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported inference backend '{backend}', expected one of {BACKENDS}")
+    if backend == "eager":
+        return model
+    precision = getattr(model, "inference_precision", "fp32")
+    if precision != "fp32":
+        warnings.warn(f"The {backend} backend only compiles fp32 models, running the {precision} model eagerly")
+        return model
+
+    graph_cls = GRAPHS[model_type]
+    graph = graph_cls(model).eval()
+    device = next(model.parameters()).device
+    paths, graphs, failed = {}, {}, {}
+    for h, w in sizes:
+        shape = graph_cls.input_shape(h, w)
+        if shape in graphs:
+            continue
+        path = artifact_path(cache_dir, model_type, digest, backend, shape, device)
+        try:
+            if not path.is_file():
+                _build(graph, graph_cls.example_inputs(shape, device), path, backend)
+            graphs[shape] = _load(path, backend)
+            paths[shape] = path
+        except Exception as e:
+            failed[f"{shape[0]}x{shape[1]}"] = str(e)
+            warnings.warn(f"Cannot compile {model_type} for input shape {shape} with the {backend} backend: {e}")
+
+    model.forward = CompiledForward(model.forward, graph_cls, backend, paths, graphs, failed)
+    return model
+
+
+def compiled_stats(model: nn.Module) -> Optional[CompiledStats]:
+    """
+    Returns the compiled graphs of a model and how many calls they served, None for eager models.
+    :param model: nn.Module, the model
+    :return: CompiledStats, the statistics
+    """
+    forward = model.__dict__.get("forward")
+    return forward.stats() if isinstance(forward, CompiledForward) else None
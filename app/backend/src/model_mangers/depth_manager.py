@@ -1,24 +1,51 @@
 from abc import ABC
+from concurrent.futures import Future
+from functools import partial
 
 import cv2
 import numpy as np
 import torch
 
-from src.config import DEPTH_BASE_MODEL, DEVICE, DEPTH_MODELS
+from src.config import (
+    DEPTH_BASE_MODEL, DEVICE, DEPTH_MODELS, DEPTH_BATCHING, DEPTH_POOL_BUDGET_BYTES, DEPTH_EXECUTION, RESULT_CACHE,
+    DEPTH_TILING, PRECISION, INFERENCE_BACKEND
+)
+from src.model_mangers.batching import MicroBatcher, completed, then
 from src.model_mangers.model_manager import ModelManager
+from src.model_mangers.result_cache import cache_key, image_digest
 from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+from src.utils.artifact_store import artifact_store
+from src.utils.depth_tiling import infer_tiled
+from src.utils.metrics import timed
+from src.utils.precision import apply_precision, calibration_frames, check_precision
 
 
 class DepthManager(ModelManager, ABC):
-    def __init__(self, base_model: str = DEPTH_BASE_MODEL):
-        super().__init__("depth_anything", base_model)
+    def __init__(self, base_model: str = DEPTH_BASE_MODEL, batching: dict = DEPTH_BATCHING,
+                 budget_bytes: int = DEPTH_POOL_BUDGET_BYTES, replicas: int = DEPTH_EXECUTION['replicas'],
+                 cache: dict | None = RESULT_CACHE, tiling: dict = DEPTH_TILING,
+                 backend: dict = INFERENCE_BACKEND):
+        super().__init__("depth_anything", base_model, budget_bytes, replicas=replicas, device=DEVICE, cache=cache,
+                         backend=backend)
+        self._tiling = dict(tiling)
+        self._batcher = None
+        if batching.get('enabled', False):
+            self._batcher = MicroBatcher(
+                self._run_batch,
+                max_batch_size=batching.get('max_batch_size', 8),
+                max_wait_ms=batching.get('max_wait_ms', 10),
+                name="depth-batcher",
+                workers=self.replicas,
+            )
 
-    def _load_model(self, model_name: str, device=DEVICE):
+    def _load_model(self, model_name: str, device=DEVICE, precision: str | None = None) -> DepthAnythingV2:
         """
-        Load the specified Depth-Anything-V2 model and its configuration.
+        Build the specified Depth-Anything-V2 model, load its checkpoint and convert it to the precision
+        of its entry (see `src/utils/precision.py`).
         :param model_name: str, name of the model to load
         :param device: str, device to run the model on (default: DEVICE)
-        :return: None
+        :param precision: str, precision mode overriding the one of the model entry
+        :return: DepthAnythingV2, the loaded model
         """
         cfgs = {
             'vits': {'encoder': 'vits', 'features': 64, 'out_channels': [48, 96, 192, 384]},
@@ -34,35 +61,139 @@ class DepthManager(ModelManager, ABC):
         if encoder not in cfgs:
             raise ValueError(f"Unsupported encoder type: {encoder}")
 
-        if self._current_model is None:
-            self._current_model = DepthAnythingV2(**cfgs[encoder])
-        else:
-            current_encoder = DEPTH_MODELS[self._current_spec['model_name']]['encoder']
-            if encoder != current_encoder:
-                self._current_model = DepthAnythingV2(**cfgs[encoder])
+        precision = check_precision(precision or self.precision(model_name), device)
+        ckpt = artifact_store.resolve(DEPTH_MODELS[model_name])
+        model = DepthAnythingV2(**cfgs[encoder])
+        state_dict = torch.load(ckpt, map_location=device)
+        model.load_state_dict(state_dict)
+        model = apply_precision(model.to(device).eval(), precision, calibrate=DepthManager.calibrate)
+        return self._compile(model, ckpt)
 
-        ckpt = DEPTH_MODELS[model_name]['checkpoint']
-        if not ckpt.is_file():
-            raise ValueError(f"Checkpoint '{ckpt}' not found")
+    @staticmethod
+    def precision(model_name: str) -> str:
+        """
+        Returns the precision mode of a model entry.
+        :param model_name: str, name of the model
+        :return: str, the 'precision' of its DEPTH_MODELS entry, PRECISION['default'] if it has none
+        """
+        return DEPTH_MODELS.get(model_name, {}).get('precision', PRECISION['default'])
 
-        state_dict = torch.load(ckpt, map_location=device)
-        self._current_model.load_state_dict(state_dict)
+    @staticmethod
+    def calibrate(model: DepthAnythingV2, frames: list[np.ndarray] | None = None) -> None:
+        """
+        Run calibration frames through a model prepared for int8_static quantization.
+        :param model: DepthAnythingV2, the model with its observers inserted
+        :param frames: list[np.ndarray], BGR frames, `calibration_frames()` if None
+        """
+        for frame in frames if frames is not None else calibration_frames():
+            model.infer_image(frame)
+
+    @staticmethod
+    def checkpoint_digest(model_name: str) -> str:
+        """
+        Content hash of the checkpoint of a model entry. Result cache keys include it, so results cached
+        on disk are not served after a checkpoint is replaced under the same model name.
+        :param model_name: str, name of the model
+        :return: str, the sha256 hex digest of the checkpoint file (see `ArtifactStore.digest`)
+        """
+        if model_name not in DEPTH_MODELS:
+            raise ValueError(f"Model '{model_name}' not found in DEPTH_MODELS")
+        return artifact_store.digest(artifact_store.resolve(DEPTH_MODELS[model_name], verify=False))
 
-    def predict(self, image_bytes: bytes, normalize: bool = True, device=DEVICE):
+    def predict(self, image_bytes: bytes, normalize: bool = True, device=DEVICE, model_name: str | None = None,
+                tiled: bool | None = None):
         """
         Predict the depth map from the input image bytes.
+        Results are cached by image content, model and parameters; cache hits never touch the model.
+        When batching is enabled, concurrent requests for the same model whose images resize to the
+        same network input shape are gathered and run through a single forward pass.
+        Tiled predictions run the network on overlapping tiles at native resolution (see `infer_tiled`)
+        and bypass the micro-batcher.
         :param image_bytes: bytes, raw image data
         :param normalize: bool, whether to normalize the depth map
         :param device: str, device to run the model on (default: DEVICE)
+        :param model_name: str, name of the model to use, the selected model if None
+        :param tiled: bool, whether to use tiled inference, decided from the image size and DEPTH_TILING if None
         :return: np.ndarray, depth map
         """
-        with self._lock:
-            img = DepthManager.__preprocess(image_bytes)
-            with torch.no_grad():
-                depth = self._current_model.infer_image(img)
-                if isinstance(depth, torch.Tensor):
-                    depth = depth.cpu().numpy()
-            return DepthManager.__postprocess(depth) if normalize else depth
+        return self.submit(image_bytes, normalize=normalize, device=device, model_name=model_name,
+                           tiled=tiled).result()
+
+    def submit(self, image_bytes: bytes, normalize: bool = True, device=DEVICE, model_name: str | None = None,
+               tiled: bool | None = None) -> Future:
+        """
+        Decode an image and hand it to the micro-batcher without waiting for its batch, see `predict`.
+        The caller's thread is free as soon as the image is queued, so the number of threads submitting
+        requests does not limit the size of the batches. Cache hits, tiled predictions and predictions
+        without batching run in the caller's thread and the returned future is already resolved.
+        :param image_bytes: bytes, raw image data
+        :param normalize: bool, whether to normalize the depth map
+        :param device: str, device to run the model on (default: DEVICE)
+        :param model_name: str, name of the model to use, the selected model if None
+        :param tiled: bool, whether to use tiled inference, decided from the image size and DEPTH_TILING if None
+        :return: Future, resolved with the np.ndarray depth map
+        """
+        model_name = self._resolve(model_name)
+        img = None
+        if tiled is None and self._tiling['auto']:
+            with timed("depth_manager", "decode"):
+                img = DepthManager.__preprocess(image_bytes)
+            tiled = max(img.shape[:2]) >= self._tiling['auto_min_side']
+
+        result_key = None
+        if self._cache is not None:
+            tiling = (self._tiling['tile_size'], self._tiling['overlap'], self._tiling['max_side']) if tiled else None
+            result_key = cache_key("depth", model_name, self.checkpoint_digest(model_name), self.backend(),
+                                   self.precision(model_name), normalize, tiling, image_digest(image_bytes))
+            cached = self._cache.get(result_key)
+            if cached is not None:
+                return completed(cached["depth"])
+
+        if img is None:
+            with timed("depth_manager", "decode"):
+                img = DepthManager.__preprocess(image_bytes)
+        finish = partial(self.__finish, normalize=normalize, result_key=result_key)
+        if tiled:
+            with timed("depth_manager", "inference"):
+                with self.checkout(model_name) as model:
+                    depth = infer_tiled(
+                        model, img,
+                        tile_size=self._tiling['tile_size'],
+                        overlap=self._tiling['overlap'],
+                        memory_cap_bytes=self._tiling['memory_cap_bytes'],
+                        max_side=self._tiling['max_side'],
+                    )
+            return completed(finish(depth))
+        if self._batcher is None:
+            with timed("depth_manager", "inference"):
+                with self.checkout(model_name) as model:
+                    with torch.no_grad():
+                        depth = model.infer_image(img)
+            return completed(finish(depth))
+
+        key = (model_name, DepthAnythingV2.input_shape(*img.shape[:2]))
+        return then(self._batcher.submit(key, img), finish)
+
+    def get_stats(self) -> dict:
+        """
+        Returns the manager statistics, including the micro-batching throughput and added latency.
+        :return: dict, statistics of the manager
+        """
+        stats = super().get_stats()
+        stats["batching"] = self._batcher.stats() if self._batcher is not None else None
+        return stats
+
+    def _run_batch(self, key: tuple[str, tuple[int, int]], images: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Run one forward pass over a group of images sharing the same model and network input shape.
+        :param key: tuple[str, tuple[int, int]], the model name and the shared network input shape
+        :param images: list[np.ndarray], decoded BGR images
+        :return: list[np.ndarray], one depth map per image at its original resolution
+        """
+        with timed("depth_manager", "inference"), self.checkout(key[0]) as model:
+            if len(images) == 1:
+                return [model.infer_image(images[0])]
+            return model.infer_batch(images)
 
     @staticmethod
     def __preprocess(image_bytes: bytes) -> np.ndarray:
@@ -77,6 +208,23 @@ class DepthManager(ModelManager, ABC):
             raise ValueError("Cannot decode image")
         return img
 
+    def __finish(self, depth, normalize: bool, result_key: str | None) -> np.ndarray:
+        """
+        Convert the output of the network to a depth map, normalized if requested, and cache it.
+        :param depth: np.ndarray or torch.Tensor, raw depth map
+        :param normalize: bool, whether to normalize the depth map
+        :param result_key: str, the result cache key, None when caching is disabled
+        :return: np.ndarray, depth map
+        """
+        if isinstance(depth, torch.Tensor):
+            depth = depth.cpu().numpy()
+        if normalize:
+            with timed("depth_manager", "normalize"):
+                depth = DepthManager.__postprocess(depth)
+        if result_key is not None:
+            self._cache.put(result_key, {"depth": depth})
+        return depth
+
     @staticmethod
     def __postprocess(depth: np.ndarray) -> np.ndarray:
         """
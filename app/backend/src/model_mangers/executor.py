@@ -0,0 +1,213 @@
+import asyncio
+import copy
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypedDict
+
+import torch
+
+from src.config import DEPTH_EXECUTION, DEVICE, ROMA_EXECUTION
+from src.utils.metrics import observe_lock_wait, record_peak_memory, reset_peak_memory
+
+
+_threads_lock = threading.Lock()
+_threads_configured = False
+
+
+def cpu_threads() -> Optional[int]:
+    """
+    Returns the intra-op thread count of every CPU replica: the cores split between the replicas of all managers.
+    :return: Optional[int], threads per replica, None when every manager runs a single replica (torch's default)
+    """
+    replicas = (DEPTH_EXECUTION['replicas'], ROMA_EXECUTION['replicas'])
+    if DEVICE != "cpu" or max(replicas) <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // sum(replicas))
+
+
+def configure_threads() -> None:
+    """
+    Set the torch thread count from `cpu_threads`, once per process.
+    The thread count of torch is process-global, so it is derived from the replicas of all managers
+    at startup instead of by each manager.
+    """
+    global _threads_configured
+    with _threads_lock:
+        if _threads_configured:
+            return
+        threads = cpu_threads()
+        if threads is not None:
+            torch.set_num_threads(threads)
+        _threads_configured = True
+
+
+class ReplicaStats(TypedDict):
+    replicas: int
+    in_use: int
+    waiting: int
+    utilization: list[float]
+    busy_seconds: list[float]
+
+
+class ExecutorStats(TypedDict):
+    workers: int
+    queued: int
+    running: int
+    completed: int
+
+
+class ReplicaSet:
+    """
+    Holds N independent copies of a model. Each copy is used by at most one thread at a time,
+    so up to N inferences run concurrently instead of serializing on a single lock.
+    """
+
+    def __init__(self, model, replicas: int = 1, name: str = "model"):
+        """
+        :param model: the loaded model, used as the first replica
+        :param replicas: int, total number of copies to keep
+        :param name: str, name of the model in the metrics
+        """
+        if replicas < 1:
+            raise ValueError("replicas must be at least 1")
+        self.name = name
+        self.models = [model] + [copy.deepcopy(model) for _ in range(replicas - 1)]
+        self._devices = [self._device(m) for m in self.models]
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for i in range(replicas):
+            self._free.put(i)
+
+        self._stats_lock = threading.Lock()
+        self._created_at = time.perf_counter()
+        self._busy = [0.0] * replicas
+        self._busy_since: list[float | None] = [None] * replicas
+        self._waiting = 0
+
+    @property
+    def primary(self):
+        return self.models[0]
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """
+        Check out a free replica, blocking until one is available.
+        :return: the checked out model
+        """
+        with self._stats_lock:
+            self._waiting += 1
+        requested = time.perf_counter()
+        try:
+            idx = self._free.get()
+        finally:
+            with self._stats_lock:
+                self._waiting -= 1
+
+        started = time.perf_counter()
+        observe_lock_wait(self.name, started - requested)
+        with self._stats_lock:
+            self._busy_since[idx] = started
+        device = self._devices[idx]
+        reset_peak_memory(device)
+        try:
+            yield self.models[idx]
+        finally:
+            record_peak_memory(self.name, device)
+            with self._stats_lock:
+                self._busy[idx] += time.perf_counter() - started
+                self._busy_since[idx] = None
+            self._free.put(idx)
+
+    def stats(self) -> ReplicaStats:
+        """
+        Returns how many replicas are in use, how many callers wait for one and the per-replica utilization.
+        :return: ReplicaStats, a dictionary containing the replica statistics
+        """
+        now = time.perf_counter()
+        with self._stats_lock:
+            busy = [
+                b + (now - since if since is not None else 0.0)
+                for b, since in zip(self._busy, self._busy_since)
+            ]
+            elapsed = max(now - self._created_at, 1e-9)
+            return {
+                "replicas": len(self.models),
+                "in_use": sum(since is not None for since in self._busy_since),
+                "waiting": self._waiting,
+                "utilization": [b / elapsed for b in busy],
+                "busy_seconds": busy,
+            }
+
+    @staticmethod
+    def _device(model) -> torch.device:
+        param = next(model.parameters(), None) if isinstance(model, torch.nn.Module) else None
+        return param.device if param is not None else torch.device("cpu")
+
+
+class InferenceExecutor:
+    """
+    Thread pool that runs blocking inference off the event loop.
+    Routes await the returned futures so the server keeps accepting uploads while models run.
+    """
+
+    def __init__(self, name: str, workers: int = 1):
+        """
+        :param name: str, prefix of the worker thread names
+        :param workers: int, number of worker threads
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) on the pool.
+        :return: Future, resolved with the return value of fn
+        """
+        with self._lock:
+            self._queued += 1
+        return self._pool.submit(self._run, fn, args, kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on the pool and await its result without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> ExecutorStats:
+        """
+        Returns the number of queued, running and completed calls.
+        :return: ExecutorStats, a dictionary containing the executor statistics
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
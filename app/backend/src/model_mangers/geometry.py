@@ -0,0 +1,207 @@
+"""
+Robust geometry stage of Tiny RoMa: verifies sampled matches with a RANSAC estimator on a pool of worker processes,
+so model replicas are released before verification starts and the next request does not wait behind it.
+
+Estimators, chosen per request:
+    F     fundamental matrix (USAC MAGSAC)
+    E     essential matrix from the intrinsics of both images, returned as F = K_B^-T E K_A^-1 as well
+    H     homography
+    none  no verification, every sampled match is kept
+The worker processes only import numpy and OpenCV.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from typing import Literal, Mapping, Optional, TypedDict
+
+import cv2
+import numpy as np
+
+Estimator = Literal["F", "E", "H", "none"]
+ESTIMATORS = ("F", "E", "H", "none")
+GeometryStatus = Literal["ok", "failed", "timeout", "skipped"]
+
+
+class GeometryParams(TypedDict):
+    estimator: Estimator
+    threshold: float
+    confidence: float
+    max_iters: int
+    time_budget: Optional[float]
+    intrinsics: Optional[tuple[tuple[tuple[float, ...], ...], tuple[tuple[float, ...], ...]]]
+
+
+class GeometryReport(TypedDict):
+    estimator: str
+    status: GeometryStatus
+    matrix: Optional[list[list[float]]]
+    inliers: int
+    seconds: float
+
+
+def resolve_geometry(defaults: Mapping, overrides: Optional[Mapping] = None) -> GeometryParams:
+    """
+    Validate the geometry parameters of a request on top of the defaults.
+    :param defaults: Mapping, the default parameters (ROMA_GEOMETRY['default'])
+    :param overrides: Mapping, parameters of the request, None keeps the defaults
+    :return: GeometryParams, the validated parameters, intrinsics as nested tuples
+    """
+    unknown = set(overrides or {}) - set(GeometryParams.__annotations__)
+    if unknown:
+        raise ValueError(f"Unknown geometry parameter(s): {', '.join(sorted(unknown))}")
+    params = {"intrinsics": None, "time_budget": None, **defaults, **{k: v for k, v in (overrides or {}).items()
+                                                                      if v is not None}}
+    if params["estimator"] not in ESTIMATORS:
+        raise ValueError(f"Unsupported estimator '{params['estimator']}', expected one of {', '.join(ESTIMATORS)}")
+    if not 0 < params["confidence"] < 1:
+        raise ValueError("confidence must be in (0, 1)")
+    if params["max_iters"] < 1:
+        raise ValueError("max_iters must be at least 1")
+    if params["threshold"] <= 0:
+        raise ValueError("threshold must be positive")
+    if params["time_budget"] is not None and params["time_budget"] <= 0:
+        raise ValueError("time_budget must be positive")
+
+    intrinsics = params["intrinsics"]
+    if intrinsics is not None:
+        intrinsics = np.asarray(intrinsics, dtype=np.float64)
+        if intrinsics.shape != (2, 3, 3):
+            raise ValueError("intrinsics must be the two 3x3 camera matrices of image A and image B")
+        intrinsics = tuple(tuple(tuple(float(v) for v in row) for row in K) for K in intrinsics)
+    elif params["estimator"] == "E":
+        raise ValueError("The essential matrix needs the intrinsics of both images")
+    return {
+        "estimator": params["estimator"],
+        "threshold": float(params["threshold"]),
+        "confidence": float(params["confidence"]),
+        "max_iters": int(params["max_iters"]),
+        "time_budget": None if params["time_budget"] is None else float(params["time_budget"]),
+        "intrinsics": intrinsics if params["estimator"] == "E" else None,
+    }
+
+
+def estimate_geometry(kptsA: np.ndarray, kptsB: np.ndarray,
+                      params: GeometryParams) -> tuple[Optional[np.ndarray], Optional[np.ndarray], np.ndarray, float]:
+    """
+    Fit the estimator of the parameters to pixel matches. Runs in the worker processes.
+    :param kptsA: np.ndarray, (N, 2) pixel coordinates in image A
+    :param kptsB: np.ndarray, (N, 2) pixel coordinates in image B
+    :param params: GeometryParams, the parameters
+    :return: tuple, (the estimated matrix, the fundamental matrix, the boolean inlier mask, seconds);
+        matrices are None when the estimator failed, the fundamental one too for H and none
+    """
+    started = time.perf_counter()
+    estimator = params["estimator"]
+    if estimator == "none":
+        return None, None, np.ones(len(kptsA), dtype=bool), time.perf_counter() - started
+
+    matrix, F, mask = None, None, None
+    if len(kptsA) >= (4 if estimator == "H" else 8):
+        if estimator == "F":
+            matrix, mask = cv2.findFundamentalMat(kptsA, kptsB, method=cv2.USAC_MAGSAC,
+                                                  ransacReprojThreshold=params["threshold"],
+                                                  confidence=params["confidence"], maxIters=params["max_iters"])
+            F = matrix
+        elif estimator == "H":
+            matrix, mask = cv2.findHomography(kptsA, kptsB, method=cv2.USAC_MAGSAC,
+                                              ransacReprojThreshold=params["threshold"],
+                                              maxIters=params["max_iters"], confidence=params["confidence"])
+        else:
+            K_A, K_B = (np.asarray(K, dtype=np.float64) for K in params["intrinsics"])
+            # normalized camera coordinates, the pixel threshold is scaled by the mean focal length
+            normA = cv2.undistortPoints(kptsA.reshape(-1, 1, 2).astype(np.float64), K_A, None).reshape(-1, 2)
+            normB = cv2.undistortPoints(kptsB.reshape(-1, 1, 2).astype(np.float64), K_B, None).reshape(-1, 2)
+            focal = (K_A[0, 0] + K_A[1, 1] + K_B[0, 0] + K_B[1, 1]) / 4
+            matrix, mask = cv2.findEssentialMat(normA, normB, focal=1.0, pp=(0.0, 0.0), method=cv2.USAC_MAGSAC,
+                                                prob=params["confidence"], threshold=params["threshold"] / focal,
+                                                maxIters=params["max_iters"])
+            if matrix is not None:
+                # several solutions are stacked vertically, keep the first
+                matrix = matrix[:3]
+                F = np.linalg.inv(K_B).T @ matrix @ np.linalg.inv(K_A)
+                F = F / F[2, 2] if abs(F[2, 2]) > 1e-12 else F
+    if matrix is None or matrix.shape != (3, 3):
+        matrix, F, mask = None, None, None
+    inliers = mask.ravel() == 1 if mask is not None else np.zeros(len(kptsA), dtype=bool)
+    return matrix, F, inliers, time.perf_counter() - started
+
+
+def _init_worker():
+    # parallelism comes from the worker processes, not from OpenCV threads inside each of them
+    cv2.setNumThreads(1)
+
+
+class GeometryPool:
+    """
+    Pool of worker processes running `estimate_geometry`. The pool is started on first use, with `workers=0`
+    the estimation runs on the calling thread instead.
+    """
+
+    def __init__(self, workers: int = 2):
+        """
+        :param workers: int, number of worker processes, 0 to estimate on the calling thread
+        """
+        if workers < 0:
+            raise ValueError("workers must not be negative")
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        Start the worker processes without waiting for them, so the first request does not pay their startup.
+        """
+        if self.workers == 0:
+            return
+        with self._lock:
+            pool = self._ensure_pool()
+            for _ in range(self.workers):
+                pool.submit(_init_worker)
+
+    def submit(self, kptsA: np.ndarray, kptsB: np.ndarray, params: GeometryParams) -> Future:
+        """
+        Schedule the estimation of a pair.
+        :return: Future, resolved with the return value of `estimate_geometry`
+        """
+        if self.workers == 0 or params["estimator"] == "none":
+            future = Future()
+            try:
+                future.set_result(estimate_geometry(kptsA, kptsB, params))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._lock:
+            return self._ensure_pool().submit(estimate_geometry, kptsA, kptsB, params)
+
+    @staticmethod
+    def result(future: Future, params: GeometryParams, submitted: float):
+        """
+        Wait for a scheduled estimation within the time budget of its request.
+        An estimation still queued when the budget runs out is cancelled, one already running finishes in the
+        background at most `max_iters` later and its result is dropped.
+        :param future: Future, returned by `submit`
+        :param params: GeometryParams, the parameters of the request
+        :param submitted: float, `time.perf_counter()` when the estimation was submitted
+        :return: the return value of `estimate_geometry`, None when the budget ran out
+        """
+        budget = params["time_budget"]
+        timeout = None if budget is None else max(0.0, budget - (time.perf_counter() - submitted))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            return None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        # must hold the lock; spawned workers do not inherit the threads and CUDA state of the server process
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
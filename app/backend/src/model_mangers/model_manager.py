@@ -1,60 +1,289 @@
 import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Literal, TypedDict, Optional, cast
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Literal, TypedDict, Optional, Iterator, cast
+
+import torch
+
+from src.model_mangers.compiled import compile_model, compiled_stats
+from src.model_mangers.executor import ReplicaSet
+from src.model_mangers.result_cache import ResultCache
+from src.utils.artifact_store import artifact_store
+from src.utils.metrics import memory_high_watermark, reset_memory_high_watermark
+from src.utils.precision import precision_context
 
 ModelType = Literal["depth_anything", "tiny_roma"]
 
 class Spec(TypedDict):
     model_name: Optional[str]
 
+class PoolStats(TypedDict):
+    resident: dict[str, int]
+    replicas: dict[str, dict]
+    resident_bytes: int
+    budget_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+class ColdStart(TypedDict):
+    seconds: float
+    weights_bytes: int
+    peak_memory_bytes: Optional[int]
+    device: str
+
+
+def model_nbytes(model: torch.nn.Module) -> int:
+    """
+    Returns the memory held by the parameters and buffers of a model, including the packed
+    weights of quantized layers, which are neither parameters nor buffers.
+    :param model: torch.nn.Module, the model
+    :return: int, size in bytes
+    """
+    tensors = {}
+    values = list(model.parameters()) + list(model.buffers()) + list(model.state_dict(keep_vars=True).values())
+    while values:
+        t = values.pop()
+        if isinstance(t, (tuple, list)):
+            values.extend(t)
+        elif isinstance(t, torch.Tensor) and t.numel() > 0:
+            tensors[t.data_ptr()] = t.numel() * t.element_size()
+    return sum(tensors.values())
+
+
 class ModelManager(ABC):
-    def __init__(self, model_type: ModelType, base_model: str):
+    """
+    Keeps several models resident under a byte budget and evicts the least recently used one
+    when a newly loaded model does not fit. Every prediction may name the model it wants,
+    the selected model is only the default used when a request does not name one.
+    Each resident model is held as `replicas` independent copies, so up to that many
+    predictions on the same model run concurrently.
+    Models are loaded lazily: constructing a manager only records the base model as the default,
+    it is loaded by the first prediction (or by `get_model`, e.g. from a background warmup).
+    Loaded models may run behind a compiled inference backend (see `src/model_mangers/compiled.py`).
+    """
+
+    def __init__(self, model_type: ModelType, base_model: str, budget_bytes: int, replicas: int = 1,
+                 device: str = "cpu", cache: Optional[dict] = None, backend: Optional[dict] = None):
         self.model_type = model_type
-        self._lock = threading.RLock()
-        self._current_model = None
-        self._current_spec: Spec = {'model_name': None}
+        self.replicas = replicas
+        self.device = device
+        self._backend = dict(backend) if backend is not None else {'backend': 'eager'}
+        self._pool_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._pool: "OrderedDict[str, tuple[ReplicaSet, int]]" = OrderedDict()
+        self._budget_bytes = budget_bytes
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._cold_starts: dict[str, ColdStart] = {}
+        self._current_spec: Spec = {'model_name': base_model}
 
-        self.select_model(base_model)
+        self._cache = None
+        if cache is not None and cache.get('enabled', False):
+            disk_dir = cache.get('disk_dir')
+            self._cache = ResultCache(
+                max_bytes=cache.get('max_bytes', 256 * 1024 ** 2),
+                disk_dir=disk_dir / model_type if disk_dir is not None else None,
+                disk_max_bytes=cache.get('disk_max_bytes'),
+            )
 
     def select_model(self, model_name: str) -> Spec:
         """
-        Selects a model by its name and updates the current model and specification.
+        Selects the default model by its name, loading it into the pool if it is not resident.
         :param model_name: str, name of the model to select
         :return: Spec, a dictionary containing the model specification
         """
-        with self._lock:
-            self._load_model(model_name)
+        self.get_model(model_name)
+        with self._pool_lock:
             self._current_spec = cast(Spec, {'model_name': model_name})
-        return self._current_spec.copy()
+            return self._current_spec.copy()
+
+    def get_model(self, model_name: Optional[str] = None):
+        """
+        Returns a resident model, loading it (and evicting least recently used models) on a miss.
+        The returned model is the first replica and is not reserved for the caller, use `checkout`
+        to run inference.
+        :param model_name: str, name of the model, the selected model if None
+        :return: the model
+        """
+        return self._get_replicas(model_name).primary
 
-    def get_model(self):
+    @contextmanager
+    def checkout(self, model_name: Optional[str] = None) -> Iterator:
         """
-        Returns the currently selected model.
+        Reserve a free replica of a resident model for the duration of the block.
+        The block runs in the precision context of the model (bf16 autocast for bf16 models).
+        :param model_name: str, name of the model, the selected model if None
+        :return: the reserved model replica
         """
-        with self._lock:
-            if self._current_model is None:
-                raise RuntimeError(f"No {self.model_type} model selected yet")
-            return self._current_model
+        with self._get_replicas(model_name).acquire() as model:
+            with precision_context(model):
+                yield model
 
     def get_spec(self) -> Spec:
         """
         Returns the specification of the currently selected model.
         :return: Spec, a dictionary containing the model specification
         """
-        with self._lock:
+        with self._pool_lock:
             return self._current_spec.copy()
 
+    def pool_stats(self) -> PoolStats:
+        """
+        Returns the resident models and the pool hit/miss/eviction counters.
+        :return: PoolStats, a dictionary containing the pool statistics
+        """
+        with self._pool_lock:
+            resident = {name: size for name, (_, size) in self._pool.items()}
+            replicas = {name: r.stats() for name, (r, _) in self._pool.items()}
+            return {
+                "resident": resident,
+                "replicas": replicas,
+                "resident_bytes": sum(resident.values()),
+                "budget_bytes": self._budget_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def get_stats(self) -> dict:
+        """
+        Returns runtime statistics of the manager.
+        :return: dict, statistics of the manager
+        """
+        return {
+            "model_type": self.model_type,
+            "current": self.get_spec(),
+            "pool": self.pool_stats(),
+            "cache": self._cache.stats() if self._cache is not None else None,
+            "cold_starts": self.cold_starts(),
+            "compiled": self.compiled_stats(),
+        }
+
+    def compiled_stats(self) -> dict[str, dict]:
+        """
+        Returns the compiled graphs of the resident models and how many calls they served.
+        :return: dict[str, CompiledStats], statistics by model name, empty with the eager backend
+        """
+        with self._pool_lock:
+            models = {name: replicas.primary for name, (replicas, _) in self._pool.items()}
+        stats = {name: compiled_stats(model) for name, model in models.items()}
+        return {name: s for name, s in stats.items() if s is not None}
+
+    def cold_starts(self) -> dict[str, ColdStart]:
+        """
+        Returns the load time and memory of the last load of every model loaded so far.
+        `peak_memory_bytes` is the growth of the allocator peak on CUDA, of the process peak RSS
+        elsewhere (0 when the process peak was already higher), None when it cannot be measured.
+        :return: dict[str, ColdStart], cold-start reports by model name
+        """
+        with self._pool_lock:
+            return {name: report.copy() for name, report in self._cold_starts.items()}
+
+    def _get_replicas(self, model_name: Optional[str] = None) -> ReplicaSet:
+        """
+        Returns the replicas of a resident model, loading them on a miss.
+        """
+        model_name = self._resolve(model_name)
+
+        with self._pool_lock:
+            if model_name in self._pool:
+                self._pool.move_to_end(model_name)
+                self._hits += 1
+                return self._pool[model_name][0]
+
+        with self._load_lock:
+            with self._pool_lock:
+                if model_name in self._pool:
+                    self._pool.move_to_end(model_name)
+                    self._hits += 1
+                    return self._pool[model_name][0]
+
+            device = torch.device(self.device)
+            reset_memory_high_watermark(device)
+            watermark = memory_high_watermark(device)
+            started = time.perf_counter()
+            model = self._load_model(model_name)
+            replicas = ReplicaSet(model, self.replicas, name=f"{self.model_type}/{model_name}")
+            seconds = time.perf_counter() - started
+            peak = memory_high_watermark(device)
+            size = model_nbytes(model) * len(replicas)
+
+            with self._pool_lock:
+                self._cold_starts[model_name] = {
+                    "seconds": seconds,
+                    "weights_bytes": size,
+                    "peak_memory_bytes": max(peak - watermark, 0) if peak is not None else None,
+                    "device": device.type,
+                }
+                self._misses += 1
+                self._pool[model_name] = (replicas, size)
+                self._evict(keep=model_name)
+            return replicas
+
+    def _resolve(self, model_name: Optional[str]) -> str:
+        """
+        Resolve an optional model name to the name of the model to use.
+        """
+        if model_name is not None:
+            return model_name
+        with self._pool_lock:
+            current = self._current_spec['model_name']
+        if current is None:
+            raise RuntimeError(f"No {self.model_type} model selected yet")
+        return current
+
+    def _evict(self, keep: str) -> None:
+        """
+        Evict least recently used models until the pool fits the budget. Must hold the pool lock.
+        The model named `keep` is never evicted, so a single model larger than the budget still loads.
+        """
+        total = sum(size for _, size in self._pool.values())
+        for name in list(self._pool):
+            if total <= self._budget_bytes:
+                break
+            if name == keep:
+                continue
+            _, size = self._pool.pop(name)
+            total -= size
+            self._evictions += 1
+
+    def backend(self) -> str:
+        """
+        Returns the name of the inference backend the models run behind, part of the result cache keys.
+        :return: str, 'eager', 'export' or 'aoti'
+        """
+        return self._backend.get('backend', 'eager')
+
+    def _compile(self, model, checkpoint: Path):
+        """
+        Put the configured inference backend in front of a freshly loaded model.
+        Compiled graphs are cached by the sha256 of the checkpoint the model was loaded from.
+        :param model: the loaded model
+        :param checkpoint: Path, the checkpoint file of the model
+        :return: the model
+        """
+        backend = self.backend()
+        if backend == 'eager':
+            return model
+        return compile_model(model, self.model_type, artifact_store.digest(checkpoint), backend,
+                             self._backend['sizes'].get(self.model_type, []), self._backend['cache_dir'])
+
     @abstractmethod
-    def _load_model(self, model_name: str) -> None:
+    def _load_model(self, model_name: str):
         """
-        Abstract method to load the model and its specification.
-        Should be implemented by subclasses.
+        Abstract method to build a model and load its weights.
+        Should be implemented by subclasses and return the loaded model.
         """
         pass
 
     @abstractmethod
     def predict(self, *args, **kwargs):
         """
-        Abstract method for making predictions with the currently selected model.
+        Abstract method for making predictions with a resident model.
         """
         pass
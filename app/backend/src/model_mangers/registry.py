@@ -0,0 +1,146 @@
+"""
+Process-wide registry of the model managers.
+The FastAPI routes and the Gradio UI get their managers from here, so running both frontends in one
+process shares a single set of resident models. Managers are created on first access and load their
+models lazily; `start_warmup` loads models in a background thread without delaying startup.
+"""
+import threading
+import time
+from typing import Callable, Literal, Optional, TypedDict
+
+from src.config import MODEL_WARMUP
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.executor import configure_threads
+from src.model_mangers.model_manager import ModelManager, ModelType
+from src.model_mangers.roma_manager import RomaManager
+
+WarmupState = Literal["pending", "loading", "ready", "failed"]
+
+
+class WarmupStatus(TypedDict):
+    state: WarmupState
+    seconds: Optional[float]
+    error: Optional[str]
+
+
+_FACTORIES: dict[ModelType, Callable[[], ModelManager]] = {
+    "depth_anything": DepthManager,
+    "tiny_roma": RomaManager,
+}
+
+_lock = threading.Lock()
+_managers: dict[ModelType, ModelManager] = {}
+_warmup: dict[str, WarmupStatus] = {}
+
+
+def get_manager(model_type: ModelType) -> ModelManager:
+    """
+    Returns the shared manager of a model type, creating it on first access.
+    Creating a manager does not load any model; the torch thread count is set (once, for all managers)
+    before the first one is created, see `configure_threads`.
+    :param model_type: ModelType, the type of model
+    :return: ModelManager, the shared manager
+    """
+    if model_type not in _FACTORIES:
+        raise ValueError(f"Unknown model type: {model_type}")
+    with _lock:
+        if model_type not in _managers:
+            configure_threads()
+            _managers[model_type] = _FACTORIES[model_type]()
+        return _managers[model_type]
+
+
+def get_depth_manager() -> DepthManager:
+    return get_manager("depth_anything")
+
+
+def get_roma_manager() -> RomaManager:
+    return get_manager("tiny_roma")
+
+
+def managers() -> dict[ModelType, ModelManager]:
+    """
+    Returns the managers created so far.
+    :return: dict[ModelType, ModelManager], managers by model type
+    """
+    with _lock:
+        return dict(_managers)
+
+
+def _schedule(models: dict[ModelType, list[str]]) -> list[tuple[ModelType, str]]:
+    """
+    Record the models of a warmup as pending, so `is_warm` is False until they are loaded.
+    :param models: dict[ModelType, list[str]], model names to load by model type
+    :return: list[tuple[ModelType, str]], the (model type, model name) jobs in loading order
+    """
+    jobs = [(model_type, name) for model_type, names in models.items() for name in names]
+    with _lock:
+        for model_type, name in jobs:
+            _warmup[f"{model_type}/{name}"] = {"state": "pending", "seconds": None, "error": None}
+    return jobs
+
+
+def _load(jobs: list[tuple[ModelType, str]]) -> None:
+    for model_type, name in jobs:
+        key = f"{model_type}/{name}"
+        with _lock:
+            _warmup[key]["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            get_manager(model_type).get_model(name)
+            status: WarmupStatus = {"state": "ready", "seconds": time.perf_counter() - started, "error": None}
+        except Exception as e:
+            status = {"state": "failed", "seconds": time.perf_counter() - started, "error": str(e)}
+        with _lock:
+            _warmup[key] = status
+
+
+def warmup(models: dict[ModelType, list[str]]) -> None:
+    """
+    Load models into their managers one after the other, recording the progress in `warmup_status`.
+    A model that fails to load is reported as failed and does not stop the others.
+    :param models: dict[ModelType, list[str]], model names to load by model type
+    """
+    _load(_schedule(models))
+
+
+def start_warmup(models: Optional[dict[ModelType, list[str]]] = None) -> threading.Thread:
+    """
+    Schedule the models and load them in a daemon thread, returning immediately.
+    The models are recorded as pending before the thread starts, so `is_warm` never reports an unstarted warmup
+    as done.
+    :param models: dict[ModelType, list[str]], model names to load by model type, MODEL_WARMUP['models'] if None
+        ({} warms nothing)
+    :return: threading.Thread, the warmup thread
+    """
+    jobs = _schedule(models if models is not None else MODEL_WARMUP['models'])
+    thread = threading.Thread(target=_load, args=(jobs,), name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def warmup_status() -> dict[str, WarmupStatus]:
+    """
+    Returns the warmup state of every model scheduled for warmup, keyed by '<model_type>/<model_name>'.
+    :return: dict[str, WarmupStatus], warmup states
+    """
+    with _lock:
+        return {key: status.copy() for key, status in _warmup.items()}
+
+
+def is_warm() -> bool:
+    """
+    Whether no scheduled warmup is still pending or loading.
+    :return: bool, True once every scheduled model is ready or has failed
+    """
+    with _lock:
+        return all(status["state"] in ("ready", "failed") for status in _warmup.values())
+
+
+def reset() -> None:
+    """
+    Forget the managers and the warmup state, the next access creates new managers.
+    """
+    with _lock:
+        _managers.clear()
+        _warmup.clear()
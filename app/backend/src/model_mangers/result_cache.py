@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Mapping, Optional, TypedDict
+
+import numpy as np
+import torch
+from PIL import Image
+
+CacheValue = Mapping[str, Any]
+
+
+class CacheStats(TypedDict):
+    hits: int
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    entries: int
+    bytes: int
+    max_bytes: int
+    disk_entries: Optional[int]
+    disk_bytes: Optional[int]
+
+
+def image_digest(image) -> bytes:
+    """
+    Content hash of an image given as encoded bytes, an array, a PIL image, a tensor or a file path.
+    Encoded bytes are hashed as-is, decoded images are hashed together with their shape and dtype.
+    :param image: the image
+    :return: bytes, the sha256 digest
+    """
+    h = hashlib.sha256()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        h.update(b"bytes:")
+        h.update(image)
+        return h.digest()
+    if isinstance(image, (str, Path)):
+        h.update(b"bytes:")
+        h.update(Path(image).read_bytes())
+        return h.digest()
+    if isinstance(image, Image.Image):
+        image = np.asarray(image)
+    if isinstance(image, torch.Tensor):
+        image = image.detach().cpu().numpy()
+    if isinstance(image, np.ndarray):
+        h.update(f"array:{image.dtype.str}:{image.shape}:".encode())
+        h.update(np.ascontiguousarray(image).data)
+        return h.digest()
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+
+def cache_key(*parts) -> str:
+    """
+    Build a cache key from image digests and the parameters that influence the result.
+    :param parts: bytes digests or parameters with a stable repr
+    :return: str, hex key
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else repr(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _nbytes(value: CacheValue) -> int:
+    return sum(v.nbytes for v in value.values() if isinstance(v, np.ndarray))
+
+
+class ResultCache:
+    """
+    Content-addressed cache of inference results.
+    Results are dictionaries of numpy arrays and JSON scalars. The in-memory tier is bounded by
+    `max_bytes` with LRU eviction; the optional disk tier stores every array as a `.npy` file that
+    is memory-mapped on load, so it survives restarts without reading whole results into memory.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[Path] = None, disk_max_bytes: Optional[int] = None):
+        """
+        :param max_bytes: int, size bound of the in-memory tier
+        :param disk_dir: Path, directory of the disk tier, no disk tier if None
+        :param disk_max_bytes: int, size bound of the disk tier, unbounded if None
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple[CacheValue, int]]" = OrderedDict()
+        self._bytes = 0
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._disk_bytes = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(f.stat().st_size for f in self.disk_dir.glob("*/*/*.npy"))
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        """
+        Look up a result, first in memory then on disk.
+        :param key: str, the cache key
+        :return: the cached result or None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return entry[0]
+
+        value = self._load_disk(key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._put_memory(key, value)
+        return value
+
+    def put(self, key: str, value: CacheValue) -> None:
+        """
+        Store a result in memory and, when enabled, on disk.
+        :param key: str, the cache key
+        :param value: CacheValue, dictionary of numpy arrays and JSON scalars
+        """
+        for v in value.values():
+            if isinstance(v, np.ndarray):
+                # cached arrays are shared between callers
+                v.setflags(write=False)
+        with self._lock:
+            self._put_memory(key, value)
+        if self.disk_dir is not None:
+            self._store_disk(key, value)
+
+    def stats(self) -> CacheStats:
+        """
+        Returns the hit/miss counters and the size of both tiers.
+        :return: CacheStats, a dictionary containing the cache statistics
+        """
+        with self._lock:
+            disk_entries = None
+            if self.disk_dir is not None:
+                disk_entries = sum(1 for _ in self.disk_dir.glob("*/*/meta.json"))
+            return {
+                "hits": self._memory_hits + self._disk_hits,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "entries": len(self._memory),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": disk_entries,
+                "disk_bytes": self._disk_bytes if self.disk_dir is not None else None,
+            }
+
+    def _put_memory(self, key: str, value: CacheValue) -> None:
+        """
+        Insert into the memory tier and evict least recently used entries. Must hold the lock.
+        """
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._bytes -= evicted
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / key
+
+    def _load_disk(self, key: str) -> Optional[CacheValue]:
+        if self.disk_dir is None:
+            return None
+        entry = self._entry_dir(key)
+        meta_path = entry / "meta.json"
+        if not meta_path.is_file():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+            value = dict(meta["scalars"])
+            for name in meta["arrays"]:
+                value[name] = np.load(entry / f"{name}.npy", mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(meta_path)
+        return value
+
+    def _store_disk(self, key: str, value: CacheValue) -> None:
+        entry = self._entry_dir(key)
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+        try:
+            arrays, scalars = [], {}
+            for name, v in value.items():
+                if isinstance(v, np.ndarray):
+                    np.save(tmp / f"{name}.npy", np.ascontiguousarray(v), allow_pickle=False)
+                    arrays.append(name)
+                else:
+                    scalars[name] = v
+            # meta.json is written last, an entry without it is incomplete and ignored
+            (tmp / "meta.json").write_text(json.dumps({"arrays": arrays, "scalars": scalars}))
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        size = sum(f.stat().st_size for f in entry.glob("*.npy"))
+        with self._lock:
+            self._disk_bytes += size
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """
+        Remove the least recently used disk entries until the disk tier fits its bound.
+        """
+        if self.disk_max_bytes is None or self._disk_bytes <= self.disk_max_bytes:
+            return
+        entries = sorted(
+            (meta.stat().st_mtime, meta.parent) for meta in self.disk_dir.glob("*/*/meta.json")
+        )
+        for _, entry in entries:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            size = sum(f.stat().st_size for f in entry.glob("*.npy"))
+            shutil.rmtree(entry, ignore_errors=True)
+            with self._lock:
+                self._disk_bytes -= size
+
+
+class FeatureCacheStats(TypedDict):
+    hits: int
+    misses: int
+    entries: int
+    bytes: int
+    max_bytes: int
+
+
+class FeatureCache:
+    """
+    In-memory LRU cache of per-image model features (tuples of tensors), bounded by `max_bytes`.
+    Lets an image matched again, e.g. a reference frame shared by many queries, skip its encoder.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: int, size bound of the cache
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[tuple, int]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> Optional[tuple]:
+        """
+        Look up the features of an image.
+        :param key: str, the cache key
+        :return: tuple, the cached features or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: str, features: tuple) -> None:
+        """
+        Store the features of an image, evicting least recently used entries.
+        :param key: str, the cache key
+        :param features: tuple, tensors and scalars, the tensors are shared with later callers
+        """
+        size = sum(f.numel() * f.element_size() for f in features if isinstance(f, torch.Tensor))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (features, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def stats(self) -> FeatureCacheStats:
+        """
+        Returns the hit/miss counters and the size of the cache.
+        :return: FeatureCacheStats, a dictionary containing the cache statistics
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,13 +1,39 @@
+import time
 from abc import ABC
-from typing import TypedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TypedDict, Union
 
 import cv2
 import numpy as np
 import torch
+from PIL import Image
 
-from src.config import ROMA_MODELS, DEVICE, ROMA_BASE_MODEL
+from src.config import (
+    ROMA_MODELS, DEVICE, ROMA_BASE_MODEL, ROMA_POOL_BUDGET_BYTES, ROMA_EXECUTION, RESULT_CACHE, PRECISION,
+    INFERENCE_BACKEND, ROMA_MATCH_MANY, ROMA_SAMPLING, ROMA_CORRELATION, ROMA_GEOMETRY, ROMA_MATCH_KEYPOINTS
+)
+from src.model_mangers.geometry import GeometryParams, GeometryPool, GeometryReport, resolve_geometry
 from src.model_mangers.model_manager import ModelManager
+from src.model_mangers.result_cache import FeatureCache, cache_key, image_digest
+from src.utils.artifact_store import artifact_store
+from src.utils.metrics import timed
+from src.utils.precision import apply_precision, calibration_frames, check_precision, precision_context
 from src.third_party.romatch import tiny_roma_v1_outdoor
+from src.third_party.romatch.models.tiny import TinyRoMa
+
+
+ImageInput = Union[bytes, np.ndarray, Image.Image, torch.Tensor, str, Path]
+
+NUM_SAMPLES = 5000
+# default parameters of the robust geometry stage, each request may override them (see geometry.py)
+GEOMETRY = resolve_geometry(ROMA_GEOMETRY['default'])
+RANSAC_PARAMS = {
+    'ransacReprojThreshold': GEOMETRY['threshold'],
+    'method': cv2.USAC_MAGSAC,
+    'confidence': GEOMETRY['confidence'],
+    'maxIters': GEOMETRY['max_iters'],
+}
 
 
 class RomaPrediction(TypedDict):
@@ -20,75 +46,468 @@ class RomaPrediction(TypedDict):
     W_A: int
     H_B: int
     W_B: int
+    geometry: GeometryReport
+    timings: dict[str, float]
+
+
+class KeypointMatches(TypedDict):
+    kptsA: list[list[float]]
+    kptsB: list[list[float]]
+    certainty: list[float]
+    H_A: int
+    W_A: int
+    H_B: int
+    W_B: int
+    timings: dict[str, float]
 
 
 class RomaManager(ModelManager, ABC):
-    def __init__(self, base_model: str = ROMA_BASE_MODEL):
-        super().__init__("tiny_roma", base_model)
+    def __init__(self, base_model: str = ROMA_BASE_MODEL, budget_bytes: int = ROMA_POOL_BUDGET_BYTES,
+                 replicas: int = ROMA_EXECUTION['replicas'], cache: dict | None = RESULT_CACHE,
+                 backend: dict = INFERENCE_BACKEND, match_many: dict = ROMA_MATCH_MANY,
+                 correlation: dict = ROMA_CORRELATION, geometry: dict = ROMA_GEOMETRY,
+                 match_keypoints: dict = ROMA_MATCH_KEYPOINTS):
+        super().__init__("tiny_roma", base_model, budget_bytes, replicas=replicas, device=DEVICE, cache=cache,
+                         backend=backend)
+        self._max_batch_size = max(1, match_many.get('max_batch_size', 1))
+        self._features = FeatureCache(match_many.get('feature_cache_bytes', 0))
+        self._corr_max_bytes = correlation.get('max_bytes')
+        self._geometry = GeometryPool(geometry.get('workers', 0))
+        self._geometry_defaults = resolve_geometry(geometry.get('default', GEOMETRY))
+        self._max_keypoints = match_keypoints.get('max_points')
 
-    def _load_model(self, model_name: str, device=DEVICE):
+    def _load_model(self, model_name: str, device=DEVICE, precision: str | None = None) -> TinyRoMa:
         """
-        Load the specified Tiny RoMa model and its configuration.
+        Build the Tiny RoMa model directly from the specified checkpoint, without network access,
+        and convert it to the precision of its entry (see `src/utils/precision.py`).
+        Correlation volumes above ROMA_CORRELATION['max_bytes'] are computed in chunks of rows.
+        The geometry worker processes are started alongside, so they are up by the first prediction.
         :param model_name: str, name of the model to load
         :param device: str, device to run the model on (default: DEVICE)
-        :return: None
+        :param precision: str, precision mode overriding the one of the model entry
+        :return: TinyRoMa, the loaded model
+        """
+        if model_name not in ROMA_MODELS:
+            raise ValueError(f"Model '{model_name}' not found in ROMA_MODELS")
+
+        precision = check_precision(precision or self.precision(model_name), device)
+        ckpt = artifact_store.resolve(ROMA_MODELS[model_name])
+        state_dict = torch.load(ckpt, map_location=device)
+        model = tiny_roma_v1_outdoor(device=device, weights=state_dict)
+        model.corr_max_bytes = self._corr_max_bytes
+        model = apply_precision(model.eval(), precision, calibrate=RomaManager.calibrate)
+        self._geometry.start()
+        return self._compile(model, ckpt)
+
+    @staticmethod
+    def precision(model_name: str) -> str:
+        """
+        Returns the precision mode of a model entry.
+        :param model_name: str, name of the model
+        :return: str, the 'precision' of its ROMA_MODELS entry, PRECISION['default'] if it has none
+        """
+        return ROMA_MODELS.get(model_name, {}).get('precision', PRECISION['default'])
+
+    @staticmethod
+    def calibrate(model: TinyRoMa, frames: list[np.ndarray] | None = None) -> None:
+        """
+        Match consecutive calibration frames with a model prepared for int8_static quantization.
+        :param model: TinyRoMa, the model with its observers inserted
+        :param frames: list[np.ndarray], BGR frames, `calibration_frames()` if None
         """
-        if self._current_model is None:
-            self._current_model = tiny_roma_v1_outdoor(device=device)
+        frames = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in (frames if frames is not None else calibration_frames())]
+        for imA, imB in zip(frames, frames[1:] or frames):
+            model.match(imA, imB, batched=False)
 
+    @staticmethod
+    def checkpoint_digest(model_name: str) -> str:
+        """
+        Content hash of the checkpoint of a model entry, part of the result cache keys (see `DepthManager`).
+        :param model_name: str, name of the model
+        :return: str, the sha256 hex digest of the checkpoint file (see `ArtifactStore.digest`)
+        """
         if model_name not in ROMA_MODELS:
             raise ValueError(f"Model '{model_name}' not found in ROMA_MODELS")
+        return artifact_store.digest(artifact_store.resolve(ROMA_MODELS[model_name], verify=False))
 
-        ckpt = ROMA_MODELS[model_name]['checkpoint']
-        if not ckpt.is_file():
-            raise ValueError(f"Checkpoint '{ckpt}' not found")
+    def predict(self, imA: ImageInput, imB: ImageInput, device=DEVICE, as_numpy: bool = False,
+                model_name: str | None = None, geometry: dict | None = None) -> RomaPrediction:
+        """
+        Predict the two-view geometry and keypoints matches between two images.
+        Each image is decoded exactly once and kept in memory, no temporary files are written.
+        With ROMA_SAMPLING['sparse_points'] set, matches are drawn from that many points of the fine flow and the
+        full-resolution warp is never built.
+        The sampled matches are verified on the geometry process pool once the model replica is released.
+        Results are cached by image content, model and sampling/geometry parameters; cache hits never touch the model.
+        :param imA: ImageInput, the first image as encoded bytes, an RGB array, a PIL image, a tensor or a file path
+        :param imB: ImageInput, the second image, same accepted types as imA
+        :param device: str, device to run the model on (default: DEVICE)
+        :param as_numpy: bool, return float32 numpy arrays instead of nested lists (skips the list conversion)
+        :param model_name: str, name of the model to use, the selected model if None
+        :param geometry: dict, GeometryParams overriding ROMA_GEOMETRY['default'] for this request
+        :return: RomaPrediction, a dictionary containing the fundamental matrix, keypoints, matches, image dimensions,
+            the geometry report and the seconds spent in every stage
+        """
+        started = time.perf_counter()
+        model_name = self._resolve(model_name)
+        params = self.geometry_params(geometry)
+        timings: dict[str, float] = {}
+        key = None
+        if self._cache is not None:
+            key = self.__result_key(self.__model_key(model_name), image_digest(imA), image_digest(imB), params)
+            cached = self._cache.get(key)
+            if cached is not None:
+                timings["cache"] = time.perf_counter() - started
+                return RomaManager.__format(cached, as_numpy, timings)
 
-        state_dict = torch.load(ckpt, map_location=device)
-        self._current_model.load_state_dict(state_dict)
+        replicas = self._get_replicas(model_name)
+        with RomaManager.__stage(timings, "decode"):
+            tA = RomaManager.__preprocess(replicas.primary, imA)
+            tB = RomaManager.__preprocess(replicas.primary, imB)
+        H_A, W_A = tA.shape[-2:]
+        H_B, W_B = tB.shape[-2:]
+
+        waiting = time.perf_counter()
+        with replicas.acquire() as model:
+            timings["wait"] = time.perf_counter() - waiting
+            with torch.no_grad(), precision_context(model):
+                with RomaManager.__stage(timings, "match", sync=True):
+                    warp, certainty = model.match(tA, tB, batched=False,
+                                                  num_points=ROMA_SAMPLING['sparse_points'])
+                    warp, certainty = warp.float(), certainty.float()
+                with RomaManager.__stage(timings, "sample", sync=True):
+                    matches, certainty = model.sample(warp, certainty, num=NUM_SAMPLES,
+                                                      kde_mode=ROMA_SAMPLING['kde_mode'])
+                    kptsA, kptsB = model.to_pixel_coordinates(matches, H_A, W_A, H_B, W_B)
+                    sample = (kptsA.cpu().numpy(), kptsB.cpu().numpy(), matches.cpu().numpy(),
+                              certainty.cpu().numpy(), H_A, W_A, H_B, W_B)
+
+        # the replica is free for the next request while the matches are verified
+        prediction = self.__verify([sample], params, timings)[0]
+        if key is not None and prediction["geometry"]["status"] != "timeout":
+            self._cache.put(key, prediction)
+        timings["total"] = time.perf_counter() - started
+        return RomaManager.__format(prediction, as_numpy, timings)
+
+    def predict_many(self, query: ImageInput, references: list[ImageInput], device=DEVICE, as_numpy: bool = False,
+                     model_name: str | None = None, geometry: dict | None = None) -> list[RomaPrediction]:
+        """
+        Match one query image against several reference images, e.g. to relocalize a frame in a scene.
+        XFeat features are computed once per image and kept in an LRU feature cache keyed by image hash,
+        references of the same size are matched in batches of ROMA_MATCH_MANY['max_batch_size'].
+        Each result is the one `predict(query, reference)` returns and shares its result cache entries.
+        The geometry of all references is verified concurrently on the geometry process pool, `timings` covers the
+        whole call.
+        :param query: ImageInput, the query image, same accepted types as in `predict`
+        :param references: list[ImageInput], the reference images
+        :param device: str, device to run the model on (default: DEVICE)
+        :param as_numpy: bool, return float32 numpy arrays instead of nested lists (skips the list conversion)
+        :param model_name: str, name of the model to use, the selected model if None
+        :param geometry: dict, GeometryParams overriding ROMA_GEOMETRY['default'] for this request
+        :return: list[RomaPrediction], the prediction of every reference, in order
+        """
+        if not references:
+            raise ValueError("No reference images")
+        started = time.perf_counter()
+        model_name = self._resolve(model_name)
+        model_key = self.__model_key(model_name)
+        params = self.geometry_params(geometry)
+        query_digest = image_digest(query)
+        digests = [image_digest(r) for r in references]
+        timings: dict[str, float] = {}
+
+        predictions: list[dict | None] = [None] * len(references)
+        keys: list[str | None] = [None] * len(references)
+        if self._cache is not None:
+            for i, digest in enumerate(digests):
+                keys[i] = self.__result_key(model_key, query_digest, digest, params)
+                predictions[i] = self._cache.get(keys[i])
+            timings["cache"] = time.perf_counter() - started
+        pending = [i for i, p in enumerate(predictions) if p is None]
+        if not pending:
+            return [RomaManager.__format(p, as_numpy, timings) for p in predictions]
+
+        replicas = self._get_replicas(model_name)
+        with RomaManager.__stage(timings, "decode"):
+            tQ = RomaManager.__preprocess(replicas.primary, query)
+            tRefs = {i: RomaManager.__preprocess(replicas.primary, references[i]) for i in pending}
+        H_A, W_A = tQ.shape[-2:]
+
+        samples = {}
+        waiting = time.perf_counter()
+        with replicas.acquire() as model:
+            timings["wait"] = time.perf_counter() - waiting
+            with torch.no_grad(), precision_context(model):
+                features = self.__encode(model, model_key, [query_digest], [tQ])
+                query_features = features[query_digest]
+                features.update(self.__encode(model, model_key, [digests[i] for i in pending],
+                                              [tRefs[i] for i in pending]))
+
+                groups: dict[tuple, list[int]] = {}
+                for i in pending:
+                    groups.setdefault(features[digests[i]][2], []).append(i)
+                for group in groups.values():
+                    for start in range(0, len(group), self._max_batch_size):
+                        batch = group[start:start + self._max_batch_size]
+                        refs = [features[digests[i]] for i in batch]
+                        feats = (torch.cat([f[0] for f in refs]), torch.cat([f[1] for f in refs]), refs[0][2])
+                        with RomaManager.__stage(timings, "match", sync=True):
+                            warps, certainties = model.match_many(query_features, feats, H_A, W_A,
+                                                                  ROMA_SAMPLING['sparse_points'])
+                            warps, certainties = warps.float(), certainties.float()
+                        for i, warp, certainty in zip(batch, warps, certainties):
+                            H_B, W_B = tRefs[i].shape[-2:]
+                            with RomaManager.__stage(timings, "sample", sync=True):
+                                matches, certainty = model.sample(warp, certainty, num=NUM_SAMPLES,
+                                                                  kde_mode=ROMA_SAMPLING['kde_mode'])
+                                kptsA, kptsB = model.to_pixel_coordinates(matches, H_A, W_A, H_B, W_B)
+                                samples[i] = (kptsA.cpu().numpy(), kptsB.cpu().numpy(), matches.cpu().numpy(),
+                                              certainty.cpu().numpy(), H_A, W_A, H_B, W_B)
+
+        verified = self.__verify([samples[i] for i in pending], params, timings)
+        for i, prediction in zip(pending, verified):
+            predictions[i] = prediction
+            if keys[i] is not None and prediction["geometry"]["status"] != "timeout":
+                self._cache.put(keys[i], prediction)
+        timings["total"] = time.perf_counter() - started
+        return [RomaManager.__format(p, as_numpy, timings) for p in predictions]
 
-    def predict(self, imA_path: str, imB_path: str, device=DEVICE) -> RomaPrediction:
+    def match_keypoints(self, imA: ImageInput, imB: ImageInput, keypoints, device=DEVICE, as_numpy: bool = False,
+                        model_name: str | None = None) -> KeypointMatches:
         """
-        Predict the fundamental matrix and keypoints matches between two images.
-        :param imA_path: str, path to the first image
-        :param imB_path: str, path to the second image
+        Find the correspondences in image B of given keypoints of image A.
+        The warp and certainty are read off the fine flow at the keypoints, the full-resolution warp is never built
+        and nothing is sampled or verified, so the cost barely depends on the number of keypoints.
+        Results are not cached, the keypoints change with every request of a tracking client.
+        :param imA: ImageInput, the first image, same accepted types as in `predict`
+        :param imB: ImageInput, the second image
+        :param keypoints: array-like, (N, 2) pixel coordinates (x, y) in image A, within [0, W_A] x [0, H_A]
         :param device: str, device to run the model on (default: DEVICE)
-        :return: RomaPrediction, a dictionary containing the fundamental matrix, keypoints, matches, and image dimensions
-        """
-        with self._lock:
-            imA, H_A, W_A = RomaManager.__preprocess(imA_path)
-            imB, H_B, W_B = RomaManager.__preprocess(imB_path)
-
-            with torch.no_grad():
-                warp, certainty = self._current_model.match(imA_path, imB_path)
-                matches, certainty = self._current_model.sample(warp, certainty)
-                kptsA, kptsB = self._current_model.to_pixel_coordinates(matches, H_A, W_A, H_B, W_B)
-
-            F, mask = cv2.findFundamentalMat(
-                kptsA.cpu().numpy(), kptsB.cpu().numpy(), ransacReprojThreshold=0.2,
-                method=cv2.USAC_MAGSAC, confidence=0.999999, maxIters=10000
-            )
-
-            return {
-                "F": F.tolist() if F is not None else None,
-                "kptsA": kptsA[mask.ravel() == 1].cpu().numpy().tolist(),
-                "kptsB": kptsB[mask.ravel() == 1].cpu().numpy().tolist(),
-                "matches": matches[mask.ravel() == 1].cpu().numpy().tolist(),
-                "certainty": certainty[mask.ravel() == 1].cpu().numpy().tolist(),
+        :param as_numpy: bool, return float32 numpy arrays instead of nested lists
+        :param model_name: str, name of the model to use, the selected model if None
+        :return: KeypointMatches, a dictionary containing the keypoints, their correspondences in image B, the
+            certainty of every correspondence, image dimensions and the seconds spent in every stage
+        """
+        started = time.perf_counter()
+        try:
+            kptsA = np.asarray(keypoints, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("keypoints must be an (N, 2) array of pixel coordinates")
+        if kptsA.ndim != 2 or kptsA.shape[1] != 2 or len(kptsA) == 0:
+            raise ValueError(f"keypoints must be an (N, 2) array of pixel coordinates, got shape {kptsA.shape}")
+        if self._max_keypoints is not None and len(kptsA) > self._max_keypoints:
+            raise ValueError(f"At most {self._max_keypoints} keypoints per request, got {len(kptsA)}")
+        if not np.isfinite(kptsA).all():
+            raise ValueError("keypoints must be finite")
+
+        model_name = self._resolve(model_name)
+        timings: dict[str, float] = {}
+        replicas = self._get_replicas(model_name)
+        with RomaManager.__stage(timings, "decode"):
+            tA = RomaManager.__preprocess(replicas.primary, imA)
+            tB = RomaManager.__preprocess(replicas.primary, imB)
+        H_A, W_A = tA.shape[-2:]
+        H_B, W_B = tB.shape[-2:]
+        if (kptsA < 0).any() or (kptsA[:, 0] > W_A).any() or (kptsA[:, 1] > H_A).any():
+            raise ValueError(f"keypoints must lie within image A ({W_A}x{H_A})")
+        # inverse of TinyRoMa.to_pixel_coordinates
+        points = torch.from_numpy(kptsA).to(tA.device) / torch.tensor((W_A, H_A), device=tA.device) * 2 - 1
+
+        waiting = time.perf_counter()
+        with replicas.acquire() as model:
+            timings["wait"] = time.perf_counter() - waiting
+            with torch.no_grad(), precision_context(model):
+                with RomaManager.__stage(timings, "match", sync=True):
+                    warp, certainty = model.match_points(tA, tB, points[None])
+                    kptsB = model.to_pixel_coordinates(warp[0, :, 2:].float(), H_B, W_B)
+                    prediction = {
+                        "kptsA": kptsA,
+                        "kptsB": kptsB.cpu().numpy(),
+                        "certainty": certainty[0].float().cpu().numpy(),
+                        "H_A": H_A,
+                        "W_A": W_A,
+                        "H_B": H_B,
+                        "W_B": W_B,
+                    }
+        timings["total"] = time.perf_counter() - started
+        return RomaManager.__format(prediction, as_numpy, timings)
+
+    def describe(self, images: list[ImageInput], device=DEVICE, model_name: str | None = None) -> np.ndarray:
+        """
+        Global descriptors of images, the L2-normalized average of their coarse XFeat features, to rank candidate
+        pairs by cosine similarity. The features go through the feature cache of `predict_many`, so images matched
+        right after being described are not encoded twice.
+        :param images: list[ImageInput], the images, same accepted types as in `predict`
+        :param device: str, device to run the model on (default: DEVICE)
+        :param model_name: str, name of the model to use, the selected model if None
+        :return: np.ndarray, (N, C) float32 descriptors
+        """
+        model_name = self._resolve(model_name)
+        model_key = self.__model_key(model_name)
+        replicas = self._get_replicas(model_name)
+        descriptors = []
+        for start in range(0, len(images), self._max_batch_size):
+            batch = images[start:start + self._max_batch_size]
+            digests = [image_digest(im) for im in batch]
+            with timed("roma_manager", "decode"):
+                tensors = [RomaManager.__preprocess(replicas.primary, im) for im in batch]
+            with replicas.acquire() as model:
+                with torch.no_grad(), precision_context(model):
+                    features = self.__encode(model, model_key, digests, tensors)
+            for digest in digests:
+                descriptors.append(torch.nn.functional.normalize(features[digest][1].float().mean(dim=(2, 3)), dim=1))
+        return torch.cat(descriptors).cpu().numpy() if descriptors else np.zeros((0, 0), dtype=np.float32)
+
+    def geometry_params(self, overrides: dict | None = None) -> GeometryParams:
+        """
+        Returns the geometry parameters of a request.
+        :param overrides: dict, parameters of the request, None keeps ROMA_GEOMETRY['default']
+        :return: GeometryParams, the validated parameters
+        """
+        return resolve_geometry(self._geometry_defaults, overrides)
+
+    def feature_stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the size of the feature cache of `predict_many`.
+        :return: FeatureCacheStats, a dictionary containing the cache statistics
+        """
+        return self._features.stats()
+
+    def get_stats(self) -> dict:
+        """
+        Returns runtime statistics of the manager, including the feature cache.
+        :return: dict, statistics of the manager
+        """
+        stats = super().get_stats()
+        stats["features"] = self.feature_stats()
+        return stats
+
+    def __model_key(self, model_name: str) -> tuple:
+        """
+        Cache key parts identifying what produces a prediction: the model name, its checkpoint digest,
+        the inference backend and the precision mode.
+        :param model_name: str, name of the model
+        :return: tuple, the key parts
+        """
+        return model_name, self.checkpoint_digest(model_name), self.backend(), self.precision(model_name)
+
+    def __encode(self, model: TinyRoMa, model_key: tuple, digests: list[bytes],
+                 images: list[torch.Tensor]) -> dict[bytes, tuple]:
+        """
+        XFeat features of images from the feature cache, encoding the missing ones in batches of images of the same size.
+        :param model: TinyRoMa, the reserved model replica
+        :param model_key: tuple, the `__model_key` of the model
+        :param digests: list[bytes], content hashes of the images
+        :param images: list[torch.Tensor], the decoded (1, 3, H, W) images
+        :return: dict[bytes, tuple], (fine, coarse, size) features by image digest
+        """
+        features, missing = {}, {}
+        for digest, image in zip(digests, images):
+            if digest in features or digest in missing:
+                continue
+            cached = self._features.get(cache_key("roma-features", *model_key, digest))
+            if cached is not None:
+                features[digest] = cached
+            else:
+                missing[digest] = image
+
+        groups: dict[tuple, list[bytes]] = {}
+        for digest, image in missing.items():
+            groups.setdefault(tuple(image.shape), []).append(digest)
+        for group in groups.values():
+            for start in range(0, len(group), self._max_batch_size):
+                batch = group[start:start + self._max_batch_size]
+                feats_f, feats_c, size = model.encode(torch.cat([missing[d] for d in batch]))
+                for digest, f, c in zip(batch, feats_f.split(1), feats_c.split(1)):
+                    features[digest] = (f, c, size)
+                    self._features.put(cache_key("roma-features", *model_key, digest), features[digest])
+        return features
+
+    def __verify(self, samples: list[tuple], params: GeometryParams, timings: dict[str, float]) -> list[dict]:
+        """
+        Verify sampled matches with the estimator of the request on the geometry pool and keep the inliers.
+        All pairs are submitted before waiting, so they are verified concurrently.
+        A pair whose estimation does not finish within the time budget keeps all its matches, unverified.
+        :param samples: list[tuple], (kptsA, kptsB, matches, certainty, H_A, W_A, H_B, W_B) numpy samples
+        :param params: GeometryParams, the parameters of the request
+        :param timings: dict[str, float], stage timings, 'geometry' is added to it
+        :return: list[dict], the predictions, in order
+        """
+        with RomaManager.__stage(timings, "geometry"):
+            submitted = time.perf_counter()
+            futures = [self._geometry.submit(kptsA, kptsB, params) for kptsA, kptsB, *_ in samples]
+            results = [GeometryPool.result(future, params, submitted) for future in futures]
+
+        predictions = []
+        for (kptsA, kptsB, matches, certainty, H_A, W_A, H_B, W_B), result in zip(samples, results):
+            if result is None:
+                matrix, F, inliers, seconds = None, None, np.ones(len(kptsA), dtype=bool), 0.0
+                status = "timeout"
+            else:
+                matrix, F, inliers, seconds = result
+                status = "skipped" if params["estimator"] == "none" else "ok" if matrix is not None else "failed"
+            report: GeometryReport = {
+                "estimator": params["estimator"],
+                "status": status,
+                "matrix": matrix.tolist() if matrix is not None else None,
+                "inliers": int(inliers.sum()),
+                "seconds": seconds,
+            }
+            predictions.append({
+                "F": F,
+                "kptsA": kptsA[inliers],
+                "kptsB": kptsB[inliers],
+                "matches": matches[inliers],
+                "certainty": certainty[inliers],
                 "H_A": H_A,
                 "W_A": W_A,
                 "H_B": H_B,
-                "W_B": W_B
-            }
+                "W_B": W_B,
+                "geometry": report,
+            })
+        return predictions
+
+    @staticmethod
+    def __result_key(model_key: tuple, digestA: bytes, digestB: bytes, params: GeometryParams) -> str:
+        """
+        Result cache key of a pair, the time budget only decides whether a result is cached.
+        """
+        geometry = sorted((k, v) for k, v in params.items() if k != "time_budget")
+        return cache_key("roma", *model_key, digestA, digestB, NUM_SAMPLES, sorted(ROMA_SAMPLING.items()), geometry)
+
+    @staticmethod
+    @contextmanager
+    def __stage(timings: dict[str, float], stage: str, sync: bool = False):
+        """
+        Time a stage into the timings of the request as well as the 'roma_manager' metrics.
+        """
+        started = time.perf_counter()
+        with timed("roma_manager", stage, sync=sync):
+            yield
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+    @staticmethod
+    def __format(prediction: dict, as_numpy: bool, timings: dict[str, float]) -> RomaPrediction:
+        """
+        Convert the arrays of a prediction to nested lists unless numpy output was requested, and add the timings.
+        """
+        if as_numpy:
+            return {**prediction, "timings": dict(timings)}
+        with timed("roma_manager", "tolist"):
+            formatted = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in prediction.items()}
+        return {**formatted, "timings": dict(timings)}
 
     @staticmethod
-    def __preprocess(image_path: str) -> tuple[np.ndarray, int, int]:
+    def __preprocess(model: TinyRoMa, image: ImageInput) -> torch.Tensor:
         """
-        Preprocess the image by reading it from the given path.
-        :param image_path: str, path to the image file
-        :return: tuple[np.ndarray, int, int], the image as a numpy array and its height and width
+        Decode the image into a (1, 3, H, W) tensor on the model device.
+        :param model: TinyRoMa, the model the image is fed to
+        :param image: ImageInput, encoded bytes, an RGB array, a PIL image, a tensor or a file path
+        :return: torch.Tensor, the decoded image
         """
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Cannot read image from {image_path}")
-        h, w = img.shape[:2]
-        return img, h, w
+        if isinstance(image, (str, Path)):
+            img = cv2.imread(str(image), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f"Cannot read image from {image}")
+            image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return model.image_to_tensor(image)
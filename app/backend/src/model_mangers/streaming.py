@@ -0,0 +1,179 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypedDict, Union
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+_END = object()
+
+
+class StreamStats(TypedDict):
+    received: int
+    processed: int
+    dropped: int
+    errors: int
+    queued: int
+    avg_latency_ms: float
+    fps: float
+
+
+@dataclass
+class StreamResult:
+    seq: int
+    dropped: int
+    value: Any = None
+    error: Optional[str] = None
+
+
+class _Frame:
+    __slots__ = ("seq", "value", "error", "received_at")
+
+    def __init__(self, seq: int, value: Any):
+        self.seq = seq
+        self.value = value
+        self.error: Optional[str] = None
+        self.received_at = time.perf_counter()
+
+
+class FrameStream:
+    """
+    Pipelines a stream of frames through a fixed sequence of stages.
+    Each stage runs in its own task and hands frames to the next stage through a single-slot queue,
+    so while frame n runs the forward pass frame n+1 is being decoded and frame n-1 encoded.
+    Results come out in arrival order. Only the intake queue grows beyond one frame, it is bounded
+    by `queue_size` and a full intake is resolved by the drop policy:
+    - drop_oldest: discard the oldest queued frame, keeps latency low for live video
+    - drop_newest: discard the incoming frame
+    - block: stop accepting frames until there is room, pushing back on the sender
+    A slow consumer fills the single-slot queues back to the intake, so it degrades to a lower
+    frame rate instead of growing memory.
+    """
+
+    def __init__(self,
+                 stages: list[Callable[[Any], Any]],
+                 run: Union[Callable[..., Awaitable[Any]], list[Callable[..., Awaitable[Any]]]],
+                 queue_size: int = 2,
+                 policy: str = "drop_oldest"):
+        """
+        :param stages: list of blocking callables, each receives the output of the previous one
+        :param run: async callable(fn, arg) running a blocking stage off the event loop, e.g. InferenceExecutor.run,
+            or a list with one such callable per stage, so stages can run on different pools
+        :param queue_size: int, maximum number of frames waiting for the first stage
+        :param policy: str, one of DROP_POLICIES, applied when the intake queue is full
+        """
+        if not stages:
+            raise ValueError("At least one stage is required")
+        runs = run if isinstance(run, list) else [run] * len(stages)
+        if len(runs) != len(stages):
+            raise ValueError(f"Got {len(runs)} runners for {len(stages)} stages")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{policy}', expected one of {list(DROP_POLICIES)}")
+
+        self.policy = policy
+        self._queues = [asyncio.Queue(maxsize=queue_size)] + [asyncio.Queue(maxsize=1) for _ in stages]
+        self._tasks = [
+            asyncio.create_task(self._stage(fn, stage_run, src, dst))
+            for fn, stage_run, src, dst in zip(stages, runs, self._queues, self._queues[1:])
+        ]
+        self._finished = False
+
+        self._next_seq = 0
+        self._processed = 0
+        self._dropped = 0
+        self._errors = 0
+        self._latency = 0.0
+        self._started_at = time.perf_counter()
+
+    async def offer(self, value: Any) -> bool:
+        """
+        Hand a new frame to the pipeline, applying the drop policy if the intake queue is full.
+        :param value: Any, input of the first stage
+        :return: bool, False if the frame was dropped
+        """
+        if self._finished:
+            raise RuntimeError("Stream is finished")
+        frame = _Frame(self._next_seq, value)
+        self._next_seq += 1
+        intake = self._queues[0]
+
+        if self.policy == "block":
+            await intake.put(frame)
+            return True
+        if intake.full():
+            self._dropped += 1
+            if self.policy == "drop_newest":
+                return False
+            intake.get_nowait()
+        intake.put_nowait(frame)
+        return True
+
+    async def finish(self) -> None:
+        """
+        Stop accepting frames, the frames already accepted still come out of `results`.
+        """
+        if not self._finished:
+            self._finished = True
+            await self._queues[0].put(_END)
+
+    async def results(self) -> AsyncIterator[StreamResult]:
+        """
+        Yield the processed frames in arrival order until the stream is finished.
+        :return: AsyncIterator[StreamResult], the result or error of every frame that was not dropped
+        """
+        out = self._queues[-1]
+        while True:
+            frame = await out.get()
+            if frame is _END:
+                return
+            self._processed += 1
+            self._latency += time.perf_counter() - frame.received_at
+            if frame.error is not None:
+                self._errors += 1
+            yield StreamResult(frame.seq, self._dropped, frame.value if frame.error is None else None, frame.error)
+
+    async def close(self) -> None:
+        """
+        Cancel all stages, dropping the frames still in flight, and end `results`.
+        """
+        self._finished = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        out = self._queues[-1]
+        while not out.empty():
+            out.get_nowait()
+        out.put_nowait(_END)
+
+    def stats(self) -> StreamStats:
+        """
+        Returns frame counters, the average receive-to-result latency and the output frame rate.
+        :return: StreamStats, a dictionary containing the stream statistics
+        """
+        elapsed = time.perf_counter() - self._started_at
+        return {
+            "received": self._next_seq,
+            "processed": self._processed,
+            "dropped": self._dropped,
+            "errors": self._errors,
+            "queued": self._queues[0].qsize(),
+            "avg_latency_ms": 1000.0 * self._latency / self._processed if self._processed else 0.0,
+            "fps": self._processed / elapsed if elapsed > 0 else 0.0,
+        }
+
+    async def _stage(self, fn: Callable[[Any], Any], run: Callable[..., Awaitable[Any]],
+                     src: asyncio.Queue, dst: asyncio.Queue) -> None:
+        while True:
+            frame = await src.get()
+            if frame is not _END and frame.error is None:
+                try:
+                    frame.value = await run(fn, frame.value)
+                except ValueError as e:
+                    frame.error = str(e)
+                except Exception:
+                    frame.error = "Internal server error"
+            await dst.put(frame)
+            if frame is _END:
+                return
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+import asyncio
+from functools import partial
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Header, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-import numpy as np
-import cv2
+from fastapi.responses import Response
 
-from src.model_mangers.depth_manager import DepthManager
+from src.config import DEPTH_EXECUTION, DEPTH_STREAMING
+from src.model_mangers import registry
+from src.model_mangers.executor import InferenceExecutor
+from src.model_mangers.streaming import FrameStream
+from src.utils.metrics import timed
+from src.utils.serialization import DEPTH_FORMATS, UnsupportedFormat, encode_depth, encode_stream_frame, negotiate
 
 depth_router = APIRouter(prefix="/depth-anything-v2", tags=["model-depth"])
 
@@ -13,13 +20,22 @@ class DepthSelect(BaseModel):
     model_name: str
 
 
-depth_manager = DepthManager()
+depth_manager = registry.get_depth_manager()
+depth_executor = InferenceExecutor("depth-worker", workers=DEPTH_EXECUTION['workers'])
+# decoding and encoding of streamed frames, so streams only compete with /predict for forward passes
+stream_executor = InferenceExecutor("depth-stream", workers=DEPTH_STREAMING['workers'])
+depth_streams: set[FrameStream] = set()
+
+
+def _encode(depth_map, out_format: str):
+    with timed("depth_route", "encode"):
+        return encode_depth(depth_map, out_format)
 
 
 @depth_router.post("/select")
 async def select_model(req: DepthSelect):
     try:
-        spec = depth_manager.select_model(req.model_name)
+        spec = await depth_executor.run(depth_manager.select_model, req.model_name)
         return {"status": "ok", "current": spec}
     except (ValueError, FileNotFoundError) as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -38,21 +54,103 @@ async def current_model():
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@depth_router.get("/stats")
+async def stats():
+    try:
+        stats = depth_manager.get_stats()
+        stats["executor"] = depth_executor.stats()
+        stats["stream_executor"] = stream_executor.stats()
+        stats["streams"] = [stream.stats() for stream in depth_streams]
+        return {"status": "ok", "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @depth_router.post("/predict")
-async def predict_depth(file: UploadFile = File(...)):
+async def predict_depth(file: UploadFile = File(...),
+                        model_name: Optional[str] = Query(None),
+                        fmt: Optional[str] = Query(None, alias="format"),
+                        tiled: Optional[bool] = Query(None),
+                        accept: Optional[str] = Header(None)):
     try:
-        data = await file.read()
-        arr = np.frombuffer(data, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("Invalid image")
-        depth_map = depth_manager.predict(data, normalize=True)
-        return JSONResponse({
-            "height": depth_map.shape[0],
-            "width": depth_map.shape[1],
-            "depth": depth_map.tolist()
-        })
+        with timed("depth_route", "total"):
+            out_format = negotiate(DEPTH_FORMATS, accept=accept, fmt=fmt)
+            with timed("depth_route", "read"):
+                data = await file.read()
+            if not data:
+                raise ValueError("Invalid image")
+            # the worker thread only decodes and queues the image, the batch is awaited without holding it
+            pending = await depth_executor.run(depth_manager.submit, data, normalize=True, model_name=model_name,
+                                               tiled=tiled)
+            depth_map = await asyncio.wrap_future(pending)
+            body, media_type, headers = await depth_executor.run(_encode, depth_map, out_format)
+            return Response(content=body, media_type=media_type, headers=headers)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
     except (ValueError, FileNotFoundError) as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@depth_router.websocket("/stream")
+async def stream_depth(websocket: WebSocket,
+                       model_name: Optional[str] = Query(None),
+                       fmt: str = Query(DEPTH_STREAMING['format'], alias="format"),
+                       queue_size: int = Query(DEPTH_STREAMING['queue_size']),
+                       policy: str = Query(DEPTH_STREAMING['policy'])):
+    """
+    Streams depth maps for a sequence of encoded frames sent as binary messages.
+    Decoding, the forward pass and encoding of consecutive frames overlap, results are sent back
+    in order as binary messages (see `encode_stream_frame`). A text message "end" flushes the
+    frames in flight and closes the stream.
+    """
+    await websocket.accept()
+    try:
+        negotiate(DEPTH_FORMATS, fmt=fmt)
+        await depth_executor.run(depth_manager.get_model, model_name)
+        stream = FrameStream(
+            stages=[
+                partial(depth_manager.prepare_frame, model_name=model_name),
+                partial(depth_manager.infer_frame, normalize=True, model_name=model_name),
+                partial(encode_depth, fmt=fmt),
+            ],
+            run=[stream_executor.run, depth_executor.run, stream_executor.run],
+            queue_size=queue_size,
+            policy=policy,
+        )
+    except (ValueError, FileNotFoundError) as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    except Exception as e:
+        await websocket.close(code=1011, reason="Internal server error")
+        return
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await stream.close()
+                return
+            if message.get("bytes") is not None:
+                await stream.offer(message["bytes"])
+            elif message.get("text") == "end":
+                await stream.finish()
+                return
+
+    depth_streams.add(stream)
+    receiver = asyncio.create_task(receive())
+    try:
+        async for result in stream.results():
+            if result.error is not None:
+                await websocket.send_json({"seq": result.seq, "error": result.error})
+                continue
+            body, _, headers = result.value
+            await websocket.send_bytes(encode_stream_frame(result.seq, result.dropped, body, headers))
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        depth_streams.discard(stream)
+        receiver.cancel()
+        await stream.close()
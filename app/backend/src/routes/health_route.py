@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+
+from src.model_mangers import registry
+
+health_router = APIRouter(tags=["health"])
+
+
+@health_router.get("/health")
+async def health():
+    """
+    Answers as soon as the server is up, without waiting for models to load.
+    `ready` turns true once the background warmup has finished; `cold_starts` reports the load time
+    and memory of every model loaded so far.
+    """
+    try:
+        return {
+            "status": "ok",
+            "ready": registry.is_warm(),
+            "warmup": registry.warmup_status(),
+            "cold_starts": {
+                model_type: manager.cold_starts() for model_type, manager in registry.managers().items()
+            },
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+from src.routes import depth_route, roma_route
+from src.utils.metrics import (
+    COLD_START_MEMORY_BYTES, COLD_START_SECONDS, ENABLED, QUEUE_DEPTH, RESIDENT_BYTES, metrics
+)
+
+metrics_router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _collect_gauges():
+    """
+    Refresh the gauges derived from the managers and executors right before a scrape.
+    """
+    ENABLED.set(int(metrics.enabled))
+    RESIDENT_BYTES.clear()
+    for manager in (depth_route.depth_manager, roma_route.roma_manager):
+        for name, size in manager.pool_stats()["resident"].items():
+            RESIDENT_BYTES.set(size, f"{manager.model_type}/{name}")
+        for name, report in manager.cold_starts().items():
+            COLD_START_SECONDS.set(report["seconds"], f"{manager.model_type}/{name}")
+            if report["peak_memory_bytes"] is not None:
+                COLD_START_MEMORY_BYTES.set(report["peak_memory_bytes"], f"{manager.model_type}/{name}", report["device"])
+    QUEUE_DEPTH.set(depth_route.depth_executor.stats()["queued"], "depth")
+    QUEUE_DEPTH.set(roma_route.roma_executor.stats()["queued"], "roma")
+
+
+@metrics_router.get("/metrics")
+async def get_metrics():
+    try:
+        _collect_gauges()
+        return Response(content=metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,12 +1,15 @@
-import os
-import tempfile
+import json
+from typing import Optional
 
-from PIL import Image
-from fastapi import APIRouter, HTTPException, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, File, UploadFile, Query, Header
+from fastapi.responses import Response
 from pydantic import BaseModel
 
-from src.model_mangers.roma_manager import RomaManager
+from src.config import ROMA_EXECUTION
+from src.model_mangers import registry
+from src.model_mangers.executor import InferenceExecutor
+from src.utils.metrics import timed
+from src.utils.serialization import MATCH_FORMATS, UnsupportedFormat, decode_keypoints, encode_matches, negotiate
 
 roma_router = APIRouter(prefix="/tiny-roma", tags=["model-roma"])
 
@@ -15,13 +18,59 @@ class RomaSelect(BaseModel):
     model_name: str
 
 
-roma_manager = RomaManager()
+roma_manager = registry.get_roma_manager()
+roma_executor = InferenceExecutor("roma-worker", workers=ROMA_EXECUTION['workers'])
+
+
+def _geometry(estimator: Optional[str], max_iters: Optional[int], time_budget: Optional[float],
+              confidence: Optional[float], threshold: Optional[float], intrinsics: Optional[str]) -> dict:
+    """
+    Geometry parameters of a request from its query parameters, unset ones keep ROMA_GEOMETRY['default'].
+    :param intrinsics: str, JSON list of the 3x3 camera matrices of both images, needed by the 'E' estimator
+    :return: dict, the GeometryParams overrides
+    """
+    return {
+        "estimator": estimator,
+        "max_iters": max_iters,
+        "time_budget": time_budget,
+        "confidence": confidence,
+        "threshold": threshold,
+        "intrinsics": json.loads(intrinsics) if intrinsics else None,
+    }
+
+
+def _server_timing(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def _predict_and_encode(data1: bytes, data2: bytes, model_name: Optional[str], out_format: str, geometry: dict):
+    match_data = roma_manager.predict(data1, data2, as_numpy=True, model_name=model_name, geometry=geometry)
+    with timed("roma_route", "encode"):
+        body, media_type, headers = encode_matches(match_data, out_format)
+    if match_data.get("timings"):
+        headers = {**headers, "Server-Timing": _server_timing(match_data["timings"])}
+    return body, media_type, headers
+
+
+def _match_keypoints_and_encode(data1: bytes, data2: bytes, keypoints: bytes, model_name: Optional[str],
+                                out_format: str):
+    match_data = roma_manager.match_keypoints(data1, data2, decode_keypoints(keypoints), as_numpy=True,
+                                              model_name=model_name)
+    with timed("roma_route", "encode"):
+        body, media_type, headers = encode_matches(match_data, out_format)
+    if match_data.get("timings"):
+        headers = {**headers, "Server-Timing": _server_timing(match_data["timings"])}
+    return body, media_type, headers
+
+
+def _predict_many(query: bytes, references: list[bytes], model_name: Optional[str], geometry: dict):
+    return roma_manager.predict_many(query, references, model_name=model_name, geometry=geometry)
 
 
 @roma_router.post("/select")
 async def select_model(req: RomaSelect):
     try:
-        spec = roma_manager.select_model(req.model_name)
+        spec = await roma_executor.run(roma_manager.select_model, req.model_name)
         return {"status": "ok", "current": spec}
     except (ValueError, FileNotFoundError) as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -40,30 +89,92 @@ async def current_model():
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@roma_router.get("/stats")
+async def stats():
+    try:
+        stats = roma_manager.get_stats()
+        stats["executor"] = roma_executor.stats()
+        return {"status": "ok", "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @roma_router.post("/predict")
-async def predict_roma(file1: UploadFile = File(...), file2: UploadFile = File(...)):
-    path1 = path2 = None
+async def predict_roma(file1: UploadFile = File(...), file2: UploadFile = File(...),
+                       model_name: Optional[str] = Query(None),
+                       fmt: Optional[str] = Query(None, alias="format"),
+                       accept: Optional[str] = Header(None),
+                       estimator: Optional[str] = Query(None), max_iters: Optional[int] = Query(None),
+                       time_budget: Optional[float] = Query(None), confidence: Optional[float] = Query(None),
+                       threshold: Optional[float] = Query(None), intrinsics: Optional[str] = Query(None)):
+    try:
+        with timed("roma_route", "total"):
+            out_format = negotiate(MATCH_FORMATS, accept=accept, fmt=fmt)
+            geometry = _geometry(estimator, max_iters, time_budget, confidence, threshold, intrinsics)
+            with timed("roma_route", "read"):
+                data1 = await file1.read()
+                data2 = await file2.read()
+            if not data1 or not data2:
+                raise ValueError("Invalid image(s)")
+
+            body, media_type, headers = await roma_executor.run(_predict_and_encode, data1, data2, model_name, out_format,
+                                                                geometry)
+            return Response(content=body, media_type=media_type, headers=headers)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@roma_router.post("/predict-many")
+async def predict_roma_many(query: UploadFile = File(...), references: list[UploadFile] = File(...),
+                            model_name: Optional[str] = Query(None),
+                            estimator: Optional[str] = Query(None), max_iters: Optional[int] = Query(None),
+                            time_budget: Optional[float] = Query(None), confidence: Optional[float] = Query(None),
+                            threshold: Optional[float] = Query(None), intrinsics: Optional[str] = Query(None)):
+    try:
+        with timed("roma_route", "total"):
+            geometry = _geometry(estimator, max_iters, time_budget, confidence, threshold, intrinsics)
+            with timed("roma_route", "read"):
+                data = await query.read()
+                refs = [await ref.read() for ref in references]
+            if not data or not refs or not all(refs):
+                raise ValueError("Invalid image(s)")
+
+            results = await roma_executor.run(_predict_many, data, refs, model_name, geometry)
+            return {"status": "ok", "results": results}
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@roma_router.post("/match-keypoints")
+async def match_keypoints(file1: UploadFile = File(...), file2: UploadFile = File(...),
+                          keypoints: UploadFile = File(...),
+                          model_name: Optional[str] = Query(None),
+                          fmt: Optional[str] = Query(None, alias="format"),
+                          accept: Optional[str] = Header(None)):
     try:
-        try:
-            img1 = Image.open(file1.file).convert("RGB")
-            img2 = Image.open(file2.file).convert("RGB")
-        except Exception:
-            raise ValueError("Invalid image(s)")
-
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f1, \
-                tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f2:
-            img1.save(f1.name, format="JPEG")
-            img2.save(f2.name, format="JPEG")
-            path1, path2 = f1.name, f2.name
-
-        match_data = roma_manager.predict(path1, path2)
-        return JSONResponse(match_data)
+        with timed("roma_route", "total"):
+            out_format = negotiate(MATCH_FORMATS, accept=accept, fmt=fmt)
+            with timed("roma_route", "read"):
+                data1 = await file1.read()
+                data2 = await file2.read()
+                points = await keypoints.read()
+            if not data1 or not data2:
+                raise ValueError("Invalid image(s)")
+            if not points:
+                raise ValueError("No keypoints")
+
+            body, media_type, headers = await roma_executor.run(_match_keypoints_and_encode, data1, data2, points,
+                                                                model_name, out_format)
+            return Response(content=body, media_type=media_type, headers=headers)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
     except (ValueError, FileNotFoundError) as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        if path1 and os.path.exists(path1):
-            os.remove(path1)
-        if path2 and os.path.exists(path2):
-            os.remove(path2)
\ No newline at end of file
@@ -22,6 +22,9 @@ from .dinov2_layers import Mlp, PatchEmbed, SwiGLUFFNFused, MemEffAttention, Nes
 
 logger = logging.getLogger("dinov2")
 
+# Interpolated position embeddings kept per input resolution, see `interpolate_pos_encoding`.
+POS_EMBED_CACHE_SIZE = 16
+
 
 def named_apply(fn: Callable, module: nn.Module, name="", depth_first=True, include_root=False) -> nn.Module:
     if not depth_first and include_root:
@@ -102,6 +105,7 @@ class DinoVisionTransformer(nn.Module):
         self.num_register_tokens = num_register_tokens
         self.interpolate_antialias = interpolate_antialias
         self.interpolate_offset = interpolate_offset
+        self._pos_embed_cache = {}
 
         self.patch_embed = embed_layer(img_size=img_size, patch_size=patch_size, in_chans=in_chans, embed_dim=embed_dim)
         num_patches = self.patch_embed.num_patches
@@ -182,6 +186,25 @@ class DinoVisionTransformer(nn.Module):
         N = self.pos_embed.shape[1] - 1
         if npatch == N and w == h:
             return self.pos_embed
+        key = None
+        if not torch.is_grad_enabled() and not torch.compiler.is_compiling():
+            # The interpolation only depends on the input resolution: reuse it while the embedding is
+            # unchanged, its version counter increases with every in-place update (e.g. load_state_dict).
+            # Graphs being exported trace the interpolation instead of baking in a cached tensor.
+            key = (w, h, previous_dtype, self.pos_embed.data_ptr(), self.pos_embed._version)
+            cached = self._pos_embed_cache.get(key)
+            if cached is not None:
+                return cached
+        pos_embed = self._interpolate_pos_embed(x, w, h)
+        if key is not None:
+            if len(self._pos_embed_cache) >= POS_EMBED_CACHE_SIZE:
+                self._pos_embed_cache.pop(next(iter(self._pos_embed_cache)))
+            self._pos_embed_cache[key] = pos_embed
+        return pos_embed
+
+    def _interpolate_pos_embed(self, x, w, h):
+        previous_dtype = x.dtype
+        N = self.pos_embed.shape[1] - 1
         pos_embed = self.pos_embed.float()
         class_pos_embed = pos_embed[:, 0]
         patch_pos_embed = pos_embed[:, 1:]
@@ -1,4 +1,7 @@
+from functools import lru_cache
+
 import cv2
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -7,6 +10,62 @@ from torchvision.transforms import Compose
 from .dinov2 import DINOv2
 from .util.blocks import FeatureFusionBlock, _make_scratch
 from .util.transform import Resize, NormalizeImage, PrepareForNet
+from src.utils.metrics import timed
+
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+@lru_cache(maxsize=None)
+def _cached_resize_transform(input_size):
+    return Resize(
+        width=input_size,
+        height=input_size,
+        resize_target=False,
+        keep_aspect_ratio=True,
+        ensure_multiple_of=14,
+        resize_method='lower_bound',
+        image_interpolation_method=cv2.INTER_CUBIC,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _cached_input_shape(h, w, input_size):
+    new_w, new_h = _cached_resize_transform(input_size).get_size(w, h)
+    return int(new_h), int(new_w)
+
+
+@lru_cache(maxsize=None)
+def _normalization(device, dtype):
+    """
+    Scale and bias mapping uint8 RGB values to the normalized network input, x * scale + bias.
+    """
+    std = torch.tensor(STD, dtype=torch.float64).view(1, 3, 1, 1)
+    mean = torch.tensor(MEAN, dtype=torch.float64).view(1, 3, 1, 1)
+    return (1.0 / (255.0 * std)).to(device, dtype), (-mean / std).to(device, dtype)
+
+
+def _to_input(raw_images, size, device, dtype):
+    """
+    Convert BGR uint8 images of the same size into the normalized (B, 3, h, w) network input on `device`.
+    On GPUs the uint8 pixels are uploaded and resized there in float32. On CPU OpenCV's float32 bicubic
+    resize (the same kernel) is several times faster than torch's, so only the resized pixels reach torch.
+    """
+    resize = tuple(raw_images[0].shape[:2]) != tuple(size)
+    if device.type == "cpu":
+        if resize:
+            raw_images = [cv2.resize(raw_image.astype(np.float32), size[::-1], interpolation=cv2.INTER_CUBIC)
+                          for raw_image in raw_images]
+        batch = np.stack(raw_images) if len(raw_images) > 1 else raw_images[0][None]
+        x = torch.from_numpy(np.ascontiguousarray(batch)).permute(0, 3, 1, 2).float()
+    else:
+        batch = np.stack(raw_images) if len(raw_images) > 1 else raw_images[0][None]
+        x = torch.from_numpy(np.ascontiguousarray(batch)).to(device).permute(0, 3, 1, 2).float()
+        if resize:
+            x = F.interpolate(x, size, mode="bicubic", align_corners=False)
+    scale, bias = _normalization(device, torch.float32)
+    return torch.addcmul(bias, x.flip(1), scale).to(dtype).contiguous()
 
 
 def _make_fusion_block(features, use_bn, size=None):
@@ -176,35 +235,97 @@ class DepthAnythingV2(nn.Module):
     def forward(self, x):
         patch_h, patch_w = x.shape[-2] // 14, x.shape[-1] // 14
         
-        features = self.pretrained.get_intermediate_layers(x, self.intermediate_layer_idx[self.encoder], return_class_token=True)
+        with timed("depth_anything_v2", "encoder", sync=True):
+            features = self.pretrained.get_intermediate_layers(x, self.intermediate_layer_idx[self.encoder], return_class_token=True)
         
-        depth = self.depth_head(features, patch_h, patch_w)
-        depth = F.relu(depth)
+        with timed("depth_anything_v2", "head", sync=True):
+            depth = self.depth_head(features, patch_h, patch_w)
+            depth = F.relu(depth)
         
         return depth.squeeze(1)
     
     @torch.no_grad()
     def infer_image(self, raw_image, input_size=518):
-        image, (h, w) = self.image2tensor(raw_image, input_size)
+        with timed("depth_anything_v2", "image2tensor"):
+            image, (h, w) = self.image2tensor(raw_image, input_size)
         
+        return self.infer_tensor(image, (h, w))
+    
+    @torch.no_grad()
+    def infer_tensor(self, image, size):
+        """
+        Run the forward pass on an input prepared by `image2tensor` and resize the
+        depth map back to the original (h, w) size.
+        """
         depth = self.forward(image)
         
-        depth = F.interpolate(depth[:, None], (h, w), mode="bilinear", align_corners=True)[0, 0]
+        with timed("depth_anything_v2", "interpolate", sync=True):
+            depth = F.interpolate(depth[:, None], size, mode="bilinear", align_corners=True)[0, 0]
+            
+            return depth.float().cpu().numpy()
+    
+    @torch.no_grad()
+    def infer_batch(self, raw_images, input_size=518):
+        """
+        Run a single forward pass over several images that share the same network input shape
+        (see `input_shape`) and return one depth map per image at its original resolution.
+        """
+        with timed("depth_anything_v2", "image2tensor"):
+            images, sizes = self.images2tensor(raw_images, input_size)
+        
+        depth = self.forward(images)
+        
+        with timed("depth_anything_v2", "interpolate", sync=True):
+            return [
+                F.interpolate(depth[i:i + 1, None], (h, w), mode="bilinear", align_corners=True)[0, 0].float().cpu().numpy()
+                for i, (h, w) in enumerate(sizes)
+            ]
+    
+    @staticmethod
+    def input_shape(h, w, input_size=518):
+        """Network input (height, width) that `image2tensor` resizes an h x w image to."""
+        return _cached_input_shape(int(h), int(w), input_size)
+    
+    @staticmethod
+    def _resize_transform(input_size=518):
+        return _cached_resize_transform(input_size)
+    
+    def image2tensor(self, raw_image, input_size=518, dtype=torch.float32):
+        """
+        Convert a BGR uint8 image into the normalized network input on the model device.
+        The image is converted straight from uint8 to float32 (float64 NumPy intermediates are avoided),
+        resized and normalized on the target device; the network input shape and the normalization
+        constants are cached per resolution.
+        """
+        images, sizes = self.images2tensor([raw_image], input_size, dtype)
+        return images, sizes[0]
+    
+    def images2tensor(self, raw_images, input_size=518, dtype=torch.float32):
+        """
+        Batched `image2tensor` for images that resize to the same network input shape.
+        Images of the same size are uploaded as a single tensor and resized in one call on GPUs.
+        Returns the (B, 3, H, W) input and the original (h, w) size of every image.
+        """
+        sizes = [tuple(raw_image.shape[:2]) for raw_image in raw_images]
+        shapes = {self.input_shape(h, w, input_size) for h, w in sizes}
+        if len(shapes) != 1:
+            raise ValueError("All images in a batch must resize to the same input shape")
+        shape = shapes.pop()
+        device = next(self.parameters()).device
         
-        return depth.cpu().numpy()
+        if len(set(sizes)) == 1:
+            images = _to_input(list(raw_images), shape, device, dtype)
+        else:
+            images = torch.cat([_to_input([raw_image], shape, device, dtype) for raw_image in raw_images])
+        return images, sizes
     
-    def image2tensor(self, raw_image, input_size=518):        
+    def image2tensor_numpy(self, raw_image, input_size=518):
+        """
+        Original NumPy/OpenCV preprocessing, kept as the reference for `image2tensor`.
+        """
         transform = Compose([
-            Resize(
-                width=input_size,
-                height=input_size,
-                resize_target=False,
-                keep_aspect_ratio=True,
-                ensure_multiple_of=14,
-                resize_method='lower_bound',
-                image_interpolation_method=cv2.INTER_CUBIC,
-            ),
-            NormalizeImage(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+            self._resize_transform(input_size),
+            NormalizeImage(mean=MEAN, std=STD),
             PrepareForNet(),
         ])
         
@@ -10,7 +10,7 @@ from warnings import warn
 from PIL import Image
 
 from src.third_party.romatch.utils import get_tuple_transform_ops
-from src.third_party.romatch.utils.local_correlation import local_correlation
+from src.third_party.romatch.utils.local_correlation import batched_local_correlation
 from src.third_party.romatch.utils.utils import check_rgb, cls_to_flow_refine, get_autocast_params, check_not_i16
 from src.third_party.romatch.utils.kde import kde
 
@@ -38,6 +38,7 @@ class ConvRefiner(nn.Module):
         norm_type = nn.BatchNorm2d,
         bn_momentum = 0.1,
         amp_dtype = torch.float16,
+        local_corr_max_bytes = 256 * 1024 ** 2,
     ):
         super().__init__()
         self.bn_momentum = bn_momentum
@@ -73,6 +74,7 @@ class ConvRefiner(nn.Module):
         self.is_classifier = is_classifier
         self.sample_mode = sample_mode
         self.amp_dtype = amp_dtype
+        self.local_corr_max_bytes = local_corr_max_bytes
         
     def create_block(
         self,
@@ -121,8 +123,8 @@ class ConvRefiner(nn.Module):
                 if self.local_corr_radius:
                     if self.corr_in_other:
                         # Corr in other means take a kxk grid around the predicted coordinate in other image
-                        local_corr = local_correlation(x,y,local_radius=self.local_corr_radius,flow = flow, 
-                                                       sample_mode = self.sample_mode)
+                        local_corr = batched_local_correlation(x,y,local_radius=self.local_corr_radius,flow = flow, 
+                                                       sample_mode = self.sample_mode, max_bytes = self.local_corr_max_bytes)
                     else:
                         raise NotImplementedError("Local corr in own frame should not be used.")
                     if self.no_im_B_fm:
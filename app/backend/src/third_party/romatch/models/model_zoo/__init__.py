@@ -1,6 +1,8 @@
 from typing import Union
 import torch
 from .roma_models import roma_model, tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.artifact_store import artifact_store
 
 weight_urls = {
     "romatch": {
@@ -14,16 +16,12 @@ weight_urls = {
 }
 
 def tiny_roma_v1_outdoor(device, weights = None, xfeat = None):
+    # Built offline: the weights come from the local artifact store and XFeat from the vendored
+    # definition, its weights are part of the Tiny RoMa state dict.
     if weights is None:
-        weights = torch.hub.load_state_dict_from_url(
-            weight_urls["tiny_roma_v1"]["outdoor"],
-            map_location=device)
+        weights = torch.load(artifact_store.path("tiny_roma_v1_outdoor"), map_location=device)
     if xfeat is None:
-        xfeat = torch.hub.load(
-            'verlab/accelerated_features', 
-            'XFeat', 
-            pretrained = True, 
-            top_k = 4096).net
+        xfeat = XFeatModel()
 
     return tiny_roma_v1_model(weights = weights, xfeat = xfeat).to(device) 
 
@@ -1,16 +1,44 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import functools
 import os
 import torch
 from pathlib import Path
 import math
+import cv2
 import numpy as np
 
 from torch import nn
 from PIL import Image
 from torchvision.transforms import ToTensor
-from src.third_party.romatch.utils.kde import kde
+from src.third_party.romatch.utils.kde import KDE_MODES, grid_kde, hash_kde, kde
+from src.utils.metrics import timed
+
+@functools.lru_cache(maxsize=32)
+def _normalized_grid(h, w, margin_h, margin_w, device):
+    """
+        Normalized (x, y) coordinates of an h x w grid spanning [-1 + margin, 1 - margin], cached per shape and device.
+        Callers must not modify the returned tensor in place.
+        return:
+            grid -> torch.Tensor(h, w, 2)
+    """
+    return torch.stack(
+        torch.meshgrid(
+            torch.linspace(-1+margin_w,1-margin_w, w),
+            torch.linspace(-1+margin_h,1-margin_h, h),
+            indexing = "xy"),
+        dim = -1).float().to(device)
+
+
+def pixel_grid(h, w, device):
+    """
+        Normalized coordinates of the pixel centres of an h x w image (align_corners=False), cached.
+        return:
+            grid -> torch.Tensor(h, w, 2)
+    """
+    return _normalized_grid(h, w, 1/h, 1/w, torch.device(device))
+
 
 class BasicLayer(nn.Module):
     """
@@ -37,7 +65,9 @@ class TinyRoMa(nn.Module):
                  freeze_xfeat = True, 
                  sample_mode = "threshold_balanced", 
                  symmetric = False, 
-                 exact_softmax = False):
+                 exact_softmax = False,
+                 kde_mode = "exact",
+                 corr_max_bytes = None):
         super().__init__()
         del xfeat.heatmap_head, xfeat.keypoint_head, xfeat.fine_matcher
         if freeze_xfeat:
@@ -64,6 +94,8 @@ class TinyRoMa(nn.Module):
         self.sample_thresh = 0.05
         self.symmetric = symmetric
         self.exact_softmax = exact_softmax
+        self.kde_mode = kde_mode
+        self.corr_max_bytes = corr_max_bytes
     
     @property
     def device(self):
@@ -114,25 +146,16 @@ class TinyRoMa(nn.Module):
     
     def pos_embed(self, corr_volume: torch.Tensor):
         B, H1, W1, H0, W0 = corr_volume.shape 
-        grid = torch.stack(
-                torch.meshgrid(
-                    torch.linspace(-1+1/W1,1-1/W1, W1), 
-                    torch.linspace(-1+1/H1,1-1/H1, H1), 
-                    indexing = "xy"), 
-                dim = -1).float().to(corr_volume).reshape(H1*W1, 2)
+        grid = pixel_grid(H1, W1, corr_volume.device).to(corr_volume.dtype).reshape(H1*W1, 2)
         down = 4
         if not self.training and not self.exact_softmax:
-            grid_lr = torch.stack(
-                torch.meshgrid(
-                    torch.linspace(-1+down/W1,1-down/W1, W1//down), 
-                    torch.linspace(-1+down/H1,1-down/H1, H1//down), 
-                    indexing = "xy"), 
-                dim = -1).float().to(corr_volume).reshape(H1*W1 //down**2, 2)
+            grid_lr = _normalized_grid(H1//down, W1//down, down/H1, down/W1, corr_volume.device)
+            grid_lr = grid_lr.to(corr_volume.dtype).reshape(H1*W1 //down**2, 2)
             cv = corr_volume
             best_match = cv.reshape(B,H1*W1,H0,W0).argmax(dim=1) # B, HW, H, W
             P_lowres = torch.cat((cv[:,::down,::down].reshape(B,H1*W1 // down**2,H0,W0), best_match[:,None]),dim=1).softmax(dim=1)
             pos_embeddings = torch.einsum('bchw,cd->bdhw', P_lowres[:,:-1], grid_lr)
-            pos_embeddings += P_lowres[:,-1] * grid[best_match].permute(0,3,1,2)
+            pos_embeddings += P_lowres[:,-1:] * grid[best_match].permute(0,3,1,2)
             #print("hej")
         else:
             P = corr_volume.reshape(B,H1*W1,H0,W0).softmax(dim=1) # B, HW, H, W
@@ -175,6 +198,28 @@ class TinyRoMa(nn.Module):
             tensor_to_pil(vis_im, unnormalize=unnormalize).save(save_path)
         return vis_im
      
+    def chunked_pos_embed(self, feat0, feat1, max_bytes):
+        """
+            Same as `pos_embed(corr_volume(feat0, feat1))` without holding the whole correlation volume: the softmax
+            runs over the positions of the second image, so the rows of the first image are independent and are
+            correlated and embedded a chunk at a time.
+            input:
+                feat0 -> torch.Tensor(B, C, H0, W0)
+                feat1 -> torch.Tensor(B, C, H1, W1)
+                max_bytes -> memory ceiling of a chunk of the volume and its softmax, at least one row is processed
+            return:
+                pos_embeddings -> torch.Tensor(B, 2, H0, W0)
+        """
+        B, C, H0, W0 = feat0.shape
+        B, C, H1, W1 = feat1.shape
+        # the volume chunk and the softmax of the same size (the low-res softmax of the fast path is smaller)
+        row_bytes = 2 * B * H1 * W1 * W0 * feat0.element_size()
+        rows = max(1, max_bytes // row_bytes)
+        return torch.cat([
+            self.pos_embed(self.corr_volume(feat0[:, :, start:start + rows], feat1))
+            for start in range(0, H0, rows)
+        ], dim=2)
+
     def corr_volume(self, feat0, feat1):
         """
             input:
@@ -197,47 +242,222 @@ class TinyRoMa(nn.Module):
         im1 = ToTensor()(Image.open(im1_path))[None].to(device)
         return self.match(im0, im1, batched = False)
     
+    def image_to_tensor(self, im):
+        """
+            Decode a single in-memory image into a (1, 3, H, W) float tensor in [0, 1] on the model device.
+            input:
+                im -> encoded image bytes, np.ndarray(H, W, 3) uint8 RGB, PIL.Image or torch.Tensor(3, H, W)
+        """
+        device = self.device
+        if isinstance(im, (bytes, bytearray, memoryview)):
+            bgr = cv2.imdecode(np.frombuffer(im, np.uint8), cv2.IMREAD_COLOR)
+            if bgr is None:
+                raise ValueError("Cannot decode image")
+            im = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        elif isinstance(im, Image.Image):
+            im = np.array(im.convert("RGB"))
+        if isinstance(im, np.ndarray):
+            if im.ndim != 3 or im.shape[2] != 3:
+                raise ValueError(f"Expected an HxWx3 RGB image, got shape {im.shape}")
+            x = torch.from_numpy(np.ascontiguousarray(im)).to(device).permute(2, 0, 1)
+            x = x.float() / 255 if x.dtype == torch.uint8 else x.float()
+            return x[None]
+        if isinstance(im, torch.Tensor):
+            x = im.to(device)
+            x = x.float() / 255 if x.dtype == torch.uint8 else x.float()
+            return x[None] if x.dim() == 3 else x
+        raise TypeError(f"Unsupported image type: {type(im).__name__}")
+    
     @torch.inference_mode()
-    def match(self, im0, im1, *args, batched = True):
+    def match(self, im0, im1, *args, batched = True, resolution = None, num_points = None):
+        """
+            Dense warp and certainty from the first to the second images.
+            input:
+                resolution -> (H, W) of the returned warp, the size of im0 if None, "native" for the resolution of
+                              the fine flow (a quarter of the resized input)
+                num_points -> sparse mode, return the warp at `num_points` points of the first images drawn by
+                              certainty instead of a dense warp (see `sample_points`)
+            return:
+                warp -> torch.Tensor(B, H, W, 4) or (B, num_points, 4), certainty -> torch.Tensor(B, H, W) or
+                        (B, num_points), without the batch dimension unless batched
+        """
         # stupid
         if isinstance(im0, (str, Path)):
             return self.match_from_path(im0, im1)
-        elif isinstance(im0, Image.Image):
+        elif isinstance(im0, (Image.Image, np.ndarray, bytes, bytearray, memoryview)):
             batched = False
-            device = self.device
-            im0 = ToTensor()(im0)[None].to(device)
-            im1 = ToTensor()(im1)[None].to(device)
+            im0 = self.image_to_tensor(im0)
+            im1 = self.image_to_tensor(im1)
  
         B,C,H0,W0 = im0.shape
         B,C,H1,W1 = im1.shape
         self.train(False)
         corresps = self.forward({"im_A":im0, "im_B":im1})
         #return 1,1
-        flow = F.interpolate(
-            corresps[4]["flow"], 
-            size = (H0, W0), 
-            mode = "bilinear", align_corners = False).permute(0,2,3,1).reshape(B,H0,W0,2)
-        grid = torch.stack(
-            torch.meshgrid(
-                torch.linspace(-1+1/W0,1-1/W0, W0), 
-                torch.linspace(-1+1/H0,1-1/H0, H0), 
-                indexing = "xy"), 
-            dim = -1).float().to(flow.device).expand(B, H0, W0, 2)
-        
-        certainty = F.interpolate(corresps[4]["certainty"], size = (H0,W0), mode = "bilinear", align_corners = False)
-        warp, cert = torch.cat((grid, flow), dim = -1), certainty[:,0].sigmoid()
+        warp, cert = self.read_warp(corresps[4], H0, W0, resolution, num_points)
         if batched:
             return warp, cert
         else:
             return warp[0], cert[0]
 
+    @torch.inference_mode()
+    def match_points(self, im0, im1, points):
+        """
+            Correspondences in the second images of given points of the first ones, read off the finest flow with
+            `warp_at`: neither the dense warp nor the sampling are computed, the cost of the points is negligible.
+            input:
+                im0, im1 -> torch.Tensor(B, C, H, W)
+                points -> torch.Tensor(B, N, 2) normalized coordinates in the first images
+            return:
+                warp -> torch.Tensor(B, N, 4), certainty -> torch.Tensor(B, N)
+        """
+        self.train(False)
+        corresps = self.forward({"im_A":im0, "im_B":im1})
+        return self.warp_at(corresps[4], points)
+
+    def read_warp(self, corresps, H0, W0, resolution = None, num_points = None):
+        """
+            The dense warp at the requested resolution, or the warp at `num_points` sampled points (see `match`).
+        """
+        if num_points is not None:
+            return self.sample_points(corresps, num_points)
+        if resolution is None:
+            resolution = (H0, W0)
+        elif resolution == "native":
+            resolution = tuple(corresps["flow"].shape[-2:])
+        return self.upsample_warp(corresps, *resolution)
+
+    def upsample_warp(self, corresps, H0, W0):
+        """
+            Dense warp and certainty at the resolution of the first images from the finest correspondences.
+            input:
+                corresps -> {"flow": torch.Tensor(B, 2, h, w), "certainty": torch.Tensor(B, 1, h, w)}
+            return:
+                warp -> torch.Tensor(B, H0, W0, 4), certainty -> torch.Tensor(B, H0, W0)
+        """
+        B = corresps["flow"].shape[0]
+        with timed("tiny_roma", "upsample", sync=True):
+            flow = F.interpolate(
+                corresps["flow"], 
+                size = (H0, W0), 
+                mode = "bilinear", align_corners = False).permute(0,2,3,1).reshape(B,H0,W0,2)
+            grid = pixel_grid(H0, W0, flow.device).to(flow.dtype).expand(B, H0, W0, 2)
+        
+            certainty = F.interpolate(corresps["certainty"], size = (H0,W0), mode = "bilinear", align_corners = False)
+            return torch.cat((grid, flow), dim = -1), certainty[:,0].sigmoid()
+
+    def warp_at(self, corresps, points):
+        """
+            Warp and certainty at arbitrary points of the first images, read off the flow and certainty logits with
+            `grid_sample`. These are the values of the upsampled dense warp at the same points, without upsampling.
+            input:
+                corresps -> {"flow": torch.Tensor(B, 2, h, w), "certainty": torch.Tensor(B, 1, h, w)}
+                points -> torch.Tensor(B, N, 2) normalized coordinates in the first images
+            return:
+                warp -> torch.Tensor(B, N, 4), certainty -> torch.Tensor(B, N)
+        """
+        flow = corresps["flow"]
+        # border padding clamps like the bilinear upsampling does at the image edges
+        grid = points[:, None].to(flow.dtype)
+        flow = F.grid_sample(flow, grid, mode = "bilinear", padding_mode = "border", align_corners = False)
+        certainty = F.grid_sample(corresps["certainty"], grid, mode = "bilinear", padding_mode = "border",
+                                  align_corners = False)
+        return torch.cat((grid[:, 0], flow[:, :, 0].permute(0, 2, 1)), dim = -1), certainty[:, 0, 0].sigmoid()
+
+    def sample_points(self, corresps, num_points, max_rounds = 16):
+        """
+            Draw points of the first images with a density proportional to the certainty of the upsampled warp
+            (after the threshold of the "threshold" sample modes), as `sample` draws pixels of the dense warp, and
+            return the warp at those points. Rejection sampling: a cell of the fine flow is proposed proportionally
+            to the highest certainty around it, which bounds the certainty anywhere in the cell, a point is drawn
+            uniformly in the cell and accepted with probability certainty / bound.
+            input:
+                corresps -> {"flow": torch.Tensor(B, 2, h, w), "certainty": torch.Tensor(B, 1, h, w)}
+                num_points -> points per image
+            return:
+                warp -> torch.Tensor(B, num_points, 4), certainty -> torch.Tensor(B, num_points)
+        """
+        logits = corresps["certainty"].float()
+        B, _, h, w = logits.shape
+        weights = self._sample_weights(logits[:, 0].sigmoid())
+        bounds = F.max_pool2d(weights[:, None], 3, stride = 1, padding = 1).reshape(B, h*w)
+        scale = torch.tensor((2/w, 2/h), device = logits.device)
+        points = []
+        with timed("tiny_roma", "sample_points", sync=True):
+            for b in range(B):
+                chunks, missing = [], num_points
+                for attempt in range(max_rounds):
+                    proposals = 2 * missing
+                    cells = torch.multinomial(bounds[b], proposals, replacement = True)
+                    xy = torch.stack((cells % w, cells // w), dim = -1) + torch.rand(proposals, 2, device = logits.device)
+                    p = xy * scale - 1
+                    certainty = F.grid_sample(logits[b:b+1], p[None, None], mode = "bilinear", padding_mode = "border",
+                                              align_corners = False)[0, 0, 0].sigmoid()
+                    accepted = torch.rand(proposals, device = logits.device) * bounds[b, cells] <= self._sample_weights(certainty)
+                    if attempt == max_rounds - 1:
+                        # practically never reached, keep the last proposals rather than returning fewer points
+                        accepted = torch.cat((p[accepted], p[~accepted]))
+                    else:
+                        accepted = p[accepted]
+                    chunks.append(accepted[:missing])
+                    missing -= len(chunks[-1])
+                    if missing == 0:
+                        break
+                points.append(torch.cat(chunks))
+        return self.warp_at(corresps, torch.stack(points))
+
+    def _sample_weights(self, certainty):
+        if "threshold" in self.sample_mode:
+            certainty = torch.where(certainty > self.sample_thresh, torch.ones_like(certainty), certainty)
+        return certainty
+
+    @torch.inference_mode()
+    def encode(self, im):
+        """
+            XFeat features of a batch of images, resized to a multiple of 32 as in `forward`.
+            input:
+                im -> torch.Tensor(B, C, H, W)
+            return:
+                (fine features, coarse features, (H, W) size the images were resized to)
+        """
+        im, _, _ = self.preprocess_tensor(im)
+        with timed("tiny_roma", "features", sync=True):
+            feats_f, feats_c = self.forward_single(im)
+        return feats_f, feats_c, tuple(im.shape[-2:])
+
+    @torch.inference_mode()
+    def match_many(self, feats0, feats1, H0, W0, num_points = None, resolution = None):
+        """
+            Match one image against a batch of images from their features (see `encode`), without re-encoding either.
+            input:
+                feats0 -> features of the first image (batch of 1), expanded to the batch of feats1
+                feats1 -> features of B second images sharing the same size
+                num_points, resolution -> as in `match`
+            return:
+                warp -> torch.Tensor(B, H0, W0, 4), certainty -> torch.Tensor(B, H0, W0), see `match`
+        """
+        self.train(False)
+        B = feats1[0].shape[0]
+        feats0 = (feats0[0].expand(B, -1, -1, -1), feats0[1].expand(B, -1, -1, -1))
+        corresps = self.forward_features(feats0, feats1, feats1[2])
+        return self.read_warp(corresps[4], H0, W0, resolution, num_points)
+
     def sample(
         self,
         matches,
         certainty,
         num=5_000,
+        kde_mode=None,
     ):
-        H,W,_ = matches.shape
+        """
+            Sample matches by certainty, balanced by the density of the matches for the "balanced" sample modes.
+            kde_mode -> density estimator of the balancing, "exact" (dense kernel sums), "grid" (binned, see
+                        `grid_kde`) or "hash" (neighbouring cells only, see `hash_kde`), self.kde_mode if None
+        """
+        kde_mode = kde_mode or self.kde_mode
+        if kde_mode not in KDE_MODES:
+            raise ValueError(f"Unsupported kde mode '{kde_mode}', expected one of {KDE_MODES}")
+        # dense (H, W, 4) warps and sparse (N, 4) ones (see `sample_points`) are sampled alike
         if "threshold" in self.sample_mode:
             upper_thresh = self.sample_thresh
             certainty = certainty.clone()
@@ -255,7 +475,12 @@ class TinyRoMa(nn.Module):
             return good_matches, good_certainty 
         use_half = True if matches.device.type == "cuda" else False
         down = 1 if matches.device.type == "cuda" else 8
-        density = kde(good_matches, std=0.1, half = use_half, down = down)
+        if kde_mode == "exact":
+            density = kde(good_matches, std=0.1, half = use_half, down = down)
+        else:
+            # the exact estimate sums over every `down`-th match only, keep the scale its thresholds assume
+            estimator = grid_kde if kde_mode == "grid" else hash_kde
+            density = estimator(good_matches, std=0.1) / down
         p = 1 / (density+1)
         p[density < 10] = 1e-7 # Basically should have at least 10 perfect neighbours, or around 100 ok ones
         balanced_samples = torch.multinomial(p, 
@@ -273,32 +498,52 @@ class TinyRoMa(nn.Module):
         """
         im0 = batch["im_A"]
         im1 = batch["im_B"]
-        corresps = {}
         im0, rh0, rw0 = self.preprocess_tensor(im0)
         im1, rh1, rw1 = self.preprocess_tensor(im1)
-        B, C, H0, W0 = im0.shape
-        B, C, H1, W1 = im1.shape
-        to_normalized = torch.tensor((2/W1, 2/H1, 1)).to(im0.device)[None,:,None,None]
  
-        if im0.shape[-2:] == im1.shape[-2:]:
-            x = torch.cat([im0, im1], dim=0)
-            x = self.forward_single(x)
-            feats_x0_c, feats_x1_c = x[1].chunk(2)
-            feats_x0_f, feats_x1_f = x[0].chunk(2)
-        else:
-            feats_x0_f, feats_x0_c = self.forward_single(im0)
-            feats_x1_f, feats_x1_c = self.forward_single(im1)
-        corr_volume = self.corr_volume(feats_x0_c, feats_x1_c)
-        coarse_warp = self.pos_embed(corr_volume)
-        coarse_matches = torch.cat((coarse_warp, torch.zeros_like(coarse_warp[:,-1:])), dim=1)
-        feats_x1_c_warped = F.grid_sample(feats_x1_c, coarse_matches.permute(0, 2, 3, 1)[...,:2], mode = 'bilinear', align_corners = False)
-        coarse_matches_delta = self.coarse_matcher(torch.cat((feats_x0_c, feats_x1_c_warped, coarse_warp), dim=1))
-        coarse_matches = coarse_matches + coarse_matches_delta * to_normalized
-        corresps[8] = {"flow": coarse_matches[:,:2], "certainty": coarse_matches[:,2:]}
-        coarse_matches_up = F.interpolate(coarse_matches, size = feats_x0_f.shape[-2:], mode = "bilinear", align_corners = False)        
-        coarse_matches_up_detach = coarse_matches_up.detach()#note the detach
-        feats_x1_f_warped = F.grid_sample(feats_x1_f, coarse_matches_up_detach.permute(0, 2, 3, 1)[...,:2], mode = 'bilinear', align_corners = False)
-        fine_matches_delta = self.fine_matcher(torch.cat((feats_x0_f, feats_x1_f_warped, coarse_matches_up_detach[:,:2]), dim=1))
-        fine_matches = coarse_matches_up_detach+fine_matches_delta * to_normalized
-        corresps[4] = {"flow": fine_matches[:,:2], "certainty": fine_matches[:,2:]}
-        return corresps
\ No newline at end of file
+        with timed("tiny_roma", "features", sync=True):
+            if im0.shape[-2:] == im1.shape[-2:]:
+                x = torch.cat([im0, im1], dim=0)
+                x = self.forward_single(x)
+                feats_x0_c, feats_x1_c = x[1].chunk(2)
+                feats_x0_f, feats_x1_f = x[0].chunk(2)
+            else:
+                feats_x0_f, feats_x0_c = self.forward_single(im0)
+                feats_x1_f, feats_x1_c = self.forward_single(im1)
+        return self.forward_features((feats_x0_f, feats_x0_c), (feats_x1_f, feats_x1_c), im1.shape[-2:])
+
+    def forward_features(self, feats0, feats1, size1):
+        """
+            input:
+                feats0 -> (fine, coarse) features of the first images
+                feats1 -> (fine, coarse) features of the second images
+                size1 -> (H, W) size the second images were resized to
+            return:
+                corresps -> flow and certainty at strides 8 and 4
+        """
+        feats_x0_f, feats_x0_c = feats0[:2]
+        feats_x1_f, feats_x1_c = feats1[:2]
+        H1, W1 = size1
+        corresps = {}
+        to_normalized = torch.tensor((2/W1, 2/H1, 1)).to(feats_x0_c.device)[None,:,None,None]
+        with timed("tiny_roma", "correlation", sync=True):
+            B, C, H0, W0 = feats_x0_c.shape
+            volume_bytes = B * feats_x1_c.shape[-2] * feats_x1_c.shape[-1] * H0 * W0 * feats_x0_c.element_size()
+            if self.corr_max_bytes is not None and volume_bytes > self.corr_max_bytes:
+                coarse_warp = self.chunked_pos_embed(feats_x0_c, feats_x1_c, self.corr_max_bytes)
+            else:
+                corr_volume = self.corr_volume(feats_x0_c, feats_x1_c)
+                coarse_warp = self.pos_embed(corr_volume)
+        with timed("tiny_roma", "refine", sync=True):
+            coarse_matches = torch.cat((coarse_warp, torch.zeros_like(coarse_warp[:,-1:])), dim=1)
+            feats_x1_c_warped = F.grid_sample(feats_x1_c, coarse_matches.permute(0, 2, 3, 1)[...,:2], mode = 'bilinear', align_corners = False)
+            coarse_matches_delta = self.coarse_matcher(torch.cat((feats_x0_c, feats_x1_c_warped, coarse_warp), dim=1))
+            coarse_matches = coarse_matches + coarse_matches_delta * to_normalized
+            corresps[8] = {"flow": coarse_matches[:,:2], "certainty": coarse_matches[:,2:]}
+            coarse_matches_up = F.interpolate(coarse_matches, size = feats_x0_f.shape[-2:], mode = "bilinear", align_corners = False)        
+            coarse_matches_up_detach = coarse_matches_up.detach()#note the detach
+            feats_x1_f_warped = F.grid_sample(feats_x1_f, coarse_matches_up_detach.permute(0, 2, 3, 1)[...,:2], mode = 'bilinear', align_corners = False)
+            fine_matches_delta = self.fine_matcher(torch.cat((feats_x0_f, feats_x1_f_warped, coarse_matches_up_detach[:,:2]), dim=1))
+            fine_matches = coarse_matches_up_detach+fine_matches_delta * to_normalized
+            corresps[4] = {"flow": fine_matches[:,:2], "certainty": fine_matches[:,2:]}
+        return corresps
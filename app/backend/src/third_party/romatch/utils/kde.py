@@ -1,4 +1,10 @@
+import itertools
+import math
+
 import torch
+import torch.nn.functional as F
+
+KDE_MODES = ("exact", "grid", "hash")
 
 
 def kde(x, std = 0.1, half = True, down = None):
@@ -10,4 +16,98 @@ def kde(x, std = 0.1, half = True, down = None):
     else:
         scores = (-torch.cdist(x,x)**2/(2*std**2)).exp()
     density = scores.sum(dim=-1)
-    return density
\ No newline at end of file
+    return density
+
+
+def _corners(coords):
+    """
+        Multilinear interpolation weights of points over the 2^D corners of their grid cell.
+        input:
+            coords -> torch.Tensor(N, D) continuous grid coordinates
+        return:
+            [(corner indices torch.Tensor(N, D), weights torch.Tensor(N))] for every corner
+    """
+    base = coords.floor()
+    frac = coords - base
+    base = base.long()
+    corners = []
+    for offset in itertools.product((0, 1), repeat=coords.shape[1]):
+        offset = torch.tensor(offset, device=coords.device)
+        weight = torch.where(offset.bool(), frac, 1 - frac).prod(dim=1)
+        corners.append((base + offset, weight))
+    return corners
+
+
+def grid_kde(x, std = 0.1, cells_per_std = 1.5, max_cells = 48):
+    """
+        Gaussian kernel density at every point, as `kde` with `down=None`, in O(N + G) instead of O(N^2).
+        The points are linearly binned on a regular grid over their bounding box, the grid is blurred with
+        a separable Gaussian (one small matrix product per dimension), and the density is interpolated back
+        at every point.
+        input:
+            x -> torch.Tensor(N, D) points
+            std -> kernel standard deviation
+            cells_per_std -> grid cells per std, the accuracy of the binning
+            max_cells -> cap on the cells per dimension, coarsens the grid for wide or small-std inputs
+        return:
+            density -> torch.Tensor(N)
+    """
+    x = x.float()
+    lo = x.min(dim=0).values
+    extent = (x.max(dim=0).values - lo).max().item()
+    h = max(std / cells_per_std, extent / (max_cells - 1))
+    coords = (x - lo) / h
+    sizes = (coords.max(dim=0).values.floor().long() + 2).tolist()
+    strides = torch.tensor([math.prod(sizes[d + 1:]) for d in range(len(sizes))], device=x.device)
+
+    corners = [((idx * strides).sum(dim=1), w) for idx, w in _corners(coords)]
+    grid = torch.zeros(math.prod(sizes), device=x.device)
+    for idx, w in corners:
+        grid.index_add_(0, idx, w)
+
+    # binning and interpolation both spread a point over its cell, adding h^2/6 of variance each per dimension,
+    # the blur makes up for it with a narrower kernel of the same total mass
+    blur = math.sqrt(std ** 2 - h ** 2 / 3)
+    grid = grid.view(sizes)
+    for d in range(len(sizes)):
+        taps = torch.arange(sizes[d], device=x.device) * h
+        kernel = (-(taps[:, None] - taps[None]) ** 2 / (2 * blur ** 2)).exp() * (std / blur)
+        grid = (grid.movedim(d, -1) @ kernel).movedim(-1, d)
+    grid = grid.reshape(-1)
+
+    density = torch.zeros(len(x), device=x.device)
+    for idx, w in corners:
+        density += w * grid[idx]
+    return density
+
+
+def hash_kde(x, std = 0.1, cell = 1.5):
+    """
+        Approximate Gaussian kernel density at every point from its neighbouring cells only.
+        The points are hashed into cells of `cell` std, and each point sums the kernel to the centroid of every
+        occupied cell among the 3^D around its own, weighted by the number of points in the cell. Memory is
+        proportional to the occupied cells, whatever the spread of the points.
+        input:
+            x -> torch.Tensor(N, D) points
+            std -> kernel standard deviation
+            cell -> cell size in std, points further than `cell` std may be missed
+        return:
+            density -> torch.Tensor(N)
+    """
+    x = x.float()
+    N, D = x.shape
+    idx = ((x - x.min(dim=0).values) / (cell * std)).floor().long() + 1
+    sizes = (idx.max(dim=0).values + 2).tolist()
+    strides = torch.tensor([math.prod(sizes[d + 1:]) for d in range(D)], device=x.device)
+    keys, inverse, counts = torch.unique(idx @ strides, return_inverse=True, return_counts=True)
+    centroids = torch.zeros(len(keys), D, device=x.device).index_add_(0, inverse, x) / counts[:, None]
+    cells = torch.zeros(len(keys), D, dtype=torch.long, device=x.device).index_copy_(0, inverse, idx)
+
+    # neighbour lookups are done once per occupied cell, then gathered for its points
+    offsets = torch.tensor(list(itertools.product((-1, 0, 1), repeat=D)), device=x.device)
+    neighbours = (cells[:, None] + offsets[None]) @ strides
+    pos = torch.searchsorted(keys, neighbours).clamp(max=len(keys) - 1)
+    weights = torch.where(keys[pos] == neighbours, counts[pos], 0)[inverse]
+    pos = pos[inverse]
+    d2 = ((x[:, None] - centroids[pos]) ** 2).sum(dim=-1)
+    return (weights * (-d2 / (2 * std ** 2)).exp()).sum(dim=1)
@@ -1,3 +1,5 @@
+import functools
+
 import torch
 import torch.nn.functional as F
 
@@ -46,3 +48,107 @@ def local_correlation(
             window_feature = window_feature.reshape(c,h,w,(2*r+1)**2)
         corr[_] = (feature0[_,...,None]/(c**.5)*window_feature).sum(dim=0).permute(2,0,1)
     return corr
+
+
+@functools.lru_cache(maxsize=32)
+def _local_grids(h, w, r, device):
+    """
+        Grids of `local_correlation`, cached per (h, w, r): the normalized coordinates of the pixel centres, the
+        normalized window offsets, and the integer pixel offsets spanning the window plus one for interpolation.
+        return:
+            coords -> torch.Tensor(1, h, w, 2), window -> torch.Tensor((2r+1)^2, 2), taps -> torch.Tensor(2r+2)
+    """
+    ys, xs = torch.meshgrid(
+        torch.linspace(-1 + 1 / h, 1 - 1 / h, h, device=device),
+        torch.linspace(-1 + 1 / w, 1 - 1 / w, w, device=device),
+        indexing='ij')
+    coords = torch.stack((xs, ys), dim=-1)[None]
+    wy, wx = torch.meshgrid(
+        torch.linspace(-2*r/h, 2*r/h, 2*r+1, device=device),
+        torch.linspace(-2*r/w, 2*r/w, 2*r+1, device=device),
+        indexing='ij')
+    window = torch.stack((wx, wy), dim=-1).reshape((2*r+1)**2, 2)
+    taps = torch.arange(-r, r+2, device=device)
+    return coords, window, taps
+
+
+def batched_local_correlation(
+    feature0,
+    feature1,
+    local_radius,
+    padding_mode="zeros",
+    flow = None,
+    sample_mode = "bilinear",
+    max_bytes = None,
+):
+    """
+        Same as `local_correlation` over the whole batch at once, with cached coordinate grids.
+        The window offsets are whole pixels of feature1 when both feature maps have the same size, so all the
+        bilinear samples of a window share the same four weights. The (2r+2)^2 feature vectors around the window
+        are then gathered once, dotted with feature0 and interpolated, instead of sampling 4 (2r+1)^2 vectors
+        with `grid_sample`. Other sizes, sample modes and paddings fall back to one batched `grid_sample`.
+        input:
+            feature0 -> torch.Tensor(B, c, h, w)
+            feature1 -> torch.Tensor(B, c, H, W)
+            flow -> torch.Tensor(B, 2, h, w) window centres in feature1, the aligned pixels if None
+            max_bytes -> bound on the gathered window features, the window is then processed in chunks of rows
+        return:
+            corr -> torch.Tensor(B, (2r+1)^2, h, w)
+    """
+    r = local_radius
+    K = (2*r+1)**2
+    B, c, h, w = feature0.size()
+    coords, window, taps = _local_grids(h, w, r, feature0.device)
+    if flow is None:
+        # If flow is None, assume feature0 and feature1 are aligned
+        coords = coords.expand(B, h, w, 2)
+    else:
+        coords = flow.permute(0,2,3,1) # If using flow, sample around flow target.
+    bytes_per_tap = B*h*w*c*feature1.element_size()
+    if feature1.shape[-2:] != (h, w) or sample_mode != "bilinear" or padding_mode != "zeros":
+        step = K if max_bytes is None else max(1, min(K, max_bytes // bytes_per_tap))
+        return _sampled_local_correlation(feature0, feature1, coords, window, padding_mode, sample_mode, step)
+
+    with torch.no_grad():
+        # pixel coordinates of the window centres (align_corners=False), split in integer corner and weights
+        x = ((coords[...,0].float() + 1) * w - 1) / 2
+        y = ((coords[...,1].float() + 1) * h - 1) / 2
+        x0, y0 = x.floor(), y.floor()
+        fx = (x - x0).reshape(B,h*w,1,1).to(feature0.dtype)
+        fy = (y - y0).reshape(B,h*w,1,1).to(feature0.dtype)
+        xs = x0.long().reshape(B,h*w,1) + taps
+        ys = y0.long().reshape(B,h*w,1) + taps
+        x_valid = (xs >= 0) & (xs < w)
+        y_valid = (ys >= 0) & (ys < h)
+        # pixels outside feature1 read the zero vector appended at index h*w
+        values = torch.cat([feature1.flatten(2).transpose(1,2), feature1.new_zeros(B,1,c)], dim=1)
+        batch = torch.arange(B, device=feature1.device)[:,None]
+    query = (feature0.flatten(2).transpose(1,2)/(c**.5)).reshape(B*h*w,c,1)
+    rows = 2*r+2 if max_bytes is None else max(1, min(2*r+2, max_bytes // (bytes_per_tap*(2*r+2))))
+    dots = []
+    for start in range(0, 2*r+2, rows):
+        with torch.no_grad():
+            idx = torch.where(y_valid[...,start:start+rows,None] & x_valid[...,None,:],
+                              ys[...,start:start+rows,None]*w + xs[...,None,:], h*w)
+            m = idx.shape[2]
+            window_feature = values[batch, idx.reshape(B,-1)].reshape(B*h*w,m*(2*r+2),c)
+        dots.append(torch.bmm(window_feature, query).reshape(B,h*w,m,2*r+2))
+    dots = torch.cat(dots, dim=2) if len(dots) > 1 else dots[0]
+    corr = (1-fy)*((1-fx)*dots[...,:-1,:-1] + fx*dots[...,:-1,1:]) + fy*((1-fx)*dots[...,1:,:-1] + fx*dots[...,1:,1:])
+    return corr.reshape(B,h,w,K).permute(0,3,1,2)
+
+
+def _sampled_local_correlation(feature0, feature1, coords, window, padding_mode, sample_mode, step):
+    B, c, h, w = feature0.size()
+    K = len(window)
+    corr = []
+    for start in range(0, K, step):
+        offsets = window[start:start+step]
+        k = len(offsets)
+        with torch.no_grad():
+            local_window_coords = (coords[:,:,:,None] + offsets[None,None,None]).reshape(B,h,w*k,2)
+            window_feature = F.grid_sample(
+                feature1, local_window_coords, padding_mode=padding_mode, align_corners=False, mode = sample_mode,
+            ).reshape(B,c,h,w,k)
+        corr.append((feature0[...,None]/(c**.5)*window_feature).sum(dim=1).permute(0,3,1,2))
+    return torch.cat(corr, dim=1) if len(corr) > 1 else corr[0]
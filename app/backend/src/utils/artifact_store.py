@@ -0,0 +1,232 @@
+"""
+Local, content-addressed store of model artifacts.
+
+Artifacts are kept as `<root>/blobs/<sha256>` and named in `<root>/manifest.json`, so the models can be
+built without network access. Files are only downloaded by an explicit `fetch`, never while loading a model.
+Digests of checked files are cached by path, size and modification time, so verifying a checkpoint
+hashes it once and later startups only pay a `stat`.
+
+Usage:
+    python -m src.utils.artifact_store fetch tiny_roma_v1_outdoor <url>
+    python -m src.utils.artifact_store add <name> <path>
+    python -m src.utils.artifact_store pin
+    python -m src.utils.artifact_store list
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, TypedDict
+
+from src.config import ARTIFACT_STORE, DEPTH_MODELS, ROMA_MODELS
+
+CHUNK_BYTES = 8 * 1024 ** 2
+
+
+class Artifact(TypedDict):
+    sha256: str
+    bytes: int
+    source: Optional[str]
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """
+    Replace a JSON file atomically, so a crash never leaves a truncated manifest behind.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class ArtifactStore:
+    """
+    Named artifacts addressed by their sha256, plus verification of checkpoints kept outside the store.
+    Model specs from `src/config.py` resolve to a file through `resolve`: a spec names either an
+    'artifact' in the store or a 'checkpoint' path, optionally pinned to a 'sha256'. Checkpoint paths
+    recorded with `pin` are verified against the pinned digest as well.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._manifest_path = self.root / "manifest.json"
+        self._digests_path = self.root / "digests.json"
+        self._manifest: dict[str, Artifact] = self._read(self._manifest_path)
+        self._digests: dict[str, list] = self._read(self._digests_path)
+
+    @staticmethod
+    def _read(path: Path) -> dict:
+        if not path.is_file():
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def digest(self, path: Path) -> str:
+        """
+        Returns the sha256 of a file, hashing it only if it changed since it was last hashed.
+        :param path: Path, the file
+        :return: str, hex digest
+        """
+        path = Path(path).resolve()
+        st = path.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            cached = self._digests.get(str(path))
+        if cached is not None and cached[:2] == stamp:
+            return cached[2]
+
+        digest = _sha256(path)
+        with self._lock:
+            self._digests[str(path)] = stamp + [digest]
+            _write_json(self._digests_path, self._digests)
+        return digest
+
+    def verify(self, path: Path, sha256: str) -> Path:
+        """
+        Check a file against an expected digest.
+        :param path: Path, the file
+        :param sha256: str, expected hex digest
+        :return: Path, the file
+        """
+        actual = self.digest(path)
+        if actual != sha256:
+            raise ValueError(f"Artifact '{path}' has sha256 {actual}, expected {sha256}")
+        return Path(path)
+
+    def add(self, name: str, path: Path, source: Optional[str] = None) -> Path:
+        """
+        Copy a file into the store under a name.
+        :param name: str, artifact name
+        :param path: Path, the file to add
+        :param source: str, where the file came from, recorded in the manifest
+        :return: Path, the stored blob
+        """
+        digest = self.digest(path)
+        blob = self.root / "blobs" / digest
+        if not blob.is_file():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_suffix(".tmp")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, blob)
+        with self._lock:
+            self._manifest[name] = {"sha256": digest, "bytes": blob.stat().st_size, "source": source or str(path)}
+            _write_json(self._manifest_path, self._manifest)
+        return blob
+
+    def fetch(self, name: str, url: str) -> Path:
+        """
+        Download a file into the store. The only operation that touches the network.
+        :param name: str, artifact name
+        :param url: str, the URL to download
+        :return: Path, the stored blob
+        """
+        from torch.hub import download_url_to_file
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.root) as tmp:
+            target = Path(tmp) / name
+            download_url_to_file(url, str(target), progress=True)
+            return self.add(name, target, source=url)
+
+    def path(self, name: str) -> Path:
+        """
+        Returns the stored file of a named artifact.
+        :param name: str, artifact name
+        :return: Path, the stored blob
+        """
+        with self._lock:
+            entry = self._manifest.get(name)
+        if entry is None:
+            raise FileNotFoundError(
+                f"Artifact '{name}' is not in the store at '{self.root}', "
+                f"add it with `python -m src.utils.artifact_store add {name} <path>`")
+        blob = self.root / "blobs" / entry["sha256"]
+        if not blob.is_file():
+            raise FileNotFoundError(f"Artifact '{name}' is missing its blob '{blob}'")
+        return blob
+
+    def pin(self, path: Path) -> str:
+        """
+        Record the digest of a checkpoint kept outside the store, so later loads verify it.
+        :param path: Path, the checkpoint
+        :return: str, hex digest
+        """
+        path = Path(path).resolve()
+        digest = self.digest(path)
+        with self._lock:
+            self._manifest[str(path)] = {"sha256": digest, "bytes": path.stat().st_size, "source": str(path)}
+            _write_json(self._manifest_path, self._manifest)
+        return digest
+
+    def resolve(self, spec: dict, verify: bool = ARTIFACT_STORE['verify']) -> Path:
+        """
+        Resolve a model spec from `src/config.py` to the file holding its weights.
+        :param spec: dict, with an 'artifact' name or a 'checkpoint' Path and an optional 'sha256'
+        :param verify: bool, check the file against its pinned digest
+        :return: Path, the checkpoint file
+        """
+        if 'artifact' in spec:
+            path = self.path(spec['artifact'])
+            expected = spec.get('sha256') or path.name
+        else:
+            path = spec['checkpoint']
+            if not path.is_file():
+                raise ValueError(f"Checkpoint '{path}' not found")
+            with self._lock:
+                pinned = self._manifest.get(str(Path(path).resolve()))
+            expected = spec.get('sha256') or (pinned["sha256"] if pinned else None)
+        if verify and expected is not None:
+            self.verify(path, expected)
+        return path
+
+    def entries(self) -> dict[str, Artifact]:
+        with self._lock:
+            return {name: entry.copy() for name, entry in self._manifest.items()}
+
+
+artifact_store = ArtifactStore(ARTIFACT_STORE['dir'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local model artifact store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="download a file into the store")
+    fetch.add_argument("name")
+    fetch.add_argument("url")
+    add = commands.add_parser("add", help="copy a local file into the store")
+    add.add_argument("name")
+    add.add_argument("path", type=Path)
+    commands.add_parser("pin", help="record the digests of the configured checkpoints")
+    commands.add_parser("list", help="list the stored artifacts")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        print(artifact_store.fetch(args.name, args.url))
+    elif args.command == "add":
+        print(artifact_store.add(args.name, args.path))
+    elif args.command == "pin":
+        for spec in list(DEPTH_MODELS.values()) + list(ROMA_MODELS.values()):
+            checkpoint = spec.get('checkpoint')
+            if checkpoint is not None and Path(checkpoint).is_file():
+                print(artifact_store.pin(checkpoint), checkpoint)
+    else:
+        for name, entry in artifact_store.entries().items():
+            print(entry["sha256"], entry["bytes"], name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import math
+from typing import Optional
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from src.third_party.depth_anything_v2.dpt import _to_input
+from src.utils.metrics import timed
+
+PATCH = 14
+
+
+def tile_grid(length: int, tile: int, overlap: int) -> list[int]:
+    """
+    Start offsets of tiles covering [0, length) with at least `overlap` pixels shared by neighbours.
+    The last tile is aligned to the end, so every tile lies fully inside the image.
+    :param length: int, image height or width
+    :param tile: int, tile height or width
+    :param overlap: int, minimum overlap between neighbouring tiles
+    :return: list[int], tile start offsets
+    """
+    if length <= tile:
+        return [0]
+    stride = max(tile - overlap, 1)
+    count = math.ceil((length - tile) / stride) + 1
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def blend_weights(tile_h: int, tile_w: int, ramp: int, top: bool, bottom: bool, left: bool, right: bool) -> np.ndarray:
+    """
+    Blending weights of a tile that fall off linearly towards the edges shared with other tiles.
+    Edges on the image border keep full weight, so the border is never under-weighted.
+    :param tile_h: int, tile height
+    :param tile_w: int, tile width
+    :param ramp: int, width of the fall-off in pixels
+    :param top: bool, whether another tile overlaps the top edge (same for bottom, left, right)
+    :return: np.ndarray, (tile_h, tile_w) weights in (0, 1]
+    """
+    def profile(n, start, end):
+        w = np.ones(n, dtype=np.float32)
+        r = min(ramp, n // 2)
+        if r > 0:
+            edge = (np.arange(r, dtype=np.float32) + 1) / (r + 1)
+            if start:
+                w[:r] = edge
+            if end:
+                w[n - r:] = edge[::-1]
+        return w
+
+    return np.outer(profile(tile_h, top, bottom), profile(tile_w, left, right))
+
+
+def align_scale_shift(pred: np.ndarray, ref: np.ndarray) -> tuple[float, float]:
+    """
+    Least-squares scale and shift mapping a tile prediction onto the reference depth.
+    Depth-Anything predicts relative depth with an unknown affine ambiguity per forward pass,
+    aligning every tile to the same reference removes the steps between tiles.
+    :param pred: np.ndarray, the tile prediction
+    :param ref: np.ndarray, the reference depth on the same pixels
+    :return: tuple[float, float], scale and shift so that scale * pred + shift ~ ref
+    """
+    p = pred.reshape(-1).astype(np.float64)
+    r = ref.reshape(-1).astype(np.float64)
+    p_mean, r_mean = p.mean(), r.mean()
+    var = ((p - p_mean) ** 2).mean()
+    if var < 1e-12:
+        return 0.0, float(r_mean)
+    scale = ((p - p_mean) * (r - r_mean)).mean() / var
+    return float(scale), float(r_mean - scale * p_mean)
+
+
+def estimate_tile_bytes(model, tile_h: int, tile_w: int) -> int:
+    """
+    Rough peak activation memory of one tile in a forward pass without gradients.
+    Counts the attention scores, the MLP hidden states, the intermediate encoder layers kept
+    for the DPT head and the head feature maps, with a 1.5x margin for allocator slack.
+    :param model: DepthAnythingV2, the model
+    :param tile_h: int, tile height (multiple of 14)
+    :param tile_w: int, tile width (multiple of 14)
+    :return: int, estimated bytes per tile
+    """
+    ph, pw = tile_h // PATCH, tile_w // PATCH
+    pretrained = getattr(model, "pretrained", None)
+    if pretrained is None:
+        return int(tile_h * tile_w * 64 * 4 * 1.5)
+    tokens = ph * pw + 1
+    embed, heads = pretrained.embed_dim, pretrained.num_heads
+    features = model.depth_head.scratch.output_conv1.in_channels
+    attention = heads * tokens * tokens * 2
+    mlp = tokens * embed * 4 * 2
+    kept = 4 * tokens * embed
+    head = (8 * ph) * (8 * pw) * features * 2 + tile_h * tile_w * (features // 2 + 32)
+    return int((attention + mlp + kept + head) * 4 * 1.5)
+
+
+def tile_batch_size(model, tile_h: int, tile_w: int, memory_cap_bytes: int, num_tiles: int) -> int:
+    """
+    Number of tiles per forward pass that fits the memory cap.
+    :return: int, between 1 and num_tiles
+    """
+    per_tile = estimate_tile_bytes(model, tile_h, tile_w)
+    return max(1, min(num_tiles, memory_cap_bytes // max(per_tile, 1)))
+
+
+@torch.no_grad()
+def infer_tiled(model, raw_image: np.ndarray, tile_size: int = 518, overlap: float = 0.25,
+                memory_cap_bytes: int = 2 * 1024 ** 3, max_side: Optional[int] = None,
+                input_size: int = 518) -> np.ndarray:
+    """
+    High-resolution depth by running the network on overlapping tiles at native resolution.
+    A regular whole-image prediction provides the global layout: every tile is aligned to it with
+    a least-squares scale and shift, then the tiles are blended with weights that fall off across
+    the overlaps so no seams remain. Tiles are batched through the encoder, as many per forward pass
+    as the memory cap allows.
+    :param model: DepthAnythingV2, the model
+    :param raw_image: np.ndarray, BGR image
+    :param tile_size: int, tile side in pixels, rounded down to a multiple of 14
+    :param overlap: float, fraction of the tile shared with each neighbour
+    :param memory_cap_bytes: int, activation memory budget used to choose the tile batch size
+    :param max_side: int, run the tiles on a downscaled image whose longest side is at most this, full resolution if None
+    :param input_size: int, input size of the whole-image reference prediction
+    :return: np.ndarray, (H, W) depth map at the original resolution
+    """
+    if tile_size < PATCH:
+        raise ValueError(f"Tile size must be at least {PATCH}")
+    if not 0 <= overlap < 1:
+        raise ValueError("Overlap must be in [0, 1)")
+
+    h, w = raw_image.shape[:2]
+    reference = model.infer_image(raw_image, input_size)
+
+    work = raw_image
+    if max_side is not None and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        work = cv2.resize(raw_image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    wh, ww = work.shape[:2]
+
+    if wh <= tile_size and ww <= tile_size:
+        return reference
+    tile_h = min(tile_size, wh) // PATCH * PATCH
+    tile_w = min(tile_size, ww) // PATCH * PATCH
+
+    if (wh, ww) != (h, w):
+        reference = cv2.resize(reference, (ww, wh), interpolation=cv2.INTER_LINEAR)
+
+    ov_h, ov_w = int(tile_h * overlap), int(tile_w * overlap)
+    ys, xs = tile_grid(wh, tile_h, ov_h), tile_grid(ww, tile_w, ov_w)
+    tiles = [(y, x) for y in ys for x in xs]
+    batch_size = tile_batch_size(model, tile_h, tile_w, memory_cap_bytes, len(tiles))
+
+    device = next(model.parameters()).device
+    image = _to_input([work], work.shape[:2], device, torch.float32)[0]
+    acc = np.zeros((wh, ww), dtype=np.float64)
+    weight_sum = np.zeros((wh, ww), dtype=np.float64)
+
+    with timed("depth_anything_v2", "tiles", sync=True):
+        for start in range(0, len(tiles), batch_size):
+            chunk = tiles[start:start + batch_size]
+            batch = torch.stack([image[:, y:y + tile_h, x:x + tile_w] for y, x in chunk])
+            depth = model.forward(batch)
+            if depth.shape[-2:] != (tile_h, tile_w):
+                depth = F.interpolate(depth[:, None], (tile_h, tile_w), mode="bilinear", align_corners=True)[:, 0]
+            depth = depth.float().cpu().numpy()
+
+            for (y, x), d in zip(chunk, depth):
+                ref = reference[y:y + tile_h, x:x + tile_w]
+                a, b = align_scale_shift(d, ref)
+                weights = blend_weights(tile_h, tile_w, min(ov_h, ov_w) or 1,
+                                        top=y > 0, bottom=y + tile_h < wh, left=x > 0, right=x + tile_w < ww)
+                acc[y:y + tile_h, x:x + tile_w] += weights * (a * d + b)
+                weight_sum[y:y + tile_h, x:x + tile_w] += weights
+
+    depth = (acc / np.maximum(weight_sum, 1e-12)).astype(np.float32)
+    if (wh, ww) != (h, w):
+        depth = cv2.resize(depth, (w, h), interpolation=cv2.INTER_LINEAR)
+    return depth
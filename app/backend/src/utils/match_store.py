@@ -0,0 +1,211 @@
+"""
+Chunked on-disk store of the matches between pairs of images of a scene.
+
+Layout of a store directory:
+    images.json             the image list and the parameters the matches were computed with
+    chunks/000000/          one directory per chunk of pairs, written atomically, `meta.json` last
+        pairs.npy           (P, 2) int32 image indices (i, j), i < j
+        sizes.npy           (P, 4) int32 H_A, W_A, H_B, W_B
+        F.npy               (P, 3, 3) float64 fundamental matrices, NaN where RANSAC found none
+        offsets.npy         (P + 1,) int64 first row of every pair in the match arrays
+        kptsA.npy, kptsB.npy  (M, 2) float32 pixel coordinates of the inlier matches
+        certainty.npy       (M,) float32 certainty of the inlier matches
+
+Chunks are append-only and memory-mapped on read. An interrupted chunk has no `meta.json`, it is ignored
+and its pairs are matched again on resume.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterator, Mapping, Optional, TypedDict
+
+import numpy as np
+
+ARRAYS = ("pairs", "sizes", "F", "offsets", "kptsA", "kptsB", "certainty")
+
+
+class PairMatches(TypedDict):
+    i: int
+    j: int
+    F: Optional[np.ndarray]
+    kptsA: np.ndarray
+    kptsB: np.ndarray
+    certainty: np.ndarray
+    H_A: int
+    W_A: int
+    H_B: int
+    W_B: int
+
+
+class MatchStore:
+    """
+    Matches of image pairs, indexed by (i, j) and queryable by a range of first images.
+    """
+
+    def __init__(self, root: Path, images: Optional[list[str]] = None, params: Optional[dict] = None):
+        """
+        Open a store, creating it when an image list is given and the directory holds none yet.
+        :param root: Path, the store directory
+        :param images: list[str], the images of the scene, must equal the stored list when the store exists
+        :param params: dict, JSON parameters of the matches (model, sampling), must equal the stored ones
+        """
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        index_path = self.root / "images.json"
+        if index_path.is_file():
+            index = json.loads(index_path.read_text())
+            if images is not None and list(images) != index["images"]:
+                raise ValueError(f"The match store at '{self.root}' was built for a different image list")
+            if params is not None and params != index["params"]:
+                raise ValueError(f"The match store at '{self.root}' was built with {index['params']}, not {params}")
+        elif images is not None:
+            index = {"images": list(images), "params": params or {}}
+            self.root.mkdir(parents=True, exist_ok=True)
+            (self.root / "chunks").mkdir(exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp, index_path)
+        else:
+            raise FileNotFoundError(f"No match store at '{self.root}'")
+
+        self.images: list[str] = index["images"]
+        self.params: dict = index["params"]
+        self._chunks: list[dict[str, np.ndarray]] = []
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._locations = np.zeros((0, 2), dtype=np.int64)
+        for entry in sorted((self.root / "chunks").iterdir()):
+            if (entry / "meta.json").is_file():
+                self._chunks.append({name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in ARRAYS})
+        self._reindex()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, pair: tuple[int, int]) -> bool:
+        return self._find(*pair) is not None
+
+    def pairs(self) -> list[tuple[int, int]]:
+        """
+        Returns the stored pairs, ordered by first then second image.
+        :return: list[tuple[int, int]], the (i, j) pairs, i < j
+        """
+        n = len(self.images)
+        return [(int(k // n), int(k % n)) for k in self._keys]
+
+    def write(self, results: list[tuple[int, int, Mapping]]) -> None:
+        """
+        Append a chunk of matched pairs.
+        :param results: list[tuple[int, int, Mapping]], (i, j, prediction) with i < j and numpy predictions
+            as returned by `RomaManager.predict(..., as_numpy=True)`
+        """
+        if not results:
+            return
+        for i, j, _ in results:
+            if not 0 <= i < j < len(self.images):
+                raise ValueError(f"Invalid pair ({i}, {j}) for {len(self.images)} images")
+        counts = [len(pred["kptsA"]) for _, _, pred in results]
+        arrays = {
+            "pairs": np.array([(i, j) for i, j, _ in results], dtype=np.int32),
+            "sizes": np.array([(p["H_A"], p["W_A"], p["H_B"], p["W_B"]) for _, _, p in results], dtype=np.int32),
+            "F": np.stack([np.full((3, 3), np.nan) if p["F"] is None else np.asarray(p["F"], dtype=np.float64)[:3]
+                           for _, _, p in results]),
+            "offsets": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            "kptsA": np.concatenate([np.asarray(p["kptsA"], np.float32).reshape(-1, 2) for _, _, p in results]),
+            "kptsB": np.concatenate([np.asarray(p["kptsB"], np.float32).reshape(-1, 2) for _, _, p in results]),
+            "certainty": np.concatenate([np.asarray(p["certainty"], np.float32).reshape(-1) for _, _, p in results]),
+        }
+
+        with self._lock:
+            entry = self.root / "chunks" / f"{len(self._chunks):06d}"
+            tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+            try:
+                for name, value in arrays.items():
+                    np.save(tmp / f"{name}.npy", value, allow_pickle=False)
+                # meta.json is written last, a chunk without it is incomplete and ignored
+                (tmp / "meta.json").write_text(json.dumps({"pairs": len(results), "matches": int(sum(counts))}))
+                if entry.exists():
+                    shutil.rmtree(entry)
+                os.replace(tmp, entry)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            self._chunks.append({name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in ARRAYS})
+            self._reindex()
+
+    def get(self, i: int, j: int) -> PairMatches:
+        """
+        Returns the matches of a pair. Pairs are stored once, (j, i) returns the swapped matches of (i, j).
+        :param i: int, index of the first image
+        :param j: int, index of the second image
+        :return: PairMatches, the matches
+        """
+        location = self._find(i, j)
+        if location is None:
+            raise KeyError(f"Pair ({i}, {j}) is not in the match store")
+        matches = self._read(*location)
+        if i > j:
+            F = matches["F"]
+            return {
+                "i": i, "j": j, "F": F.T if F is not None else None,
+                "kptsA": matches["kptsB"], "kptsB": matches["kptsA"], "certainty": matches["certainty"],
+                "H_A": matches["H_B"], "W_A": matches["W_B"], "H_B": matches["H_A"], "W_B": matches["W_A"],
+            }
+        return matches
+
+    def query(self, start: int = 0, stop: Optional[int] = None) -> Iterator[PairMatches]:
+        """
+        Iterate over the stored pairs whose first image index is in [start, stop), in (i, j) order.
+        :param start: int, first image index of the range
+        :param stop: int, end of the range (exclusive), the number of images if None
+        :return: Iterator[PairMatches], the matches of every pair in the range
+        """
+        n = len(self.images)
+        stop = n if stop is None else min(stop, n)
+        lo, hi = np.searchsorted(self._keys, [start * n, stop * n])
+        for chunk, row in self._locations[lo:hi]:
+            yield self._read(int(chunk), int(row))
+
+    def _find(self, i: int, j: int) -> Optional[tuple[int, int]]:
+        n = len(self.images)
+        key = min(i, j) * n + max(i, j)
+        pos = np.searchsorted(self._keys, key)
+        if pos == len(self._keys) or self._keys[pos] != key:
+            return None
+        chunk, row = self._locations[pos]
+        return int(chunk), int(row)
+
+    def _read(self, chunk: int, row: int) -> PairMatches:
+        arrays = self._chunks[chunk]
+        start, stop = arrays["offsets"][row], arrays["offsets"][row + 1]
+        F = np.asarray(arrays["F"][row])
+        H_A, W_A, H_B, W_B = (int(v) for v in arrays["sizes"][row])
+        return {
+            "i": int(arrays["pairs"][row, 0]),
+            "j": int(arrays["pairs"][row, 1]),
+            "F": None if np.isnan(F).all() else F,
+            "kptsA": arrays["kptsA"][start:stop],
+            "kptsB": arrays["kptsB"][start:stop],
+            "certainty": arrays["certainty"][start:stop],
+            "H_A": H_A, "W_A": W_A, "H_B": H_B, "W_B": W_B,
+        }
+
+    def _reindex(self) -> None:
+        """
+        Rebuild the sorted pair index over all chunks, a later chunk wins for a pair stored twice.
+        """
+        n = len(self.images)
+        keys, locations = [], []
+        for c, arrays in enumerate(self._chunks):
+            pairs = np.asarray(arrays["pairs"], dtype=np.int64)
+            keys.append(pairs[:, 0] * n + pairs[:, 1])
+            locations.append(np.stack([np.full(len(pairs), c), np.arange(len(pairs))], axis=1))
+        if not keys:
+            return
+        keys, locations = np.concatenate(keys), np.concatenate(locations)
+        order = np.lexsort((np.arange(len(keys)), keys))
+        keys, locations = keys[order], locations[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        self._keys, self._locations = keys[last], locations[last]
@@ -0,0 +1,247 @@
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from typing import ContextManager, Iterable, Optional, Sequence
+
+import torch
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from src.config import METRICS
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """
+    Cumulative histogram per combination of label values, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Record a single observation.
+        :param value: float, the observed value
+        :param label_values: str, one value per label name
+        """
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    Last (or maximum) value per combination of label values, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def set_max(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = max(value, self._values.get(label_values, value))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the backend metrics. Timing hooks only record while `enabled` is set,
+    when it is off every hook returns a shared no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = False, buckets: Iterable[float] = METRICS['buckets']):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._metrics: dict[str, Histogram | Gauge] = {}
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str]) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, documentation, label_names, self.buckets)
+        return self._metrics[name]
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str]) -> Gauge:
+        if name not in self._metrics:
+            self._metrics[name] = Gauge(name, documentation, label_names)
+        return self._metrics[name]
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        :return: str, the exposition
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=METRICS['enabled'])
+
+STAGE_SECONDS = metrics.histogram(
+    "nerf_stage_seconds", "Time spent in a processing stage.", ("component", "stage"))
+LOCK_WAIT_SECONDS = metrics.histogram(
+    "nerf_model_lock_wait_seconds", "Time spent waiting for a free model replica.", ("model",))
+PEAK_MEMORY_BYTES = metrics.gauge(
+    "nerf_model_peak_memory_bytes",
+    "Peak memory observed while a model ran (allocator peak on CUDA, process peak RSS on CPU).",
+    ("model", "device"))
+RESIDENT_BYTES = metrics.gauge(
+    "nerf_model_resident_bytes", "Memory held by the weights of a resident model.", ("model",))
+ENABLED = metrics.gauge(
+    "nerf_metrics_enabled", "Whether the stage timing hooks are recording.", ())
+QUEUE_DEPTH = metrics.gauge(
+    "nerf_executor_queued", "Calls waiting for an inference worker.", ("executor",))
+COLD_START_SECONDS = metrics.gauge(
+    "nerf_model_cold_start_seconds", "Time taken by the last load of a model.", ("model",))
+COLD_START_MEMORY_BYTES = metrics.gauge(
+    "nerf_model_cold_start_peak_memory_bytes", "Peak memory growth during the last load of a model.",
+    ("model", "device"))
+
+_NOOP = nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ("component", "stage", "sync", "started")
+
+    def __init__(self, component: str, stage: str, sync: bool):
+        self.component = component
+        self.stage = stage
+        self.sync = sync and torch.cuda.is_available()
+
+    def __enter__(self):
+        if self.sync:
+            torch.cuda.synchronize()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.sync:
+            torch.cuda.synchronize()
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.component, self.stage)
+        return False
+
+
+def timed(component: str, stage: str, sync: bool = False) -> ContextManager:
+    """
+    Time a block as one stage of a component, a no-op unless metrics are enabled.
+    :param component: str, the instrumented component, e.g. 'depth_manager'
+    :param stage: str, the stage within the component, e.g. 'decode'
+    :param sync: bool, synchronize CUDA around the block so asynchronous kernels are attributed to it
+    :return: ContextManager, the timer
+    """
+    if not metrics.enabled:
+        return _NOOP
+    return _StageTimer(component, stage, sync)
+
+
+def observe_lock_wait(model: str, seconds: float) -> None:
+    if metrics.enabled:
+        LOCK_WAIT_SECONDS.observe(seconds, model)
+
+
+def reset_peak_memory(device: torch.device) -> None:
+    if metrics.enabled and device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def record_peak_memory(model: str, device: torch.device) -> None:
+    """
+    Record the peak memory of a model run. On CUDA this is the allocator peak since `reset_peak_memory`,
+    on CPU the peak resident set size of the whole process.
+    """
+    if not metrics.enabled:
+        return
+    if device.type == "cuda":
+        PEAK_MEMORY_BYTES.set_max(torch.cuda.max_memory_allocated(device), model, "cuda")
+    elif resource is not None:
+        PEAK_MEMORY_BYTES.set_max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, model, device.type)
+
+
+def reset_memory_high_watermark(device: torch.device) -> None:
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def memory_high_watermark(device: torch.device) -> Optional[int]:
+    """
+    Peak memory so far, independent of the metrics switch: the allocator peak since
+    `reset_memory_high_watermark` on CUDA, the peak resident set size of the process elsewhere.
+    :return: int, bytes, or None if it cannot be measured on this platform
+    """
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device)
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
@@ -0,0 +1,170 @@
+"""
+Reduced-precision and int8-quantized inference modes for the served models.
+
+A model entry in `DEPTH_MODELS` / `ROMA_MODELS` may set a 'precision', one of:
+    fp32          the checkpoint as trained
+    bf16          bfloat16 autocast around the forward pass, weights stay in float32
+    int8_dynamic  int8 weights, activations quantized on the fly (no calibration), `nn.Linear` layers only
+    int8_static   int8 weights and activations, with activation ranges calibrated on dataset frames
+
+Quantization targets the layers that dominate the CPU time: the `nn.Linear` layers of the DINOv2
+`Attention` and `Mlp` blocks of Depth-Anything-V2, and the `BasicLayer` convolutions (Conv2d -> BatchNorm ->
+ReLU, folded into a single conv) of Tiny RoMa and its XFeat backbone. int8_dynamic does not quantize
+convolutions, so it only applies to the Linear layers. The int8 modes run on CPU only.
+Use `benchmarks/precision_report.py` to measure the speed and accuracy drift of every mode.
+"""
+import warnings
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, ContextManager, Optional
+
+import cv2
+import numpy as np
+import torch
+import torch.ao.nn.quantized.dynamic as nnqd
+import torch.ao.quantization as tq
+import torch.nn as nn
+
+from src.config import PRECISION
+from src.third_party.depth_anything_v2.dinov2_layers.attention import Attention
+from src.third_party.depth_anything_v2.dinov2_layers.mlp import Mlp
+from src.third_party.romatch.models.tiny import BasicLayer as RomaBasicLayer
+from src.third_party.xfeat.model import BasicLayer as XFeatBasicLayer
+
+PRECISIONS = ("fp32", "bf16", "int8_dynamic", "int8_static")
+CALIBRATION_PATTERNS = ("*.color.png", "*.color.jpg", "*.jpg", "*.jpeg")
+
+
+def check_precision(precision: str, device) -> str:
+    """
+    Validate a precision mode for a device.
+    :param precision: str, one of PRECISIONS
+    :param device: str or torch.device, the device the model runs on
+    :return: str, the precision
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision '{precision}', expected one of {PRECISIONS}")
+    if precision.startswith("int8") and torch.device(device).type != "cpu":
+        raise ValueError(f"Precision '{precision}' is only supported on CPU, not on '{device}'")
+    return precision
+
+
+def precision_context(model: nn.Module) -> ContextManager:
+    """
+    Returns the context to run the forward pass of a model in, autocast for bf16 models.
+    :param model: nn.Module, a model prepared by `apply_precision` (fp32 if it was not)
+    :return: ContextManager, the context
+    """
+    if getattr(model, "inference_precision", "fp32") != "bf16":
+        return nullcontext()
+    device = next(model.parameters()).device
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+def calibration_frames(root: Path = PRECISION['calibration_dir'], limit: int = PRECISION['calibration_frames'],
+                       max_side: Optional[int] = PRECISION['calibration_max_side']) -> list[np.ndarray]:
+    """
+    Load colour frames to calibrate the int8_static mode on, spread evenly over the frames found under `root`.
+    :param root: Path, directory searched recursively for colour frames (depth maps are skipped)
+    :param limit: int, maximum number of frames
+    :param max_side: int, downscale frames whose longest side is larger, None to keep them as they are
+    :return: list[np.ndarray], BGR uint8 frames
+    """
+    paths = sorted({p for pattern in CALIBRATION_PATTERNS for p in Path(root).rglob(pattern)})
+    if not paths:
+        raise FileNotFoundError(f"No calibration frames found under '{root}'")
+    if len(paths) > limit:
+        paths = [paths[i] for i in np.linspace(0, len(paths) - 1, limit).round().astype(int)]
+
+    frames = []
+    for path in paths:
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Cannot read calibration frame {path}")
+        if max_side is not None and max(img.shape[:2]) > max_side:
+            scale = max_side / max(img.shape[:2])
+            img = cv2.resize(img, (round(img.shape[1] * scale), round(img.shape[0] * scale)),
+                             interpolation=cv2.INTER_AREA)
+        frames.append(img)
+    return frames
+
+
+def _linear_targets(model: nn.Module) -> list[tuple[str, nn.Module, str]]:
+    """
+    Returns (qualified name, parent, attribute) of every nn.Linear directly inside a DINOv2 Attention or Mlp block.
+    """
+    return [
+        (f"{prefix}.{name}", module, name)
+        for prefix, module in model.named_modules() if isinstance(module, (Attention, Mlp))
+        for name, child in module.named_children() if isinstance(child, nn.Linear)
+    ]
+
+
+def _conv_targets(model: nn.Module) -> list[tuple[str, nn.Module]]:
+    """
+    Returns (qualified name, layer) of every Tiny RoMa / XFeat BasicLayer of a model.
+    """
+    return [(name, module) for name, module in model.named_modules()
+            if isinstance(module, (RomaBasicLayer, XFeatBasicLayer))]
+
+
+def _fold(layer: nn.Module) -> nn.Module:
+    """
+    Fold the BatchNorm of a BasicLayer into its convolution, and its ReLU too when it has one.
+    """
+    names = ["0", "1", "2"] if isinstance(layer.layer[2], nn.ReLU) else ["0", "1"]
+    return tq.fuse_modules(layer.layer, [names])
+
+
+def _quantize_dynamic(model: nn.Module) -> None:
+    """
+    Quantize the DINOv2 `nn.Linear` layers only. Dynamically quantized convolutions lose too much accuracy,
+    so the BasicLayer convolutions are left to int8_static and Tiny RoMa stays in float32 in this mode.
+    """
+    targets = [name for name, _, _ in _linear_targets(model)]
+    tq.quantize_dynamic(model, {name: tq.default_dynamic_qconfig for name in targets},
+                        mapping={nn.Linear: nnqd.Linear}, inplace=True)
+
+
+def _quantize_static(model: nn.Module, calibrate: Callable[[nn.Module], None]) -> None:
+    qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+    wrappers = []
+    for _, parent, name in _linear_targets(model):
+        wrappers.append(tq.QuantWrapper(getattr(parent, name)))
+        setattr(parent, name, wrappers[-1])
+    for _, layer in _conv_targets(model):
+        wrappers.append(tq.QuantWrapper(_fold(layer)))
+        layer.layer = wrappers[-1]
+    for wrapper in wrappers:
+        wrapper.qconfig = qconfig
+
+    tq.prepare(model, inplace=True)
+    with torch.no_grad():
+        calibrate(model)
+    tq.convert(model, inplace=True)
+
+
+def apply_precision(model: nn.Module, precision: str, calibrate: Optional[Callable[[nn.Module], None]] = None):
+    """
+    Convert a float32 model in eval mode to a precision mode, in place.
+    :param model: nn.Module, a Depth-Anything-V2 or Tiny RoMa model on its target device
+    :param precision: str, one of PRECISIONS
+    :param calibrate: Callable[[nn.Module], None], runs representative inputs through the model,
+                      required for int8_static
+    :return: nn.Module, the model, with its mode recorded as `inference_precision`
+    """
+    check_precision(precision, next(model.parameters()).device)
+    if precision == "int8_static" and calibrate is None:
+        raise ValueError("Precision 'int8_static' requires a calibration function")
+
+    model.eval()
+    with warnings.catch_warnings():
+        # torch.ao eager-mode quantization and quantized tensors warn that they are deprecated in favour of torchao.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.filterwarnings("ignore", message=".*(quantize_per_tensor|reduce_range)", category=UserWarning)
+        if precision == "int8_dynamic":
+            _quantize_dynamic(model)
+        elif precision == "int8_static":
+            _quantize_static(model, calibrate)
+    model.inference_precision = precision
+    return model
@@ -0,0 +1,271 @@
+import io
+import json
+import struct
+from typing import Mapping, Optional
+
+import cv2
+import numpy as np
+
+# Raw arrays: magic, dtype code ('e' float16 / 'f' float32), ndim, reserved, then ndim uint32 dims.
+RAW_MAGIC = b"NRFA"
+RAW_HEADER = struct.Struct("<4scBx")
+
+# Columnar matches: magic, N, H_A, W_A, H_B, W_B, has_F, then F as 9 float64 values.
+COLUMNAR_MAGIC = b"RMCL"
+COLUMNAR_HEADER = struct.Struct("<4sIIIIIB3x9d")
+
+# Streamed depth frames: magic, frame sequence number, frames dropped so far, depth scale (png16 only),
+# followed by the frame encoded in the stream format.
+STREAM_MAGIC = b"DSTR"
+STREAM_HEADER = struct.Struct("<4sIId")
+
+DEPTH_FORMATS = {
+    "json": "application/json",
+    "f32": "application/x-float32",
+    "f16": "application/x-float16",
+    "npy": "application/x-npy",
+    "png16": "image/png",
+}
+
+MATCH_FORMATS = {
+    "json": "application/json",
+    "columnar": "application/x-roma-columnar",
+}
+
+
+class UnsupportedFormat(ValueError):
+    """Raised when none of the requested response formats can be produced."""
+
+
+def negotiate(formats: Mapping[str, str], accept: Optional[str] = None, fmt: Optional[str] = None) -> str:
+    """
+    Pick the response format from an explicit format name or an HTTP Accept header.
+    An explicit format name takes precedence, JSON is the fallback when nothing is requested.
+    :param formats: Mapping[str, str], supported format names mapped to their media types
+    :param accept: str, value of the Accept header
+    :param fmt: str, explicitly requested format name
+    :return: str, the selected format name
+    """
+    if fmt:
+        if fmt not in formats:
+            raise UnsupportedFormat(f"Unsupported format '{fmt}', expected one of {sorted(formats)}")
+        return fmt
+    if not accept:
+        return "json"
+
+    by_media_type = {media_type: name for name, media_type in formats.items()}
+    candidates = []
+    for i, part in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            candidates.append((-q, i, media_type.lower()))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type in by_media_type:
+            return by_media_type[media_type]
+        if media_type in ("*/*", "application/*"):
+            return "json"
+    raise UnsupportedFormat(f"None of the accepted media types are supported: {accept}")
+
+
+def encode_raw(arr: np.ndarray, dtype: str = "f32") -> bytes:
+    """
+    Encode an array as raw little-endian floats preceded by a shape header.
+    :param arr: np.ndarray, the array to encode
+    :param dtype: str, 'f32' or 'f16'
+    :return: bytes, the encoded array
+    """
+    np_dtype = {"f32": "<f4", "f16": "<f2"}[dtype]
+    code = b"f" if dtype == "f32" else b"e"
+    arr = np.ascontiguousarray(arr, dtype=np_dtype)
+    header = RAW_HEADER.pack(RAW_MAGIC, code, arr.ndim) + struct.pack(f"<{arr.ndim}I", *arr.shape)
+    return header + arr.tobytes()
+
+
+def decode_raw(data: bytes) -> np.ndarray:
+    """
+    Decode an array produced by `encode_raw`.
+    :param data: bytes, the encoded array
+    :return: np.ndarray, the decoded array
+    """
+    magic, code, ndim = RAW_HEADER.unpack_from(data)
+    if magic != RAW_MAGIC:
+        raise ValueError("Not a raw array payload")
+    offset = RAW_HEADER.size
+    shape = struct.unpack_from(f"<{ndim}I", data, offset)
+    offset += 4 * ndim
+    dtype = "<f4" if code == b"f" else "<f2"
+    return np.frombuffer(data, dtype=dtype, offset=offset).reshape(shape)
+
+
+def encode_npy(arr: np.ndarray) -> bytes:
+    """
+    Encode an array in the `.npy` file format.
+    :param arr: np.ndarray, the array to encode
+    :return: bytes, the encoded array
+    """
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(arr), allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_keypoints(data: bytes) -> np.ndarray:
+    """
+    Decode query keypoints uploaded as a raw array (see `encode_raw`), a `.npy` file or a JSON list of [x, y].
+    :param data: bytes, the encoded keypoints
+    :return: np.ndarray, the keypoints as float32, their shape is checked by the caller
+    """
+    if data[:4] == RAW_MAGIC:
+        return decode_raw(data).astype(np.float32)
+    if data[:6] == b"\x93NUMPY":
+        return np.load(io.BytesIO(data), allow_pickle=False).astype(np.float32)
+    try:
+        return np.asarray(json.loads(data), dtype=np.float32)
+    except (UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Keypoints must be a raw array, a .npy file or a JSON list of [x, y] pairs")
+
+
+def encode_png16(depth: np.ndarray) -> tuple[bytes, float]:
+    """
+    Encode a depth map as a single channel 16-bit PNG.
+    Depth in [0, 1] is stored as-is, larger values are rescaled by the map maximum.
+    :param depth: np.ndarray, the depth map
+    :return: tuple[bytes, float], the PNG and the scale so that depth = png / 65535 * scale
+    """
+    depth = np.nan_to_num(np.asarray(depth, dtype=np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+    scale = max(float(depth.max(initial=0.0)), 1.0)
+    d16 = np.clip(depth / scale * 65535.0 + 0.5, 0, 65535).astype(np.uint16)
+    ok, buf = cv2.imencode(".png", d16)
+    if not ok:
+        raise ValueError("Cannot encode depth map as PNG")
+    return buf.tobytes(), scale
+
+
+def encode_depth(depth: np.ndarray, fmt: str) -> tuple[bytes, str, dict[str, str]]:
+    """
+    Serialize a depth map in the given format.
+    :param depth: np.ndarray, (H, W) depth map
+    :param fmt: str, one of DEPTH_FORMATS
+    :return: tuple[bytes, str, dict[str, str]], the body, its media type and extra response headers
+    """
+    depth = np.asarray(depth)
+    headers = {"X-Shape": ",".join(str(d) for d in depth.shape)}
+    if fmt == "json":
+        body = json.dumps({
+            "height": depth.shape[0],
+            "width": depth.shape[1],
+            "depth": depth.tolist()
+        }).encode()
+        return body, DEPTH_FORMATS[fmt], {}
+    if fmt in ("f32", "f16"):
+        headers["X-Dtype"] = "float32" if fmt == "f32" else "float16"
+        return encode_raw(depth, fmt), DEPTH_FORMATS[fmt], headers
+    if fmt == "npy":
+        return encode_npy(depth.astype(np.float32)), DEPTH_FORMATS[fmt], headers
+    if fmt == "png16":
+        body, scale = encode_png16(depth)
+        headers["X-Depth-Scale"] = repr(scale)
+        return body, DEPTH_FORMATS[fmt], headers
+    raise UnsupportedFormat(f"Unsupported depth format '{fmt}'")
+
+
+def encode_stream_frame(seq: int, dropped: int, body: bytes, headers: Mapping[str, str]) -> bytes:
+    """
+    Prefix an encoded depth map with the stream frame header.
+    :param seq: int, sequence number of the input frame
+    :param dropped: int, number of input frames dropped so far
+    :param body: bytes, depth map encoded by `encode_depth`
+    :param headers: Mapping[str, str], headers returned by `encode_depth`
+    :return: bytes, the stream frame
+    """
+    scale = float(headers.get("X-Depth-Scale", 1.0))
+    return STREAM_HEADER.pack(STREAM_MAGIC, seq, dropped, scale) + body
+
+
+def decode_stream_frame(data: bytes) -> tuple[int, int, float, bytes]:
+    """
+    Split a frame produced by `encode_stream_frame`.
+    :param data: bytes, the stream frame
+    :return: tuple[int, int, float, bytes], sequence number, dropped frames, depth scale and the encoded depth map
+    """
+    magic, seq, dropped, scale = STREAM_HEADER.unpack_from(data)
+    if magic != STREAM_MAGIC:
+        raise ValueError("Not a depth stream frame")
+    return seq, dropped, scale, data[STREAM_HEADER.size:]
+
+
+def encode_matches(pred: Mapping, fmt: str) -> tuple[bytes, str, dict[str, str]]:
+    """
+    Serialize a RoMa prediction in the given format.
+    :param pred: Mapping, prediction with F, kptsA, kptsB, matches, certainty and the image sizes
+    :param fmt: str, one of MATCH_FORMATS
+    :return: tuple[bytes, str, dict[str, str]], the body, its media type and extra response headers
+    """
+    if fmt == "json":
+        body = json.dumps({
+            k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in pred.items()
+        }).encode()
+        return body, MATCH_FORMATS[fmt], {}
+    if fmt == "columnar":
+        return encode_columnar(pred), MATCH_FORMATS[fmt], {"X-Num-Matches": str(len(pred["kptsA"]))}
+    raise UnsupportedFormat(f"Unsupported match format '{fmt}'")
+
+
+def encode_columnar(pred: Mapping) -> bytes:
+    """
+    Encode a RoMa prediction as a fixed header followed by contiguous little-endian float32 columns:
+    kptsA (N, 2), kptsB (N, 2), certainty (N,) and matches (N, 4). Empty or missing columns are zero filled,
+    e.g. the matches of a query-keypoint result.
+    :param pred: Mapping, the prediction
+    :return: bytes, the encoded prediction
+    """
+    kptsA = np.asarray(pred["kptsA"], dtype="<f4").reshape(-1, 2)
+    n = len(kptsA)
+    columns = [kptsA]
+    for name, width in (("kptsB", 2), ("certainty", 1), ("matches", 4)):
+        col = np.asarray(pred.get(name, []), dtype="<f4").reshape(-1, width)
+        if len(col) == 0:
+            col = np.zeros((n, width), dtype="<f4")
+        if len(col) != n:
+            raise ValueError(f"Column '{name}' has {len(col)} rows, expected {n}")
+        columns.append(col)
+
+    F = pred.get("F")
+    has_F = F is not None
+    F_values = np.asarray(F, dtype=np.float64).reshape(-1)[:9] if has_F else np.full(9, np.nan)
+
+    header = COLUMNAR_HEADER.pack(
+        COLUMNAR_MAGIC, n, int(pred["H_A"]), int(pred["W_A"]), int(pred["H_B"]), int(pred["W_B"]),
+        int(has_F), *F_values.tolist()
+    )
+    return header + b"".join(np.ascontiguousarray(col).tobytes() for col in columns)
+
+
+def decode_columnar(data: bytes) -> dict:
+    """
+    Decode a prediction produced by `encode_columnar`.
+    :param data: bytes, the encoded prediction
+    :return: dict, the prediction with numpy arrays
+    """
+    magic, n, H_A, W_A, H_B, W_B, has_F, *F = COLUMNAR_HEADER.unpack_from(data)
+    if magic != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar match payload")
+    offset = COLUMNAR_HEADER.size
+    columns = {}
+    for name, width in (("kptsA", 2), ("kptsB", 2), ("certainty", 1), ("matches", 4)):
+        count = n * width
+        col = np.frombuffer(data, dtype="<f4", count=count, offset=offset)
+        columns[name] = col.reshape(n, width) if width > 1 else col
+        offset += 4 * count
+    return {
+        "F": np.asarray(F).reshape(3, 3) if has_F else None,
+        **columns,
+        "H_A": H_A, "W_A": W_A, "H_B": H_B, "W_B": W_B,
+    }
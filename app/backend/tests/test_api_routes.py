@@ -65,3 +65,34 @@ def test_predict_roma_invalid_cases(files, expected_status):
     assert response.status_code in expected_status
     for file in files.values():
         file[1].close()
+
+def test_predict_roma_geometry_params():
+    with open("tests/assets/roma_imgA.png", "rb") as f1, open("tests/assets/roma_imgB.png", "rb") as f2:
+        files = {"file1": ("roma_imgA.png", f1.read(), "image/png"), "file2": ("roma_imgB.png", f2.read(), "image/png")}
+    response = client.post("/tiny-roma/predict?estimator=H&max_iters=500&time_budget=30", files=files)
+    assert response.status_code == 200
+    assert response.json()["geometry"]["estimator"] == "H"
+    assert "match;dur=" in response.headers["Server-Timing"]
+    response = client.post("/tiny-roma/predict?estimator=E", files=files)
+    assert response.status_code == 400
+
+def test_match_keypoints_valid():
+    with open("tests/assets/roma_imgA.png", "rb") as f1, open("tests/assets/roma_imgB.png", "rb") as f2:
+        response = client.post("/tiny-roma/match-keypoints?format=columnar", files={
+            "file1": ("roma_imgA.png", f1, "image/png"),
+            "file2": ("roma_imgB.png", f2, "image/png"),
+            "keypoints": ("keypoints.json", b"[[10, 20], [30.5, 40.5]]", "application/json"),
+        })
+    assert response.status_code == 200
+    assert response.headers["x-num-matches"] == "2"
+
+def test_predict_roma_many_valid():
+    with open("tests/assets/roma_imgA.png", "rb") as q, open("tests/assets/roma_imgB.png", "rb") as r:
+        data = r.read()
+        response = client.post("/tiny-roma/predict-many", files=[
+            ("query", ("roma_imgA.png", q, "image/png")),
+            ("references", ("roma_imgB.png", data, "image/png")),
+            ("references", ("roma_imgB.png", data, "image/png")),
+        ])
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 2
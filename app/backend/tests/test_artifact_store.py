@@ -0,0 +1,99 @@
+import pytest
+import torch
+
+import src.model_mangers.roma_manager as rm
+import src.third_party.romatch.models.model_zoo as model_zoo
+import src.utils.artifact_store as artifact_module
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.artifact_store import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path / "store")
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("network access")
+
+    monkeypatch.setattr(torch.hub, "load", fail)
+    monkeypatch.setattr(torch.hub, "load_state_dict_from_url", fail)
+
+
+@pytest.fixture(scope="module")
+def tiny_roma_weights(tmp_path_factory):
+    path = tmp_path_factory.mktemp("weights") / "tiny_roma.pth"
+    torch.manual_seed(0)
+    torch.save(tiny_roma_v1_model(xfeat=XFeatModel()).state_dict(), path)
+    return path
+
+
+def test_add_and_resolve_by_name(store, tmp_path):
+    source = tmp_path / "weights.bin"
+    source.write_bytes(b"weights")
+
+    blob = store.add("weights", source)
+
+    assert blob.read_bytes() == b"weights"
+    assert store.path("weights") == blob
+    assert store.resolve({"artifact": "weights"}) == blob
+    assert ArtifactStore(store.root).entries()["weights"]["bytes"] == 7
+    with pytest.raises(FileNotFoundError):
+        store.path("missing")
+
+
+def test_digest_is_cached_until_file_changes(store, tmp_path, monkeypatch):
+    calls = []
+    sha256 = artifact_module._sha256
+    monkeypatch.setattr(artifact_module, "_sha256", lambda path: calls.append(path) or sha256(path))
+    path = tmp_path / "ckpt.pth"
+    path.write_bytes(b"a")
+
+    first = store.digest(path)
+    assert ArtifactStore(store.root).digest(path) == first
+    assert len(calls) == 1
+
+    path.write_bytes(b"bb")
+    assert store.digest(path) != first
+    assert len(calls) == 2
+
+
+def test_pinned_checkpoint_is_verified(store, tmp_path):
+    path = tmp_path / "ckpt.pth"
+    path.write_bytes(b"original")
+    store.pin(path)
+    assert store.resolve({"checkpoint": path}) == path
+
+    path.write_bytes(b"tampered")
+    with pytest.raises(ValueError, match="sha256"):
+        store.resolve({"checkpoint": path})
+    assert store.resolve({"checkpoint": path}, verify=False) == path
+    with pytest.raises(ValueError, match="not found"):
+        store.resolve({"checkpoint": tmp_path / "missing.pth"})
+
+
+def test_tiny_roma_builds_offline_from_store(store, tiny_roma_weights, no_network, monkeypatch):
+    store.add("tiny_roma_v1_outdoor", tiny_roma_weights)
+    monkeypatch.setattr(model_zoo, "artifact_store", store)
+
+    model = model_zoo.tiny_roma_v1_outdoor(device="cpu")
+
+    expected = torch.load(tiny_roma_weights)
+    for name, value in model.state_dict().items():
+        torch.testing.assert_close(value, expected[name])
+
+
+def test_roma_manager_loads_checkpoint_once(tiny_roma_weights, no_network, monkeypatch):
+    loads = []
+    load = torch.load
+    monkeypatch.setattr(rm.torch, "load", lambda *args, **kwargs: loads.append(args[0]) or load(*args, **kwargs))
+    monkeypatch.setitem(rm.ROMA_MODELS, "local", {"checkpoint": tiny_roma_weights})
+
+    model = RomaManager()._load_model("local", device="cpu")
+
+    assert loads == [tiny_roma_weights]
+    assert not model.training
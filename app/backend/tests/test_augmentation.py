@@ -0,0 +1,70 @@
+import sys
+import zipfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "scripts" / "nerf-scripts"))
+import augmentation  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def archives(tmp_path_factory):
+    """
+    Two zipped scenes of 24x32 frames, one frame without depth.
+    """
+    rng = np.random.default_rng(0)
+    input_dir = tmp_path_factory.mktemp("zips")
+    for scene, count in (("fire", 5), ("office", 3)):
+        with zipfile.ZipFile(input_dir / f"{scene}.zip", "w") as z:
+            for i in range(count):
+                rgb = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+                depth = rng.integers(0, 65535, (24, 32), dtype=np.uint16)
+                z.writestr(f"images/frame-{i:06d}.color.png", cv2.imencode(".png", rgb)[1].tobytes())
+                if (scene, i) != ("office", 2):
+                    z.writestr(f"depths/frame-{i:06d}.depth.png", cv2.imencode(".png", depth)[1].tobytes())
+    return input_dir
+
+
+def _outputs(output_dir):
+    return {str(p.relative_to(output_dir)): p.read_bytes() for p in sorted(Path(output_dir).rglob("*"))
+            if p.is_file() and p.name != augmentation.MANIFEST}
+
+
+def test_output_does_not_depend_on_the_workers(archives, tmp_path):
+    serial = augmentation.augment(archives, tmp_path / "serial", seed=3, workers=0, progress=False)
+    augmentation.augment(archives, tmp_path / "pool", seed=3, workers=2, chunksize=1, progress=False)
+
+    outputs = _outputs(tmp_path / "serial")
+    assert serial["frames"] == 8 and serial["fps"] > 0
+    # 8 colour frames, 7 depth maps saved as npy and png
+    assert len(outputs) == 8 + 2 * 7
+    assert outputs == _outputs(tmp_path / "pool")
+    augmentation.augment(archives, tmp_path / "other", seed=4, workers=0, progress=False)
+    assert outputs != _outputs(tmp_path / "other")
+
+
+def test_resumed_run_matches_an_uninterrupted_one(archives, tmp_path):
+    augmentation.augment(archives, tmp_path / "full", seed=3, workers=0, progress=False)
+    augmentation.augment(archives, tmp_path / "resumed", seed=3, workers=0, progress=False)
+    # an interrupted run: the manifest ends in a partial line and a recorded frame lost one of its outputs
+    manifest = tmp_path / "resumed" / augmentation.MANIFEST
+    lines = manifest.read_text().splitlines()
+    manifest.write_text("\n".join(lines[:4]) + "\n" + lines[4][:20])
+    (tmp_path / "resumed" / "fire" / "depths" / "frame-000001.depth.png").unlink()
+    (tmp_path / "resumed" / "office" / "images" / "frame-000000.color.png").write_bytes(b"stale")
+
+    stats = augmentation.augment(archives, tmp_path / "resumed", seed=3, workers=2, progress=False)
+
+    # frames 0, 2 and 3 of fire are skipped, fire/1 and everything after the partial line are redone
+    assert (stats["frames"], stats["skipped"]) == (5, 3)
+    assert _outputs(tmp_path / "resumed") == _outputs(tmp_path / "full")
+    assert augmentation.augment(archives, tmp_path / "resumed", seed=3, workers=2, progress=False)["frames"] == 0
+
+
+def test_write_removes_its_temporary_file_on_failure(tmp_path):
+    with pytest.raises(TypeError):
+        augmentation._write(tmp_path / "frame.png", "not bytes")
+    assert list(tmp_path.iterdir()) == []
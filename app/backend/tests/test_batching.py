@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from src.model_mangers.batching import MicroBatcher, then
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.executor import InferenceExecutor
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+
+
+@pytest.fixture
+def recorder():
+    calls = []
+
+    def run_batch(key, items):
+        calls.append((key, list(items)))
+        return [(key, item * 2) for item in items]
+
+    return calls, run_batch
+
+
+def test_groups_requests_by_key(recorder):
+    calls, run_batch = recorder
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=50)
+
+    futures = [batcher.submit("a" if i % 2 else "b", i) for i in range(6)]
+    results = [f.result(timeout=5) for f in futures]
+    batcher.close()
+
+    assert results == [("a" if i % 2 else "b", i * 2) for i in range(6)]
+    assert sorted(len(items) for _, items in calls) == [3, 3]
+    for key, items in calls:
+        assert all(("a" if i % 2 else "b") == key for i in items)
+
+
+def test_respects_max_batch_size(recorder):
+    calls, run_batch = recorder
+    batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait_ms=50)
+
+    futures = [batcher.submit("k", i) for i in range(7)]
+    assert [f.result(timeout=5)[1] for f in futures] == [i * 2 for i in range(7)]
+    batcher.close()
+
+    assert all(len(items) <= 3 for _, items in calls)
+    assert batcher.stats()["requests"] == 7
+
+
+def test_single_request_waits_at_most_max_wait(recorder):
+    _, run_batch = recorder
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=20)
+
+    start = time.perf_counter()
+    batcher.submit("k", 1).result(timeout=5)
+    assert time.perf_counter() - start < 1.0
+    batcher.close()
+
+
+def test_batch_errors_propagate_to_every_caller():
+    def run_batch(key, items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=20)
+    futures = [batcher.submit("k", i) for i in range(3)]
+    for f in futures:
+        with pytest.raises(ValueError):
+            f.result(timeout=5)
+    batcher.close()
+
+
+def test_concurrent_submitters_share_batches(recorder):
+    calls, run_batch = recorder
+    batcher = MicroBatcher(run_batch, max_batch_size=16, max_wait_ms=100)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.submit("k", i).result(timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert results == {i: ("k", i * 2) for i in range(10)}
+    stats = batcher.stats()
+    assert stats["requests"] == 10
+    assert stats["batches"] < 10
+    assert stats["avg_batch_size"] > 1
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda k, items: items, max_batch_size=0)
+
+
+@pytest.mark.parametrize("h,w,expected", [
+    (480, 640, (518, 686)),
+    (518, 518, (518, 518)),
+    (640, 480, (686, 518)),
+])
+def test_depth_input_shape(h, w, expected):
+    shape = DepthAnythingV2.input_shape(h, w)
+    assert shape == expected
+    assert shape[0] % 14 == 0 and shape[1] % 14 == 0
+
+
+def test_then_chains_results_and_errors():
+    future = Future()
+    chained = then(future, lambda x: x + 1)
+    assert not chained.done()
+    future.set_result(1)
+    assert chained.result(timeout=5) == 2
+
+    failed = Future()
+    failed.set_exception(ValueError("boom"))
+    with pytest.raises(ValueError):
+        then(failed, lambda x: x).result(timeout=5)
+
+
+class SlowDepth(torch.nn.Module):
+    def infer_image(self, image):
+        time.sleep(0.05)
+        return np.ones(image.shape[:2], dtype=np.float32)
+
+    def infer_batch(self, images):
+        time.sleep(0.05)
+        return [np.ones(image.shape[:2], dtype=np.float32) for image in images]
+
+
+def test_depth_batches_are_not_capped_by_the_executor_workers(monkeypatch):
+    monkeypatch.setattr(DepthManager, "_load_model", lambda self, model_name: SlowDepth())
+    manager = DepthManager(batching={'enabled': True, 'max_batch_size': 8, 'max_wait_ms': 500}, cache=None)
+    executor = InferenceExecutor("test-worker", workers=2)
+    image = cv2.imencode(".png", np.zeros((48, 64, 3), dtype=np.uint8))[1].tobytes()
+
+    async def request():
+        # as the /predict route: decode and queue on the executor, await the batch off it
+        pending = await executor.run(manager.submit, image, normalize=False)
+        return await asyncio.wrap_future(pending)
+
+    async def main():
+        return await asyncio.gather(*(request() for _ in range(8)))
+
+    depths = asyncio.run(main())
+    executor.shutdown()
+
+    assert all(depth.shape == (48, 64) for depth in depths)
+    stats = manager.get_stats()["batching"]
+    assert stats["requests"] == 8
+    assert stats["avg_batch_size"] > executor.workers
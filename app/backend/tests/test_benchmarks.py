@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from benchmarks import stand_ins
+from benchmarks.serve_bench import build_plan, percentile, summarize
+
+
+@pytest.fixture
+def scenes():
+    frames = [cv2.imencode(".jpg", np.full((32, 48, 3), i * 40, dtype=np.uint8))[1].tobytes() for i in range(3)]
+    return {"a": frames, "b": frames[:1]}
+
+
+def _plan(scenes, **kwargs):
+    args = dict(requests=20, mix={"depth": 1.0, "roma": 1.0}, switch_every=0, depth_models=["x"],
+                roma_models=["y"], depth_format="f32", roma_format="json", seed=0)
+    args.update(kwargs)
+    return build_plan(scenes, **args)
+
+
+def test_plan_is_deterministic(scenes):
+    first, second = _plan(scenes), _plan(scenes)
+    assert [(r.kind, r.path, r.files) for r in first] == [(r.kind, r.path, r.files) for r in second]
+    assert {r.kind for r in first} == {"depth", "roma"}
+
+
+def test_plan_inserts_model_switches(scenes):
+    plan = _plan(scenes, switch_every=5, depth_models=["d1", "d2"], roma_models=["r1"])
+    selects = [(r.path, r.json["model_name"]) for r in plan if r.kind == "select"]
+    assert selects == [
+        ("/depth-anything-v2/select", "d2"), ("/tiny-roma/select", "r1"), ("/depth-anything-v2/select", "d1"),
+    ]
+
+
+def test_summary_percentiles():
+    samples = [("depth", i / 1000.0, 200) for i in range(1, 101)] + [("roma", 1.0, 500)]
+    report = summarize(samples, elapsed=2.0)
+
+    assert percentile([1.0, 2.0, 3.0], 50) == 2.0
+    assert report["by_kind"]["depth"]["latency_ms"]["p95"] == pytest.approx(95.0)
+    assert report["by_kind"]["roma"]["errors"] == 1
+    assert report["overall"]["rps"] == pytest.approx(50.5)
+
+
+def test_stand_in_models_are_deterministic():
+    img = np.random.default_rng(0).integers(0, 255, (50, 70, 3), dtype=np.uint8)
+    first = stand_ins.load_depth_stand_in(None, "base_vitb", device="cpu")
+    second = stand_ins.load_depth_stand_in(None, "base_vitb", device="cpu")
+
+    depth = first.infer_image(img)
+    assert depth.shape == (50, 70)
+    np.testing.assert_array_equal(depth, second.infer_image(img))
+    with pytest.raises(ValueError):
+        stand_ins.load_depth_stand_in(None, "missing", device="cpu")
+
+
+def test_roma_stand_in_matches():
+    model = stand_ins.load_roma_stand_in(None, "base", device="cpu")
+    im = torch.rand(1, 3, 64, 64)
+    warp, certainty = model.match(im, im, batched=False)
+    assert warp.shape == (64, 64, 4)
+    assert certainty.shape == (64, 64)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import torch
+
+import src.model_mangers.model_manager as mm
+import src.model_mangers.roma_manager as rm
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.artifact_store import ArtifactStore
+
+
+def _roma(**kwargs):
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel(), **kwargs).eval()
+
+
+@pytest.mark.parametrize("exact_softmax", [False, True])
+def test_chunked_pos_embed_matches_full_volume(exact_softmax):
+    model = _roma(exact_softmax=exact_softmax)
+    feat0, feat1 = torch.randn(2, 64, 12, 16), torch.randn(2, 64, 16, 20)
+    reference = model.pos_embed(model.corr_volume(feat0, feat1))
+
+    for max_bytes in (1, 100_000, 10 ** 9):
+        torch.testing.assert_close(model.chunked_pos_embed(feat0, feat1, max_bytes), reference)
+
+
+def test_forward_chunks_volumes_above_the_ceiling(monkeypatch):
+    model = _roma()
+    rng = np.random.default_rng(0)
+    imA, imB = rng.integers(0, 256, (64, 96, 3), dtype=np.uint8), rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)
+    reference, _ = model.match(imA, imB, batched=False)
+    shapes = []
+    corr_volume = model.corr_volume
+    monkeypatch.setattr(model, "corr_volume", lambda f0, f1: shapes.append(tuple(f0.shape)) or corr_volume(f0, f1))
+
+    model.corr_max_bytes = 8 * 12 * 8 * 12 * 4 - 1
+    warp, _ = model.match(imA, imB, batched=False)
+
+    torch.testing.assert_close(warp, reference)
+    assert len(shapes) > 1 and sum(s[2] for s in shapes) == 8
+
+
+def test_roma_manager_sets_the_ceiling(tmp_path, monkeypatch):
+    checkpoint = tmp_path / "tiny_roma.pth"
+    torch.save(_roma().state_dict(), checkpoint)
+    monkeypatch.setitem(rm.ROMA_MODELS, "local", {"checkpoint": checkpoint})
+    store = ArtifactStore(tmp_path / "store")
+    monkeypatch.setattr(rm, "artifact_store", store)
+    monkeypatch.setattr(mm, "artifact_store", store)
+
+    manager = RomaManager(base_model="local", cache=None, backend=None, correlation={'max_bytes': 1024})
+
+    assert manager.get_model().corr_max_bytes == 1024
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+import torch
+
+import src.model_mangers.compiled as compiled
+import src.model_mangers.model_manager as mm
+import src.model_mangers.roma_manager as rm
+from src.model_mangers.compiled import artifact_path, compile_model, compiled_stats
+from src.model_mangers.executor import ReplicaSet
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.artifact_store import ArtifactStore
+
+DIGEST = "ab" * 32
+SIZE = (64, 96)
+
+
+def _roma():
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel()).eval()
+
+
+def _images(h, w):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (h, w, 3), dtype=np.uint8), rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    calls = []
+    build = compiled._build
+    monkeypatch.setattr(compiled, "_build", lambda *args: calls.append(args[2]) or build(*args))
+    return calls
+
+
+def test_compiled_roma_matches_eager_and_falls_back(tmp_path, builds):
+    model = _roma()
+    imA, imB = _images(*SIZE)
+    reference, _ = model.match(imA, imB, batched=False)
+
+    compile_model(model, "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+    warp, _ = model.match(imA, imB, batched=False)
+    model.match(*_images(32, 64), batched=False)
+
+    torch.testing.assert_close(warp, reference)
+    assert builds == [artifact_path(tmp_path, "tiny_roma", DIGEST, "export", SIZE, "cpu")]
+    stats = compiled_stats(model)
+    assert stats["shapes"] == ["64x96"]
+    assert (stats["compiled_calls"], stats["eager_calls"]) == (1, 1)
+
+
+def test_graphs_are_cached_by_checkpoint_digest(tmp_path, builds):
+    compile_model(_roma(), "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+    compile_model(_roma(), "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+    assert len(builds) == 1
+
+    compile_model(_roma(), "tiny_roma", "cd" * 32, "export", [SIZE], tmp_path)
+    assert len(builds) == 2
+    assert len(list(tmp_path.glob("*.pt2"))) == 2
+
+
+def test_replicas_share_compiled_graphs(tmp_path):
+    model = compile_model(_roma(), "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+    replicas = ReplicaSet(model, replicas=2)
+
+    with torch.no_grad():
+        replicas.models[1].match(*_images(*SIZE), batched=False)
+
+    assert replicas.models[1] is not model
+    assert compiled_stats(model)["compiled_calls"] == 1
+
+
+def test_failed_shapes_run_eagerly(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("unsupported operator")
+
+    monkeypatch.setattr(torch.export, "export", fail)
+    model = _roma()
+    with pytest.warns(UserWarning, match="unsupported operator"):
+        compile_model(model, "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+
+    model.match(*_images(*SIZE), batched=False)
+    assert compiled_stats(model)["failed"] == {"64x96": "unsupported operator"}
+    assert compiled_stats(model)["eager_calls"] == 1
+
+
+def test_only_fp32_models_are_compiled(tmp_path):
+    model = _roma()
+    model.inference_precision = "bf16"
+    with pytest.warns(UserWarning, match="fp32"):
+        compile_model(model, "tiny_roma", DIGEST, "export", [SIZE], tmp_path)
+    assert compiled_stats(model) is None
+    with pytest.raises(ValueError):
+        compile_model(_roma(), "tiny_roma", DIGEST, "onnx", [SIZE], tmp_path)
+
+
+def test_compiled_depth_matches_eager(tmp_path):
+    torch.manual_seed(0)
+    model = DepthAnythingV2(encoder='vits', features=64, out_channels=[48, 96, 192, 384]).eval()
+    image = _images(100, 140)[0]
+    reference = model.infer_image(image)
+
+    compile_model(model, "depth_anything", DIGEST, "export", [(100, 140)], tmp_path)
+
+    np.testing.assert_allclose(model.infer_image(image), reference, atol=1e-5)
+    assert compiled_stats(model)["shapes"] == ["x".join(map(str, DepthAnythingV2.input_shape(100, 140)))]
+    assert compiled_stats(model)["compiled_calls"] == 1
+
+
+def test_roma_manager_compiles_loaded_checkpoint(tmp_path, monkeypatch):
+    checkpoint = tmp_path / "tiny_roma.pth"
+    torch.save(_roma().state_dict(), checkpoint)
+    monkeypatch.setitem(rm.ROMA_MODELS, "local", {"checkpoint": checkpoint})
+    store = ArtifactStore(tmp_path / "store")
+    monkeypatch.setattr(rm, "artifact_store", store)
+    monkeypatch.setattr(mm, "artifact_store", store)
+    backend = {'backend': 'export', 'cache_dir': tmp_path / "compiled", 'sizes': {'tiny_roma': [SIZE]}}
+    manager = RomaManager(base_model="local", cache=None, backend=backend)
+
+    manager.predict(*_images(*SIZE), as_numpy=True)
+
+    digest = store.digest(checkpoint)
+    assert artifact_path(tmp_path / "compiled", "tiny_roma", digest, "export", SIZE, "cpu").is_file()
+    assert manager.get_stats()["compiled"]["local"]["compiled_calls"] == 1
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+from unittest.mock import MagicMock
+
+from src.model_mangers.depth_manager import DepthManager
+from src.utils import depth_tiling
+from src.utils.depth_tiling import align_scale_shift, blend_weights, infer_tiled, tile_batch_size, tile_grid
+
+
+class LocalDepth(nn.Module):
+    """
+    A model whose depth at a pixel only depends on that pixel, so tiling must reproduce the
+    whole-image prediction exactly. Every forward pass applies its own scale and shift, like the
+    per-pass affine ambiguity of relative depth.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.weight = nn.Parameter(torch.ones(1))
+        self.batches = []
+
+    def forward(self, x):
+        self.batches.append(x.shape[0])
+        return x[:, 0] * (1 + len(self.batches)) + len(self.batches)
+
+    def infer_image(self, raw_image, input_size=518):
+        rgb = cv2.cvtColor(raw_image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        return (rgb[..., 0] - 0.485) / 0.229
+
+
+@pytest.mark.parametrize("length, tile, overlap", [(518, 518, 128), (1000, 518, 128), (2000, 518, 129), (600, 518, 0)])
+def test_tile_grid_covers_image_with_overlap(length, tile, overlap):
+    starts = tile_grid(length, tile, overlap)
+
+    assert starts[0] == 0
+    assert starts[-1] + tile == max(length, tile)
+    for a, b in zip(starts, starts[1:]):
+        assert tile - (b - a) >= overlap
+
+
+def test_blend_weights_only_ramp_on_shared_edges():
+    w = blend_weights(8, 10, ramp=3, top=False, bottom=True, left=True, right=False)
+
+    assert w[0, -1] == 1.0
+    assert w[-1, -1] < w[-2, -1] < w[-3, -1] < w[-4, -1] == 1.0
+    assert w[0, 0] < w[0, 1] < w[0, 2] < w[0, 3] == 1.0
+    assert (w > 0).all()
+
+
+def test_align_scale_shift_recovers_affine():
+    pred = np.random.default_rng(0).random((16, 16)).astype(np.float32)
+    assert align_scale_shift(pred, 2.5 * pred - 1.0) == pytest.approx((2.5, -1.0), abs=1e-5)
+    assert align_scale_shift(np.zeros((4, 4)), np.full((4, 4), 3.0)) == (0.0, 3.0)
+
+
+def test_tiled_matches_whole_image_for_local_model():
+    img = np.random.default_rng(1).integers(0, 255, (300, 460, 3), dtype=np.uint8)
+    model = LocalDepth()
+
+    depth = infer_tiled(model, img, tile_size=140, overlap=0.25, memory_cap_bytes=1)
+
+    assert depth.shape == (300, 460)
+    assert set(model.batches) == {1}
+    np.testing.assert_allclose(depth, model.infer_image(img), atol=1e-4)
+
+
+def test_tiles_are_batched_under_memory_cap(monkeypatch):
+    monkeypatch.setattr(depth_tiling, "estimate_tile_bytes", lambda model, h, w: 100)
+    img = np.random.default_rng(2).integers(0, 255, (300, 460, 3), dtype=np.uint8)
+    model = LocalDepth()
+
+    depth = infer_tiled(model, img, tile_size=140, overlap=0.25, memory_cap_bytes=350)
+
+    assert max(model.batches) == 3
+    assert tile_batch_size(model, 140, 140, 10, num_tiles=5) == 1
+    np.testing.assert_allclose(depth, model.infer_image(img), atol=1e-4)
+
+
+def test_small_image_falls_back_to_whole_image():
+    img = np.zeros((100, 120, 3), dtype=np.uint8)
+    model = LocalDepth()
+
+    infer_tiled(model, img, tile_size=518)
+
+    assert model.batches == []
+
+
+def test_depth_manager_tiled_bypasses_batcher(monkeypatch):
+    model = MagicMock()
+    model.infer_image.return_value = np.zeros((40, 40), dtype=np.float32)
+    monkeypatch.setattr(DepthManager, "_load_model", lambda self, name: model)
+    monkeypatch.setattr(DepthManager, "checkpoint_digest", staticmethod(lambda name: b"weights"))
+    tiled = MagicMock(return_value=np.ones((40, 40), dtype=np.float32))
+    monkeypatch.setattr("src.model_mangers.depth_manager.infer_tiled", tiled)
+
+    tiling = {'auto': True, 'auto_min_side': 32, 'tile_size': 14, 'overlap': 0.25, 'max_side': None,
+              'memory_cap_bytes': 1024}
+    manager = DepthManager(batching={"enabled": True}, cache={"enabled": True, "max_bytes": 1024 ** 2}, tiling=tiling)
+    _, png = cv2.imencode(".png", np.zeros((40, 40, 3), dtype=np.uint8))
+
+    manager.predict(png.tobytes(), normalize=False)
+    manager.predict(png.tobytes(), normalize=False, tiled=True)
+    manager.predict(png.tobytes(), normalize=False, tiled=False)
+
+    assert tiled.call_count == 1
+    assert tiled.call_args.kwargs["tile_size"] == 14
+    assert manager.get_stats()["batching"]["requests"] == 1
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import torch
+
+from src.model_mangers import executor as executor_module
+from src.model_mangers.executor import InferenceExecutor, ReplicaSet
+
+
+def test_replicas_are_independent_copies():
+    replicas = ReplicaSet(torch.nn.Linear(4, 1), replicas=3)
+    assert len(replicas) == 3
+    assert replicas.models[0] is replicas.primary
+    assert replicas.models[1].weight.data_ptr() != replicas.models[0].weight.data_ptr()
+    torch.testing.assert_close(replicas.models[1].weight, replicas.models[0].weight)
+
+
+def test_each_replica_is_used_by_one_thread_at_a_time():
+    replicas = ReplicaSet(torch.nn.Linear(1, 1), replicas=2)
+    in_use, peak, lock = set(), [0], threading.Lock()
+
+    def work():
+        with replicas.acquire() as model:
+            with lock:
+                assert id(model) not in in_use
+                in_use.add(id(model))
+                peak[0] = max(peak[0], len(in_use))
+            time.sleep(0.05)
+            with lock:
+                in_use.discard(id(model))
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak[0] == 2
+    stats = replicas.stats()
+    assert stats["in_use"] == 0
+    assert stats["waiting"] == 0
+    assert all(b > 0 for b in stats["busy_seconds"])
+    assert all(0 < u <= 1 for u in stats["utilization"])
+
+
+def test_executor_runs_off_the_event_loop():
+    executor = InferenceExecutor("test-worker", workers=2)
+    loop_thread = threading.get_ident()
+
+    async def main():
+        return await asyncio.gather(*(executor.run(threading.get_ident) for _ in range(4)))
+
+    idents = asyncio.run(main())
+    executor.shutdown()
+
+    assert loop_thread not in idents
+    stats = executor.stats()
+    assert stats["completed"] == 4
+    assert stats["queued"] == 0 and stats["running"] == 0
+
+
+def test_executor_propagates_exceptions():
+    executor = InferenceExecutor("test-worker", workers=1)
+
+    def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(boom))
+    executor.shutdown()
+
+
+def test_invalid_replica_count():
+    with pytest.raises(ValueError):
+        ReplicaSet(torch.nn.Linear(1, 1), replicas=0)
+
+
+def test_cpu_threads_split_between_all_replicas(monkeypatch):
+    monkeypatch.setattr(executor_module.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(executor_module, "DEVICE", "cpu")
+    assert executor_module.cpu_threads() is None
+
+    monkeypatch.setitem(executor_module.DEPTH_EXECUTION, "replicas", 2)
+    monkeypatch.setitem(executor_module.ROMA_EXECUTION, "replicas", 2)
+    assert executor_module.cpu_threads() == 2
+
+    monkeypatch.setattr(executor_module, "DEVICE", "cuda")
+    assert executor_module.cpu_threads() is None
+
+
+def test_threads_are_configured_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(executor_module, "_threads_configured", False)
+    monkeypatch.setattr(executor_module, "cpu_threads", lambda: 3)
+    monkeypatch.setattr(executor_module.torch, "set_num_threads", calls.append)
+
+    executor_module.configure_threads()
+    executor_module.configure_threads()
+
+    assert calls == [3]
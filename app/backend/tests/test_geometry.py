@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from src.model_mangers.geometry import GeometryPool, estimate_geometry, resolve_geometry
+from src.model_mangers.roma_manager import GEOMETRY, RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+
+K = np.array([[500.0, 0, 320], [0, 500, 240], [0, 0, 1]])
+
+
+def _two_views(n=400, outliers=80, seed=0):
+    """Projections of random 3D points in two calibrated views, with a share of random outlier matches."""
+    rng = np.random.default_rng(seed)
+    X = rng.uniform([-2, -2, 4], [2, 2, 8], (n, 3))
+    angle = 0.1
+    R = np.array([[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]])
+    t = np.array([0.5, 0.05, 0.0])
+    xA = (K @ X.T).T
+    xB = (K @ (X @ R.T + t).T).T
+    kptsA = (xA[:, :2] / xA[:, 2:]).astype(np.float32)
+    kptsB = (xB[:, :2] / xB[:, 2:]).astype(np.float32)
+    kptsB[:outliers] = rng.uniform([0, 0], [640, 480], (outliers, 2)).astype(np.float32)
+    return kptsA, kptsB
+
+
+def _epipolar_error(F, kptsA, kptsB):
+    a = np.c_[kptsA, np.ones(len(kptsA))]
+    b = np.c_[kptsB, np.ones(len(kptsB))]
+    lines = a @ F.T
+    return np.abs((b * lines).sum(axis=1)) / np.linalg.norm(lines[:, :2], axis=1)
+
+
+def test_resolve_geometry_validates_requests():
+    params = resolve_geometry(GEOMETRY, {"estimator": "H", "max_iters": None})
+    assert params["estimator"] == "H" and params["max_iters"] == GEOMETRY["max_iters"]
+    for overrides in ({"estimator": "P"}, {"estimator": "E"}, {"confidence": 1.0}, {"time_budget": 0},
+                      {"intrinsics": [K.tolist()], "estimator": "E"}, {"iterations": 10}):
+        with pytest.raises(ValueError):
+            resolve_geometry(GEOMETRY, overrides)
+    params = resolve_geometry(GEOMETRY, {"estimator": "E", "intrinsics": [K.tolist(), K.tolist()]})
+    assert params["intrinsics"][1][0][0] == 500.0
+
+
+@pytest.mark.parametrize("estimator", ["F", "E"])
+def test_estimators_reject_outliers(estimator):
+    kptsA, kptsB = _two_views()
+    params = resolve_geometry(GEOMETRY, {"estimator": estimator, "threshold": 1.0,
+                                         "intrinsics": [K.tolist(), K.tolist()]})
+
+    matrix, F, inliers, seconds = estimate_geometry(kptsA, kptsB, params)
+
+    assert matrix.shape == (3, 3) and seconds >= 0
+    assert inliers[80:].mean() > 0.95 and inliers[:80].mean() < 0.1
+    assert np.median(_epipolar_error(F, kptsA[80:], kptsB[80:])) < 0.5
+
+    _, F, inliers, _ = estimate_geometry(kptsA, kptsB, resolve_geometry(GEOMETRY, {"estimator": "none"}))
+    assert F is None and inliers.all()
+
+
+def test_predict_verifies_after_releasing_the_replica():
+    torch.manual_seed(0)
+    model = tiny_roma_v1_model(xfeat=XFeatModel(), exact_softmax=True).eval()
+    manager = RomaManager(base_model="local", cache={'enabled': True, 'max_bytes': 64 * 1024 ** 2}, backend=None,
+                          geometry={'workers': 0, 'default': GEOMETRY})
+    manager._load_model = lambda model_name: model
+    manager.checkpoint_digest = lambda model_name: "weights"
+    rng = np.random.default_rng(0)
+    imA, imB = (rng.integers(0, 256, (64, 96, 3), dtype=np.uint8) for _ in range(2))
+    in_use = []
+    submit = manager._geometry.submit
+    manager._geometry.submit = lambda *args: in_use.append(manager.pool_stats()["replicas"]["local"]["in_use"]) \
+        or submit(*args)
+
+    prediction = manager.predict(imA, imB, as_numpy=True, geometry={"estimator": "H"})
+
+    assert in_use == [0]
+    assert prediction["geometry"]["estimator"] == "H" and prediction["F"] is None
+    assert prediction["geometry"]["inliers"] == len(prediction["kptsA"])
+    assert {"decode", "wait", "match", "sample", "geometry", "total"} <= set(prediction["timings"])
+    # other geometry parameters are other cache entries
+    assert "cache" in manager.predict(imA, imB, as_numpy=True, geometry={"estimator": "H"})["timings"]
+    assert "cache" not in manager.predict(imA, imB, as_numpy=True, geometry={"estimator": "none"})["timings"]
+
+
+def test_pool_time_budget():
+    kptsA, kptsB = _two_views()
+    pool = GeometryPool(workers=1)
+    try:
+        # the worker process is not even started within the budget
+        params = resolve_geometry(GEOMETRY, {"time_budget": 1e-3})
+        submitted = time.perf_counter()
+        assert GeometryPool.result(pool.submit(kptsA, kptsB, params), params, submitted) is None
+
+        params = resolve_geometry(GEOMETRY, {"threshold": 1.0})
+        submitted = time.perf_counter()
+        matrix, F, inliers, _ = GeometryPool.result(pool.submit(kptsA, kptsB, params), params, submitted)
+        np.testing.assert_allclose(F, matrix)
+        assert inliers[80:].mean() > 0.95
+    finally:
+        pool.shutdown()
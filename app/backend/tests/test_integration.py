@@ -7,6 +7,7 @@ import io
 from PIL import Image
 import src.routes.depth_route as depth_route
 import src.routes.roma_route as roma_route
+from src.model_mangers.batching import completed
 
 client = TestClient(app)
 
@@ -17,6 +18,8 @@ def mock_depth_model(monkeypatch):
     mock_manager.select_model.return_value = {"model_name": "mock_model"}
     mock_manager.get_spec.return_value = {"model_name": "mock_model"}
     mock_manager.predict.return_value = np.array([[0.1] * 3] * 3)
+    mock_manager.submit.side_effect = lambda *args, **kwargs: completed(np.array([[0.1] * 3] * 3))
+    mock_manager.infer_frame.return_value = np.array([[0.1] * 3] * 3)
 
     monkeypatch.setattr(depth_route, "depth_manager", mock_manager)
 
@@ -31,6 +34,10 @@ def mock_roma_model(monkeypatch):
         "F": None, "matches": [], "certainty": [],
         "H_A": 100, "W_A": 100, "H_B": 100, "W_B": 100
     }
+    mock_manager.match_keypoints.return_value = {
+        "kptsA": np.array([[10, 20]]), "kptsB": np.array([[15, 25]]), "certainty": np.array([0.9]),
+        "H_A": 100, "W_A": 100, "H_B": 100, "W_B": 100, "timings": {"match": 0.01}
+    }
 
     monkeypatch.setattr(roma_route, "roma_manager", mock_manager)
 
@@ -74,3 +81,117 @@ def test_roma_predict_with_mock_images():
         "file2": ("b.jpg", b2, "image/jpeg")
     })
     assert res.status_code == 200
+
+
+def _png_bytes(color="white", size=(100, 100)):
+    img = Image.new("RGB", size, color=color)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize("fmt,media_type", [
+    ("f32", "application/x-float32"),
+    ("f16", "application/x-float16"),
+    ("npy", "application/x-npy"),
+    ("png16", "image/png"),
+])
+def test_depth_predict_binary_formats(fmt, media_type):
+    res = client.post(f"/depth-anything-v2/predict?format={fmt}",
+                      files={"file": ("test.png", _png_bytes(), "image/png")})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith(media_type)
+    assert res.headers["x-shape"] == "3,3"
+
+
+def test_depth_predict_accept_header():
+    res = client.post("/depth-anything-v2/predict", headers={"Accept": "application/x-float16"},
+                      files={"file": ("test.png", _png_bytes(), "image/png")})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-float16")
+
+
+def test_depth_predict_unsupported_format():
+    res = client.post("/depth-anything-v2/predict?format=xml",
+                      files={"file": ("test.png", _png_bytes(), "image/png")})
+    assert res.status_code == 406
+
+
+def test_roma_predict_columnar():
+    res = client.post("/tiny-roma/predict?format=columnar", files={
+        "file1": ("a.png", _png_bytes("blue"), "image/png"),
+        "file2": ("b.png", _png_bytes("green"), "image/png")
+    })
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-roma-columnar")
+    assert res.headers["x-num-matches"] == "1"
+
+
+def test_roma_match_keypoints():
+    res = client.post("/tiny-roma/match-keypoints", files={
+        "file1": ("a.png", _png_bytes("blue"), "image/png"),
+        "file2": ("b.png", _png_bytes("green"), "image/png"),
+        "keypoints": ("keypoints.json", b"[[10, 20]]", "application/json"),
+    })
+    assert res.status_code == 200
+    assert res.json()["kptsB"] == [[15, 25]]
+    assert res.headers["Server-Timing"] == "match;dur=10.0"
+    keypoints = roma_route.roma_manager.match_keypoints.call_args.args[2]
+    np.testing.assert_array_equal(keypoints, [[10, 20]])
+
+
+def test_roma_match_keypoints_columnar():
+    res = client.post("/tiny-roma/match-keypoints?format=columnar", files={
+        "file1": ("a.png", _png_bytes("blue"), "image/png"),
+        "file2": ("b.png", _png_bytes("green"), "image/png"),
+        "keypoints": ("keypoints.json", b"[[10, 20]]", "application/json"),
+    })
+    assert res.status_code == 200
+    assert res.headers["x-num-matches"] == "1"
+
+
+def test_roma_match_keypoints_invalid_keypoints():
+    res = client.post("/tiny-roma/match-keypoints", files={
+        "file1": ("a.png", _png_bytes("blue"), "image/png"),
+        "file2": ("b.png", _png_bytes("green"), "image/png"),
+        "keypoints": ("keypoints.json", b"not json", "application/json"),
+    })
+    assert res.status_code == 400
+
+
+def test_depth_stream_returns_frames_in_order():
+    from src.utils.serialization import decode_raw, decode_stream_frame
+
+    with client.websocket_connect("/depth-anything-v2/stream?policy=block") as ws:
+        for _ in range(3):
+            ws.send_bytes(_png_bytes().getvalue())
+        ws.send_text("end")
+        frames = [decode_stream_frame(ws.receive_bytes()) for _ in range(3)]
+
+    assert [seq for seq, _, _, _ in frames] == [0, 1, 2]
+    assert decode_raw(frames[0][3]).shape == (3, 3)
+
+
+def test_depth_stream_rejects_unknown_policy():
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/depth-anything-v2/stream?policy=unknown") as ws:
+            ws.receive_bytes()
+    assert exc.value.code == 1008
+
+
+def test_metrics_exposition():
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert "# TYPE nerf_stage_seconds histogram" in res.text
+    assert "nerf_metrics_enabled" in res.text
+
+
+def test_health_answers_before_models_load():
+    res = client.get("/health")
+    assert res.status_code == 200
+    assert res.json()["status"] == "ok"
+    assert "warmup" in res.json()
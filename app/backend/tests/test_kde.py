@@ -0,0 +1,43 @@
+import pytest
+import torch
+
+from benchmarks.kde_bench import bench, synthetic_candidates
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.romatch.utils.kde import grid_kde, hash_kde, kde
+from src.third_party.xfeat import XFeatModel
+
+
+@pytest.fixture(scope="module")
+def candidates():
+    return synthetic_candidates(4000)
+
+
+@pytest.mark.parametrize("estimator, tolerance", [(grid_kde, 0.03), (hash_kde, 0.08)])
+def test_binned_density_matches_exact(candidates, estimator, tolerance):
+    exact = kde(candidates, std=0.1, half=False)
+
+    density = estimator(candidates, std=0.1)
+
+    assert density.shape == exact.shape
+    assert ((density - exact).abs() / exact).mean() < tolerance
+
+
+def test_sampling_distribution_close_to_exact(candidates):
+    report = bench(candidates, repeat=1)
+    rows = {row["name"]: row for row in report["estimators"]}
+    assert rows["grid"]["sampling_tv"] < 0.02
+    assert rows["grid"]["sampling_tv"] < rows["exact/8"]["sampling_tv"]
+
+
+def test_sample_selects_density_estimator():
+    torch.manual_seed(0)
+    model = tiny_roma_v1_model(xfeat=XFeatModel()).eval()
+    grid = torch.stack(torch.meshgrid(torch.linspace(-1, 1, 48), torch.linspace(-1, 1, 64), indexing="ij"), dim=-1)
+    warp = torch.cat([grid, grid * 0.9], dim=-1)
+    certainty = torch.rand(48, 64)
+
+    for mode in ("exact", "grid", "hash"):
+        matches, certainties = model.sample(warp, certainty, num=500, kde_mode=mode)
+        assert matches.shape == (500, 4) and certainties.shape == (500,)
+    with pytest.raises(ValueError, match="kde mode"):
+        model.sample(warp, certainty, num=500, kde_mode="fft")
@@ -0,0 +1,55 @@
+import pytest
+import torch
+
+from src.third_party.romatch.utils.local_correlation import (_local_grids, batched_local_correlation,
+                                                             local_correlation)
+
+
+def _features(batch=2, channels=16, h=9, w=11, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.randn(batch, channels, h, w, generator=generator)
+    y = torch.randn(batch, channels, h, w, generator=generator)
+    # window centres partly outside the image to cover the zero padding
+    flow = torch.rand(batch, 2, h, w, generator=generator) * 2.4 - 1.2
+    return x, y, flow
+
+
+@pytest.mark.parametrize("radius", [7, 3])
+def test_batched_matches_loop(radius):
+    x, y, flow = _features()
+    expected = local_correlation(x, y, radius, flow=flow)
+    assert torch.allclose(batched_local_correlation(x, y, radius, flow=flow), expected, atol=1e-5)
+    # without flow the windows are centred on the aligned pixels
+    expected = local_correlation(x, y, radius)
+    assert torch.allclose(batched_local_correlation(x, y, radius), expected, atol=1e-5)
+
+
+def test_chunked_window_matches_loop():
+    x, y, flow = _features()
+    expected = local_correlation(x, y, 3, flow=flow)
+    for max_bytes in (1, 4 * 2 * 16 * 9 * 11 * 8 * 3):
+        assert torch.allclose(batched_local_correlation(x, y, 3, flow=flow, max_bytes=max_bytes), expected,
+                              atol=1e-5)
+
+
+def test_sampled_fallback_matches_loop():
+    # other feature sizes and sample modes go through grid_sample
+    x, _, flow = _features()
+    y = torch.randn(2, 16, 5, 7)
+    expected = local_correlation(x, y, 3, flow=flow)
+    assert torch.allclose(batched_local_correlation(x, y, 3, flow=flow, max_bytes=1), expected, atol=1e-5)
+    x, y, flow = _features()
+    expected = local_correlation(x, y, 3, flow=flow, sample_mode="nearest")
+    assert torch.allclose(batched_local_correlation(x, y, 3, flow=flow, sample_mode="nearest"), expected, atol=1e-5)
+
+
+def test_grids_cached_and_gradient_flows_to_feature0():
+    x, y, flow = _features()
+    x.requires_grad_(True)
+    _local_grids.cache_clear()
+    batched_local_correlation(x, y, 3, flow=flow).sum().backward()
+    batched_local_correlation(x, y, 3, flow=flow)
+    assert _local_grids.cache_info().hits == 1
+    expected = x.detach().clone().requires_grad_(True)
+    local_correlation(expected, y, 3, flow=flow).sum().backward()
+    assert torch.allclose(x.grad, expected.grad, atol=1e-5)
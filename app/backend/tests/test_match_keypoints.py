@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import torch
+
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.serialization import decode_columnar, decode_keypoints, encode_matches, encode_npy, encode_raw
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel(), exact_softmax=True).eval()
+
+
+def _images(h=64, w=96, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(2)]
+
+
+def _manager(model, max_points=1000):
+    manager = RomaManager(base_model="local", cache=None, backend=None, geometry={'workers': 0},
+                          match_keypoints={'max_points': max_points})
+    manager._load_model = lambda model_name: model
+    return manager
+
+
+def test_match_keypoints_reads_the_dense_warp(model):
+    imA, imB = _images()
+    warp, certainty = model.match(imA, imB)
+    rng = np.random.default_rng(1)
+    # pixel centres, where the dense warp is defined
+    pixels = np.stack((rng.integers(0, 96, 200), rng.integers(0, 64, 200)), axis=-1)
+
+    result = _manager(model).match_keypoints(imA, imB, pixels + 0.5, as_numpy=True)
+
+    expected = model.to_pixel_coordinates(warp[pixels[:, 1], pixels[:, 0], 2:], 64, 96).numpy()
+    np.testing.assert_allclose(result["kptsA"], pixels + 0.5)
+    np.testing.assert_allclose(result["kptsB"], expected, atol=1e-3)
+    np.testing.assert_allclose(result["certainty"], certainty[pixels[:, 1], pixels[:, 0]].numpy(), atol=1e-5)
+    assert (result["H_A"], result["W_A"], result["H_B"], result["W_B"]) == (64, 96, 64, 96)
+    assert {"decode", "wait", "match", "total"} <= set(result["timings"])
+
+
+@pytest.mark.parametrize("keypoints", [
+    np.zeros((0, 2)), np.zeros((5, 3)), [[1.0, np.nan]], [[-1.0, 2.0]], [[97.0, 2.0]], np.ones((1001, 2)),
+])
+def test_match_keypoints_rejects_invalid_keypoints(model, keypoints):
+    imA, imB = _images()
+    with pytest.raises(ValueError):
+        _manager(model).match_keypoints(imA, imB, keypoints)
+
+
+@pytest.mark.parametrize("encode", [encode_raw, encode_npy, lambda kpts: str(kpts.tolist()).encode()])
+def test_decode_keypoints(encode):
+    keypoints = np.array([[1.5, 2.0], [30.25, 40.0]], dtype=np.float32)
+    np.testing.assert_array_equal(decode_keypoints(encode(keypoints)), keypoints)
+    with pytest.raises(ValueError):
+        decode_keypoints(b"\xff\xfe not keypoints")
+
+
+def test_match_keypoints_columnar_roundtrip(model):
+    imA, imB = _images()
+    keypoints = np.array([[10.5, 20.5], [40.0, 30.0], [95.0, 63.0]], dtype=np.float32)
+    result = _manager(model).match_keypoints(imA, imB, keypoints, as_numpy=True)
+
+    body, media_type, headers = encode_matches(result, "columnar")
+    decoded = decode_columnar(body)
+
+    assert media_type == "application/x-roma-columnar" and headers["X-Num-Matches"] == "3"
+    np.testing.assert_array_equal(decoded["kptsA"], keypoints)
+    np.testing.assert_array_equal(decoded["kptsB"], result["kptsB"])
+    np.testing.assert_array_equal(decoded["certainty"], result["certainty"])
+    np.testing.assert_array_equal(decoded["matches"], np.zeros((3, 4), dtype=np.float32))
+    assert decoded["F"] is None and (decoded["H_A"], decoded["W_A"]) == (64, 96)
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+import torch
+
+from src.config import ROMA_SAMPLING
+from src.model_mangers.result_cache import FeatureCache
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel(), exact_softmax=True).eval()
+
+
+def _images(n, h=64, w=96, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def _manager(model, cache=None, max_batch_size=4):
+    manager = RomaManager(base_model="local", cache=cache, backend=None,
+                          match_many={'max_batch_size': max_batch_size, 'feature_cache_bytes': 64 * 1024 ** 2})
+    manager._load_model = lambda model_name: model
+    manager.checkpoint_digest = lambda model_name: "weights"
+    return manager
+
+
+def test_match_many_matches_pairwise(model):
+    query, *refs = [model.image_to_tensor(im) for im in _images(4)]
+    feats = model.encode(torch.cat(refs))
+
+    warps, certainties = model.match_many(model.encode(query), feats, *query.shape[-2:])
+
+    for ref, warp, certainty in zip(refs, warps, certainties):
+        expected_warp, expected_certainty = model.match(query, ref, batched=False)
+        torch.testing.assert_close(warp, expected_warp, atol=1e-5, rtol=1e-5)
+        torch.testing.assert_close(certainty, expected_certainty, atol=1e-5, rtol=1e-5)
+
+
+def test_predict_many_encodes_each_image_once(model, monkeypatch):
+    manager = _manager(model, max_batch_size=2)
+    encoded, batches = [], []
+    encode, match_many = model.encode, model.match_many
+    monkeypatch.setattr(model, "encode", lambda im: encoded.append(len(im)) or encode(im))
+    monkeypatch.setattr(model, "match_many", lambda q, f, *size: batches.append(len(f[0])) or match_many(q, f, *size))
+    query, *refs = _images(4)
+    refs.append(_images(1, 96, 128)[0])
+
+    results = manager.predict_many(query, refs + [refs[0]], as_numpy=True)
+
+    assert [(r["H_B"], r["W_B"]) for r in results] == [(64, 96)] * 3 + [(96, 128), (64, 96)]
+    assert sorted(encoded) == [1, 1, 1, 2]
+    assert sorted(batches) == [1, 2, 2]
+    manager.predict_many(refs[1], [query, refs[0]], as_numpy=True)
+    assert len(encoded) == 4
+    assert manager.get_stats()["features"]["hits"] == 3
+
+
+def test_predict_many_shares_the_result_cache(model):
+    manager = _manager(model, cache={'enabled': True, 'max_bytes': 64 * 1024 ** 2})
+    query, ref = _images(2)
+    pair = manager.predict(query, ref, as_numpy=True)
+
+    many = manager.predict_many(query, [ref], as_numpy=True)
+
+    np.testing.assert_array_equal(many[0]["kptsA"], pair["kptsA"])
+    assert manager.get_stats()["features"]["misses"] == 0
+    with pytest.raises(ValueError):
+        manager.predict_many(query, [])
+
+
+
+def test_features_are_not_shared_across_checkpoints(model, monkeypatch):
+    manager = _manager(model)
+    encoded = []
+    encode = model.encode
+    monkeypatch.setattr(model, "encode", lambda im: encoded.append(len(im)) or encode(im))
+    query, ref = _images(2)
+
+    manager.predict_many(query, [ref])
+    manager.checkpoint_digest = lambda model_name: "retrained weights"
+    manager.predict_many(query, [ref])
+
+    assert len(encoded) == 4
+
+
+def test_sampling_follows_the_config_and_keys_the_cache(model, monkeypatch):
+    manager = _manager(model, cache={'enabled': True, 'max_bytes': 64 * 1024 ** 2})
+    modes = []
+    sample = model.sample
+    monkeypatch.setattr(model, "sample", lambda *args, kde_mode, **kwargs: modes.append(kde_mode) or
+                        sample(*args, kde_mode=kde_mode, **kwargs))
+    query, ref = _images(2)
+
+    manager.predict(query, ref)
+    manager.predict(query, ref)
+    monkeypatch.setitem(ROMA_SAMPLING, "kde_mode", "grid")
+    manager.predict(query, ref)
+    monkeypatch.setitem(ROMA_SAMPLING, "sparse_points", 1000)
+    sparse = manager.predict(query, ref, as_numpy=True)
+
+    assert modes == ["exact", "grid", "grid"]
+    assert len(sparse["kptsA"]) <= 1000
+
+def test_feature_cache_evicts_least_recently_used():
+    cache = FeatureCache(max_bytes=2 * 400)
+    cache.put("a", (torch.zeros(100), (1, 1)))
+    cache.put("b", (torch.zeros(100), (1, 1)))
+    cache.get("a")
+    cache.put("c", (torch.zeros(100), (1, 1)))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] == 800
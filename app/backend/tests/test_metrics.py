@@ -0,0 +1,66 @@
+import pytest
+import torch
+
+from src.config import METRICS
+from src.model_mangers.executor import ReplicaSet
+from src.utils.metrics import Histogram, MetricsRegistry, metrics, timed
+
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    metrics.clear()
+    yield metrics
+    metrics.clear()
+
+
+def test_timed_is_shared_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+    metrics.clear()
+    assert timed("a", "b") is timed("c", "d")
+    with timed("a", "b"):
+        pass
+    assert "nerf_stage_seconds_count" not in metrics.render()
+
+
+def test_timed_records_stage(enabled_metrics):
+    with timed("depth_manager", "decode"):
+        pass
+    text = enabled_metrics.render()
+    assert 'nerf_stage_seconds_count{component="depth_manager",stage="decode"} 1' in text
+    assert 'nerf_stage_seconds_bucket{component="depth_manager",stage="decode",le="+Inf"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram("h", "test", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        hist.observe(value, "x")
+    lines = hist.render()
+
+    assert lines[:2] == ["# HELP h test", "# TYPE h histogram"]
+    assert lines[2:] == [
+        'h_bucket{stage="x",le="0.1"} 1',
+        'h_bucket{stage="x",le="1"} 3',
+        'h_bucket{stage="x",le="+Inf"} 4',
+        'h_sum{stage="x"} 6.05',
+        'h_count{stage="x"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(enabled=True)
+    registry.gauge("g", "test", ("model",)).set(1, 'a"b\\c')
+    assert 'g{model="a\\"b\\\\c"} 1' in registry.render()
+
+
+def test_replica_wait_and_peak_memory(enabled_metrics):
+    replicas = ReplicaSet(torch.nn.Linear(1, 1), replicas=1, name="depth_anything/vits")
+    with replicas.acquire():
+        pass
+    text = enabled_metrics.render()
+    assert 'nerf_model_lock_wait_seconds_count{model="depth_anything/vits"} 1' in text
+    assert 'nerf_model_peak_memory_bytes{model="depth_anything/vits",device="cpu"}' in text
+
+
+def test_buckets_come_from_config():
+    assert metrics.buckets == MetricsRegistry().buckets == tuple(METRICS['buckets'])
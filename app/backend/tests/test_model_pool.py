@@ -0,0 +1,115 @@
+import pytest
+import torch
+
+from src.model_mangers.model_manager import ModelManager, model_nbytes
+
+SIZES = {"small": 10, "medium": 20, "large": 40}
+
+
+class DummyManager(ModelManager):
+    def __init__(self, base_model="small", budget_bytes=4 * 35, replicas=1):
+        self.loads = []
+        super().__init__("depth_anything", base_model, budget_bytes, replicas=replicas)
+
+    def _load_model(self, model_name: str):
+        if model_name not in SIZES:
+            raise ValueError(f"Model '{model_name}' not found")
+        self.loads.append(model_name)
+        return torch.nn.Linear(SIZES[model_name], 1, bias=False)
+
+    def predict(self, model_name=None):
+        return self.get_model(model_name)
+
+
+def test_model_nbytes():
+    assert model_nbytes(torch.nn.Linear(10, 1, bias=False)) == 40
+
+
+def test_base_model_loads_lazily():
+    manager = DummyManager()
+    assert manager.get_spec() == {"model_name": "small"}
+    assert manager.pool_stats()["resident"] == {}
+
+    manager.predict()
+    assert manager.loads == ["small"]
+    assert manager.pool_stats()["resident"] == {"small": 40}
+
+
+def test_cold_start_is_reported():
+    manager = DummyManager(replicas=2)
+    assert manager.cold_starts() == {}
+    manager.predict("medium")
+
+    report = manager.cold_starts()["medium"]
+    assert report["seconds"] >= 0
+    assert report["weights_bytes"] == 2 * 4 * 20
+    assert report["device"] == "cpu"
+    assert manager.get_stats()["cold_starts"] == {"medium": report}
+
+
+def test_resident_models_are_not_reloaded():
+    manager = DummyManager()
+    manager.predict()
+    manager.predict("medium")
+    manager.predict("small")
+    manager.predict("medium")
+
+    stats = manager.pool_stats()
+    assert manager.loads == ["small", "medium"]
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 0
+
+
+def test_least_recently_used_model_is_evicted():
+    manager = DummyManager(budget_bytes=4 * 65)
+    manager.predict("medium")
+    manager.predict("small")
+    manager.predict("large")
+
+    stats = manager.pool_stats()
+    assert set(stats["resident"]) == {"small", "large"}
+    assert stats["evictions"] == 1
+    assert stats["resident_bytes"] <= stats["budget_bytes"]
+
+
+def test_model_larger_than_budget_still_loads():
+    manager = DummyManager(budget_bytes=4 * 15)
+    model = manager.predict("large")
+
+    assert model.in_features == 40
+    assert list(manager.pool_stats()["resident"]) == ["large"]
+
+
+def test_request_model_does_not_change_selection():
+    manager = DummyManager()
+    manager.predict("large")
+    assert manager.get_spec() == {"model_name": "small"}
+    assert manager.predict().in_features == 10
+
+
+def test_unknown_model():
+    manager = DummyManager()
+    with pytest.raises(ValueError):
+        manager.predict("missing")
+    with pytest.raises(ValueError):
+        manager.select_model("missing")
+    assert manager.get_spec() == {"model_name": "small"}
+
+
+def test_replicas_count_towards_budget():
+    manager = DummyManager(budget_bytes=4 * 50, replicas=2)
+    manager.predict()
+    manager.predict("medium")
+
+    stats = manager.pool_stats()
+    assert stats["resident"] == {"medium": 2 * 4 * 20}
+    assert stats["replicas"]["medium"]["replicas"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_checkout_reserves_a_replica():
+    manager = DummyManager(replicas=2)
+    with manager.checkout() as first, manager.checkout() as second:
+        assert first is not second
+        assert manager.pool_stats()["replicas"]["small"]["in_use"] == 2
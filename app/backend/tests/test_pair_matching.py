@@ -0,0 +1,124 @@
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from src.jobs.pair_matching import match_scene, pose_costs, scene_poses, top_k_pairs
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.match_store import MatchStore
+
+
+@pytest.fixture(scope="module")
+def manager():
+    torch.manual_seed(0)
+    model = tiny_roma_v1_model(xfeat=XFeatModel()).eval()
+    manager = RomaManager(base_model="local", cache=None, backend=None)
+    manager._load_model = lambda model_name: model
+    manager.checkpoint_digest = lambda model_name: "weights"
+    return manager
+
+
+def _pose(x, yaw=0.0):
+    pose = np.eye(4)
+    pose[:3, :3] = cv2.Rodrigues(np.array([0.0, yaw, 0.0]))[0]
+    pose[0, 3] = x
+    return pose
+
+
+@pytest.fixture
+def scene(tmp_path):
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        cv2.imwrite(str(tmp_path / f"frame-{i:06d}.color.png"), rng.integers(0, 256, (64, 96, 3), dtype=np.uint8))
+        cv2.imwrite(str(tmp_path / f"frame-{i:06d}.depth.png"), np.zeros((64, 96), np.uint16))
+        np.savetxt(tmp_path / f"frame-{i:06d}.pose.txt", _pose(float(i)))
+    return tmp_path
+
+
+def _prediction(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {"F": rng.random((3, 3)), "kptsA": rng.random((n, 2), dtype=np.float32),
+            "kptsB": rng.random((n, 2), dtype=np.float32), "certainty": rng.random(n, dtype=np.float32),
+            "matches": rng.random((n, 4), dtype=np.float32), "H_A": 64, "W_A": 96, "H_B": 32, "W_B": 48}
+
+
+def test_pose_ranking_prefers_nearby_views(scene):
+    poses = scene_poses(scene, sorted(scene.glob("*.color.png")))
+    poses[4] = _pose(1.0, yaw=np.pi)
+
+    costs = pose_costs(poses)
+
+    # view 4 stands where view 1 is but looks the other way
+    assert costs[1, 4] > costs[1, 2]
+    assert top_k_pairs(costs[:4, :4], 1) == [(0, 1), (1, 2), (2, 3)]
+    assert scene_poses(scene, [scene / "missing.color.png"]) is None
+
+
+def test_match_store_range_queries_and_swapped_pairs(tmp_path):
+    store = MatchStore(tmp_path / "store", [f"{i}.png" for i in range(4)])
+    store.write([(0, 1, _prediction(3)), (2, 3, _prediction(0))])
+    store.write([(0, 2, _prediction(5, seed=1) | {"F": None})])
+
+    store = MatchStore(tmp_path / "store")
+    assert [(m["i"], m["j"]) for m in store.query(0, 1)] == [(0, 1), (0, 2)]
+    assert [(m["i"], m["j"]) for m in store.query(1)] == [(2, 3)]
+    assert store.get(0, 2)["F"] is None and len(store.get(2, 3)["kptsA"]) == 0
+    forward, backward = store.get(0, 1), store.get(1, 0)
+    np.testing.assert_array_equal(backward["kptsA"], forward["kptsB"])
+    np.testing.assert_array_equal(backward["F"], forward["F"].T)
+    assert (backward["H_A"], backward["W_A"]) == (32, 48)
+    with pytest.raises(KeyError):
+        store.get(1, 3)
+    with pytest.raises(ValueError):
+        MatchStore(tmp_path / "store", ["other.png"])
+
+
+def test_match_scene_resumes_after_interruption(scene, tmp_path, manager):
+    store_dir = tmp_path / "matches"
+    report = match_scene(scene, store_dir, manager, top_k=1, chunk_pairs=2)
+
+    assert report["ranking"] == "poses"
+    assert report["matched"] == report["candidates"] == 4
+    assert MatchStore(store_dir).pairs() == [(0, 1), (1, 2), (2, 3), (3, 4)]
+    # an interrupted write leaves a chunk without meta.json, which is ignored and matched again
+    chunks = sorted((store_dir / "chunks").iterdir())
+    (chunks[-1] / "meta.json").unlink()
+
+    report = match_scene(scene, store_dir, manager, top_k=1, chunk_pairs=2)
+
+    assert (report["matched"], report["skipped"]) == (2, 2)
+    store = MatchStore(store_dir)
+    assert len(store) == 4 and store.images[0] == "frame-000000.color.png"
+    match = store.get(1, 2)
+    assert match["kptsA"].shape == match["kptsB"].shape and match["kptsA"].shape[0] == len(match["certainty"])
+
+
+def test_match_scene_ranks_by_descriptors_without_poses(scene, tmp_path, manager):
+    for pose in scene.glob("*.pose.txt"):
+        pose.unlink()
+    shutil.copy(scene / "frame-000000.color.png", scene / "frame-000005.color.png")
+
+    report = match_scene(scene, tmp_path / "matches", manager, top_k=1)
+
+    assert report["ranking"] == "descriptors"
+    assert (0, 5) in MatchStore(tmp_path / "matches")
+    with pytest.raises(ValueError):
+        match_scene(scene, tmp_path / "other", manager, ranking="poses")
+
+
+def test_match_store_records_the_geometry(scene, tmp_path, manager):
+    store_dir = tmp_path / "matches"
+    match_scene(scene, store_dir, manager, top_k=1)
+    homographies = RomaManager(base_model="local", cache=None, backend=None,
+                               geometry={'workers': 0, 'default': {**manager.geometry_params(), 'estimator': 'H'}})
+    homographies._load_model = manager._load_model
+    homographies.checkpoint_digest = manager.checkpoint_digest
+
+    assert MatchStore(store_dir).params["geometry"]["estimator"] == "F"
+    # a store of fundamental-verified pairs is not extended with homography-verified ones
+    with pytest.raises(ValueError):
+        match_scene(scene, store_dir, homographies, top_k=1)
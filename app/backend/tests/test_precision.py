@@ -0,0 +1,117 @@
+import copy
+
+import cv2
+import numpy as np
+import pytest
+import torch
+import torch.ao.nn.quantized as nnq
+import torch.ao.nn.quantized.dynamic as nnqd
+
+import src.model_mangers.depth_manager as dm
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.model_manager import model_nbytes
+from src.model_mangers.roma_manager import RomaManager
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.xfeat import XFeatModel
+from src.utils.precision import apply_precision, calibration_frames, check_precision, precision_context
+
+
+def _frames(n=2, h=112, w=140):
+    rng = np.random.default_rng(0)
+    return [cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (9, 9), 3) for _ in range(n)]
+
+
+@pytest.fixture(scope="module")
+def depth_model():
+    torch.manual_seed(0)
+    return DepthAnythingV2(encoder='vits', features=64, out_channels=[48, 96, 192, 384]).eval()
+
+
+@pytest.fixture(scope="module")
+def roma_model():
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel()).eval()
+
+
+def test_check_precision():
+    assert check_precision("bf16", "cuda") == "bf16"
+    with pytest.raises(ValueError, match="Unsupported"):
+        check_precision("fp8", "cpu")
+    with pytest.raises(ValueError, match="CPU"):
+        check_precision("int8_dynamic", "cuda")
+
+
+def test_calibration_frames_skip_depth_maps(tmp_path):
+    for i in range(5):
+        cv2.imwrite(str(tmp_path / f"frame-{i:06d}.color.png"), np.full((40, 80, 3), i * 10, np.uint8))
+        cv2.imwrite(str(tmp_path / f"frame-{i:06d}.depth.png"), np.zeros((40, 80), np.uint16))
+
+    frames = calibration_frames(tmp_path, limit=3, max_side=40)
+
+    assert [f.shape for f in frames] == [(20, 40, 3)] * 3
+    assert [int(f[0, 0, 0]) for f in frames] == [0, 20, 40]
+    with pytest.raises(FileNotFoundError):
+        calibration_frames(tmp_path / "empty")
+
+
+@pytest.mark.parametrize("precision, linear", [("int8_dynamic", nnqd.Linear), ("int8_static", nnq.Linear)])
+def test_depth_int8_quantizes_dinov2_linears(depth_model, precision, linear):
+    frames = _frames()
+    reference = depth_model.infer_image(frames[0])
+
+    model = apply_precision(copy.deepcopy(depth_model), precision, calibrate=lambda m: DepthManager.calibrate(m, frames))
+
+    block = model.pretrained.blocks[0]
+    for layer in (block.attn.qkv, block.attn.proj, block.mlp.fc1, block.mlp.fc2):
+        assert isinstance(getattr(layer, "module", layer), linear)
+    assert model_nbytes(model) < 0.5 * model_nbytes(depth_model)
+    depth = model.infer_image(frames[0])
+    assert depth.dtype == np.float32
+    assert np.abs(depth - reference).mean() < 0.05 * np.abs(reference).mean()
+
+
+def test_roma_int8_static_quantizes_basic_layers(roma_model):
+    frames = _frames(3)
+    model = apply_precision(copy.deepcopy(roma_model), "int8_static", calibrate=lambda m: RomaManager.calibrate(m, frames))
+
+    assert model_nbytes(model) < 0.5 * model_nbytes(roma_model)
+    assert not any(type(m) is torch.nn.Conv2d for layer in model.coarse_matcher[:4] for m in layer.modules())
+    warp, certainty = model.match(frames[0][..., ::-1].copy(), frames[1][..., ::-1].copy(), batched=False)
+    assert warp.shape == (112, 140, 4) and torch.isfinite(warp).all()
+
+
+
+def test_roma_int8_dynamic_leaves_convolutions_in_float(roma_model):
+    model = apply_precision(copy.deepcopy(roma_model), "int8_dynamic")
+
+    convs = [m for m in model.modules() if isinstance(m, torch.nn.Conv2d)]
+    assert convs and len(convs) == sum(isinstance(m, torch.nn.Conv2d) for m in roma_model.modules())
+    assert not any(isinstance(m, nnqd.Conv2d) for m in model.modules())
+
+def test_bf16_runs_under_autocast_and_returns_float32(depth_model):
+    model = apply_precision(copy.deepcopy(depth_model), "bf16")
+    frame = _frames(1)[0]
+
+    with precision_context(model):
+        assert torch.is_autocast_enabled("cpu")
+        depth = model.infer_image(frame)
+    with precision_context(depth_model):
+        assert not torch.is_autocast_enabled("cpu")
+
+    assert depth.dtype == np.float32
+    reference = depth_model.infer_image(frame)
+    assert np.abs(depth - reference).mean() < 0.05 * np.abs(reference).mean()
+
+
+def test_static_int8_requires_calibration(depth_model):
+    with pytest.raises(ValueError, match="calibration"):
+        apply_precision(copy.deepcopy(depth_model), "int8_static")
+
+
+def test_manager_precision_from_model_entry(monkeypatch):
+    monkeypatch.setitem(dm.DEPTH_MODELS, "quantized", {"checkpoint": None, "encoder": "vits", "precision": "bf16"})
+    monkeypatch.setitem(dm.PRECISION, "default", "int8_dynamic")
+
+    assert DepthManager.precision("quantized") == "bf16"
+    assert DepthManager.precision("base_vitb") == "int8_dynamic"
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import torch
+
+from src.third_party.depth_anything_v2.dpt import DepthAnythingV2
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return DepthAnythingV2(encoder='vits', features=64, out_channels=[48, 96, 192, 384]).eval()
+
+
+def _image(h, w, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("h, w", [(120, 160), (600, 380), (518, 518)])
+def test_tensor_preprocessing_matches_reference(model, h, w):
+    img = _image(h, w)
+    image, size = model.image2tensor(img)
+    reference, _ = model.image2tensor_numpy(img)
+
+    assert size == (h, w)
+    assert image.dtype == torch.float32
+    assert image.shape[-2:] == model.input_shape(h, w)
+    torch.testing.assert_close(image, reference.float().to(image.device), atol=1e-3, rtol=0)
+
+
+def test_batch_matches_single_images(model):
+    same = [_image(100, 140, seed) for seed in range(3)]
+    mixed = [_image(100, 140), _image(101, 141)]
+
+    batch, sizes = model.images2tensor(same)
+    assert sizes == [(100, 140)] * 3
+    for i, img in enumerate(same):
+        torch.testing.assert_close(batch[i:i + 1], model.image2tensor(img)[0])
+
+    batch, _ = model.images2tensor(mixed)
+    torch.testing.assert_close(batch[1:], model.image2tensor(mixed[1])[0])
+    with pytest.raises(ValueError):
+        model.images2tensor([_image(100, 140), _image(300, 140)])
+    assert model.image2tensor(same[0], dtype=torch.float16)[0].dtype == torch.float16
+
+
+def test_pos_embed_interpolation_is_cached_per_resolution(model):
+    encoder = model.pretrained
+    x = torch.zeros(1, 7 * 9 + 1, encoder.embed_dim)
+
+    with torch.no_grad():
+        first = encoder.interpolate_pos_encoding(x, 98, 126)
+        assert encoder.interpolate_pos_encoding(x, 98, 126) is first
+        assert encoder.interpolate_pos_encoding(x, 126, 98) is not first
+
+        encoder.pos_embed.add_(1.0)
+        updated = encoder.interpolate_pos_encoding(x, 98, 126)
+        encoder.pos_embed.sub_(1.0)
+    torch.testing.assert_close(updated, first + 1.0)
+
+    assert encoder.interpolate_pos_encoding(x, 98, 126) is not encoder.interpolate_pos_encoding(x, 98, 126)
@@ -0,0 +1,81 @@
+import pytest
+import torch
+
+from src.model_mangers import executor, registry
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.roma_manager import RomaManager
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    loads = []
+
+    def load(self, model_name, device="cpu"):
+        if model_name == "broken":
+            raise ValueError("Checkpoint 'broken' not found")
+        loads.append((self.model_type, model_name))
+        return torch.nn.Linear(4, 1)
+
+    monkeypatch.setattr(DepthManager, "_load_model", load)
+    monkeypatch.setattr(RomaManager, "_load_model", load)
+    registry.reset()
+    yield loads
+    registry.reset()
+
+
+def test_managers_are_shared_and_lazy(fresh_registry):
+    depth = registry.get_depth_manager()
+
+    assert registry.get_manager("depth_anything") is depth
+    assert isinstance(registry.get_roma_manager(), RomaManager)
+    assert fresh_registry == []
+    with pytest.raises(ValueError):
+        registry.get_manager("missing")
+
+
+def test_warmup_reports_progress(fresh_registry):
+    assert registry.is_warm()
+
+    registry.start_warmup({"depth_anything": ["base_vitb", "broken"], "tiny_roma": ["base"]}).join()
+
+    status = registry.warmup_status()
+    assert status["depth_anything/base_vitb"]["state"] == "ready"
+    assert status["tiny_roma/base"]["state"] == "ready"
+    assert status["depth_anything/broken"] == {
+        "state": "failed", "seconds": status["depth_anything/broken"]["seconds"],
+        "error": "Checkpoint 'broken' not found",
+    }
+    assert registry.is_warm()
+    assert fresh_registry == [("depth_anything", "base_vitb"), ("tiny_roma", "base")]
+    assert "base_vitb" in registry.get_depth_manager().cold_starts()
+
+
+def test_start_warmup_is_pending_before_its_thread_runs(fresh_registry, monkeypatch):
+    class Unstarted(registry.threading.Thread):
+        def start(self):
+            pass
+
+    monkeypatch.setattr(registry.threading, "Thread", Unstarted)
+    registry.start_warmup({"tiny_roma": ["base"]})
+
+    assert not registry.is_warm()
+    assert registry.warmup_status()["tiny_roma/base"]["state"] == "pending"
+
+
+def test_start_warmup_with_no_models(fresh_registry):
+    registry.start_warmup({}).join()
+
+    assert registry.warmup_status() == {}
+    assert fresh_registry == []
+
+
+def test_threads_are_configured_before_the_first_manager(monkeypatch):
+    calls = []
+    monkeypatch.setattr(executor, "_threads_configured", False)
+    monkeypatch.setattr(executor, "cpu_threads", lambda: 3)
+    monkeypatch.setattr(executor.torch, "set_num_threads", calls.append)
+
+    registry.get_depth_manager()
+    registry.get_roma_manager()
+
+    assert calls == [3]
@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+
+import src.model_mangers.depth_manager as depth_module
+from src.config import DEPTH_BASE_MODEL, DEPTH_MODELS
+from src.model_mangers.depth_manager import DepthManager
+from src.model_mangers.result_cache import ResultCache, cache_key, image_digest
+from src.utils.artifact_store import ArtifactStore
+
+
+def _value(n, fill=0.0):
+    return {"depth": np.full(n, fill, dtype=np.float32), "height": 1}
+
+
+def test_image_digest_is_content_based(tmp_path):
+    data = b"\x89PNG fake image"
+    path = tmp_path / "img.png"
+    path.write_bytes(data)
+
+    assert image_digest(data) == image_digest(bytearray(data)) == image_digest(path)
+    assert image_digest(data) != image_digest(data + b"!")
+
+    arr = np.zeros((2, 3, 3), dtype=np.uint8)
+    assert image_digest(arr) == image_digest(arr.copy())
+    assert image_digest(arr) != image_digest(arr.reshape(3, 2, 3))
+
+
+def test_cache_key_depends_on_all_parts():
+    digest = image_digest(b"img")
+    assert cache_key("depth", "vits", True, digest) == cache_key("depth", "vits", True, digest)
+    assert cache_key("depth", "vits", True, digest) != cache_key("depth", "vits", False, digest)
+    assert cache_key("depth", "vits", True, digest) != cache_key("depth", "vitb", True, digest)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=2 * 40)
+    cache.put("a", _value(10))
+    cache.put("b", _value(10))
+    cache.get("a")
+    cache.put("c", _value(10))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 80
+    assert stats["memory_hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_cached_arrays_are_read_only():
+    cache = ResultCache(max_bytes=1024)
+    cache.put("a", _value(4))
+    with pytest.raises(ValueError):
+        cache.get("a")["depth"][0] = 1.0
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResultCache(max_bytes=1024, disk_dir=tmp_path).put("a", _value(4, fill=2.5))
+
+    cache = ResultCache(max_bytes=1024, disk_dir=tmp_path)
+    value = cache.get("a")
+    assert isinstance(value["depth"], np.memmap)
+    np.testing.assert_array_equal(value["depth"], np.full(4, 2.5, dtype=np.float32))
+    assert value["height"] == 1
+
+    cache.get("a")
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["disk_entries"] == 1
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = ResultCache(max_bytes=0, disk_dir=tmp_path, disk_max_bytes=1)
+    cache.put("a", _value(4))
+    cache.put("b", _value(4))
+
+    assert cache.stats()["disk_entries"] == 0
+    assert cache.stats()["disk_bytes"] == 0
+
+
+@pytest.mark.parametrize("batching", [{"enabled": False}, {"enabled": True, "max_wait_ms": 0}])
+def test_depth_manager_cache_hit_skips_model(monkeypatch, tmp_path, batching):
+    model = MagicMock()
+    model.infer_image.return_value = np.ones((4, 4), dtype=np.float32)
+    monkeypatch.setattr(DepthManager, "_load_model", lambda self, name: model)
+    checkpoint = tmp_path / "model.pth"
+    checkpoint.write_bytes(b"weights")
+    monkeypatch.setitem(DEPTH_MODELS, DEPTH_BASE_MODEL, {**DEPTH_MODELS[DEPTH_BASE_MODEL], "checkpoint": checkpoint})
+    monkeypatch.setattr(depth_module, "artifact_store", ArtifactStore(tmp_path / "store"))
+
+    manager = DepthManager(batching=batching, cache={"enabled": True, "max_bytes": 1024})
+    _, png = cv2.imencode(".png", np.zeros((4, 4, 3), dtype=np.uint8))
+
+    first = manager.predict(png.tobytes(), normalize=False)
+    second = manager.predict(png.tobytes(), normalize=False)
+
+    assert model.infer_image.call_count == 1
+    np.testing.assert_array_equal(first, second)
+    assert manager.get_stats()["cache"]["hits"] == 1
+
+    # a checkpoint replaced under the same model name misses the cache
+    checkpoint.write_bytes(b"retrained weights")
+    manager.predict(png.tobytes(), normalize=False)
+    assert model.infer_image.call_count == 2
+
+
+
+def test_depth_results_are_cached_per_backend(monkeypatch, tmp_path):
+    model = MagicMock()
+    model.infer_image.return_value = np.ones((4, 4), dtype=np.float32)
+    monkeypatch.setattr(DepthManager, "_load_model", lambda self, name: model)
+    checkpoint = tmp_path / "model.pth"
+    checkpoint.write_bytes(b"weights")
+    monkeypatch.setitem(DEPTH_MODELS, DEPTH_BASE_MODEL, {**DEPTH_MODELS[DEPTH_BASE_MODEL], "checkpoint": checkpoint})
+    monkeypatch.setattr(depth_module, "artifact_store", ArtifactStore(tmp_path / "store"))
+    cache = {"enabled": True, "max_bytes": 1024, "disk_dir": tmp_path / "cache"}
+    _, png = cv2.imencode(".png", np.zeros((4, 4, 3), dtype=np.uint8))
+
+    for backend in ("eager", "eager", "export"):
+        manager = DepthManager(batching={"enabled": False}, cache=cache, backend={"backend": backend})
+        manager.predict(png.tobytes(), normalize=False)
+
+    assert model.infer_image.call_count == 2
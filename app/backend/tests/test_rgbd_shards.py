@@ -0,0 +1,107 @@
+import pickle
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "scripts" / "nerf-scripts"))
+import rgbd_shards  # noqa: E402
+
+
+@pytest.fixture
+def scene(tmp_path):
+    """
+    A 7-Scenes style scene of four 24x32 frames, the last one without depth.
+    """
+    rng = np.random.default_rng(0)
+    scene_dir = tmp_path / "seq-01"
+    scene_dir.mkdir()
+    frames = {}
+    for i in range(4):
+        name = f"frame-{i:06d}"
+        rgb = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+        depth = rng.integers(1, 5000, (24, 32), dtype=np.uint16)
+        depth[0, :4] = 0
+        depth[1, :4] = 65535
+        pose = np.eye(4)
+        pose[:3, 3] = (i, 2 * i, 3 * i)
+        cv2.imwrite(str(scene_dir / f"{name}.color.png"), rgb[..., ::-1])
+        if i < 3:
+            cv2.imwrite(str(scene_dir / f"{name}.depth.png"), depth)
+        np.savetxt(scene_dir / f"{name}.pose.txt", pose)
+        frames[name] = (rgb, depth if i < 3 else None, pose)
+    return scene_dir, frames
+
+
+def test_pack_scene_roundtrip(scene, tmp_path):
+    scene_dir, frames = scene
+    # two frames of 24 x 32 x 5 bytes per shard
+    stats = rgbd_shards.pack_scene(scene_dir, tmp_path / "packed", "millimetres", shard_bytes=2 * 24 * 32 * 5)
+    index, table, shards = rgbd_shards.load_packed(tmp_path / "packed")
+
+    assert stats["frames"] == 4 and stats["shards"] == 2
+    assert all(isinstance(array, np.memmap) for shard in shards for array in shard)
+    for record in table:
+        rgb, depth, pose = frames[record["name"]]
+        shard_rgb, shard_depth = shards[record["shard"]]
+        np.testing.assert_array_equal(shard_rgb[record["row"]], rgb)
+        np.testing.assert_array_equal(record["pose"], pose)
+        np.testing.assert_array_equal(record["K"], [[585, 0, 320], [0, 585, 240], [0, 0, 1]])
+        assert record["has_depth"] == (depth is not None)
+        metres = rgbd_shards.to_metres(shard_depth[record["row"]], index["depth"])
+        if depth is None:
+            assert not metres.any()
+        else:
+            expected = np.where((depth == 0) | (depth == 65535), 0, depth / 1000)
+            np.testing.assert_allclose(metres, expected, rtol=1e-6)
+
+
+def test_interrupted_repack_keeps_the_previous_pack(scene, tmp_path, monkeypatch):
+    scene_dir, _ = scene
+    rgbd_shards.pack_scene(scene_dir, tmp_path / "packed", "millimetres")
+    before = sorted(p.name for p in (tmp_path / "packed").iterdir())
+    replace = rgbd_shards._replace
+
+    def interrupted(path, write):
+        if path.name == rgbd_shards.INDEX:
+            raise KeyboardInterrupt
+        replace(path, write)
+
+    monkeypatch.setattr(rgbd_shards, "_replace", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        rgbd_shards.pack_scene(scene_dir, tmp_path / "packed", "normalized", shard_bytes=1)
+
+    index, table, shards = rgbd_shards.load_packed(tmp_path / "packed")
+    assert index["depth"]["encoding"] == "millimetres" and len(shards) == 1
+    assert set(before) <= {p.name for p in (tmp_path / "packed").iterdir()}
+    monkeypatch.setattr(rgbd_shards, "_replace", replace)
+    rgbd_shards.pack_scene(scene_dir, tmp_path / "packed", "normalized", shard_bytes=1)
+    # the files of both earlier packs are gone
+    assert len(list((tmp_path / "packed").glob("*.npy"))) == 1 + 2 * 4
+
+
+def test_packed_dataset(scene, tmp_path):
+    scene_dir, frames = scene
+    rgbd_shards.pack_scene(scene_dir, tmp_path / "packed", "millimetres")
+    dataset = rgbd_shards.PackedRGBDDataset(tmp_path / "packed")
+
+    sample = dataset[1]
+    rgb, depth, pose = frames[sample["name"]]
+    assert sample["image"].shape == (3, 24, 32) and sample["depth"].dtype == torch.float32
+    np.testing.assert_array_equal(sample["image"].permute(1, 2, 0).numpy(), rgb)
+    assert sample["depth"][5, 5] == pytest.approx(depth[5, 5] / 1000)
+    np.testing.assert_array_equal(sample["pose"].numpy(), pose)
+    # the image views the memory map of its shard
+    assert np.shares_memory(sample["image"].numpy(), dataset._scenes[0][2][0][0])
+    raw = rgbd_shards.PackedRGBDDataset(tmp_path / "packed", raw_depth=True)[1]["depth"]
+    assert raw.dtype == torch.uint16 and raw[1, 0] == 0
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored._scenes is None and len(restored) == 4
+    loader = torch.utils.data.DataLoader(dataset, batch_size=2, num_workers=2)
+    batches = list(loader)
+    assert [name for batch in batches for name in batch["name"]] == sorted(frames)
+    assert batches[0]["image"].shape == (2, 3, 24, 32)
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.serialization import (
+    DEPTH_FORMATS, MATCH_FORMATS, UnsupportedFormat,
+    negotiate, encode_depth, encode_matches, decode_raw, decode_columnar
+)
+
+
+@pytest.fixture
+def depth():
+    rng = np.random.default_rng(0)
+    return rng.random((48, 64), dtype=np.float32)
+
+
+@pytest.fixture
+def prediction():
+    rng = np.random.default_rng(0)
+    n = 10
+    return {
+        "F": rng.random((3, 3)),
+        "kptsA": rng.random((n, 2), dtype=np.float32) * 100,
+        "kptsB": rng.random((n, 2), dtype=np.float32) * 100,
+        "matches": rng.random((n, 4), dtype=np.float32) * 2 - 1,
+        "certainty": rng.random(n, dtype=np.float32),
+        "H_A": 480, "W_A": 640, "H_B": 480, "W_B": 640
+    }
+
+
+@pytest.mark.parametrize("accept,fmt,expected", [
+    (None, None, "json"),
+    ("*/*", None, "json"),
+    ("application/x-float16", None, "f16"),
+    ("application/json;q=0.5, application/x-npy", None, "npy"),
+    ("image/png;q=0.9, application/x-float32;q=0.1", None, "png16"),
+    ("application/x-npy", "f32", "f32"),
+])
+def test_negotiate_depth(accept, fmt, expected):
+    assert negotiate(DEPTH_FORMATS, accept=accept, fmt=fmt) == expected
+
+
+@pytest.mark.parametrize("accept,fmt", [
+    ("text/html", None),
+    (None, "png16"),
+])
+def test_negotiate_matches_unsupported(accept, fmt):
+    with pytest.raises(UnsupportedFormat):
+        negotiate(MATCH_FORMATS, accept=accept, fmt=fmt)
+
+
+@pytest.mark.parametrize("fmt,atol", [("f32", 0), ("f16", 1e-3)])
+def test_raw_depth_roundtrip(depth, fmt, atol):
+    body, _, headers = encode_depth(depth, fmt)
+    decoded = decode_raw(body)
+    assert decoded.shape == depth.shape
+    assert headers["X-Shape"] == "48,64"
+    np.testing.assert_allclose(decoded.astype(np.float32), depth, atol=atol)
+
+
+def test_npy_depth_roundtrip(depth, tmp_path):
+    body, _, _ = encode_depth(depth, "npy")
+    path = tmp_path / "depth.npy"
+    path.write_bytes(body)
+    np.testing.assert_array_equal(np.load(path), depth)
+
+
+def test_png16_depth_roundtrip(depth):
+    body, media_type, headers = encode_depth(depth, "png16")
+    assert media_type == "image/png"
+    png = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_UNCHANGED)
+    assert png.dtype == np.uint16
+    restored = png / 65535.0 * float(headers["X-Depth-Scale"])
+    np.testing.assert_allclose(restored, depth, atol=1e-4)
+
+
+def test_columnar_matches_roundtrip(prediction):
+    body, _, headers = encode_matches(prediction, "columnar")
+    decoded = decode_columnar(body)
+    assert headers["X-Num-Matches"] == "10"
+    for key in ("kptsA", "kptsB", "matches", "certainty"):
+        np.testing.assert_array_equal(decoded[key], prediction[key])
+    np.testing.assert_allclose(decoded["F"], prediction["F"])
+    assert (decoded["H_A"], decoded["W_A"], decoded["H_B"], decoded["W_B"]) == (480, 640, 480, 640)
+
+
+def test_columnar_is_smaller_than_json(prediction):
+    columnar, _, _ = encode_matches(prediction, "columnar")
+    as_json, _, _ = encode_matches(prediction, "json")
+    assert len(columnar) < len(as_json)
+
+
+def test_columnar_without_fundamental_matrix(prediction):
+    prediction["F"] = None
+    decoded = decode_columnar(encode_matches(prediction, "columnar")[0])
+    assert decoded["F"] is None
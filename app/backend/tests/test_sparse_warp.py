@@ -0,0 +1,61 @@
+import pytest
+import torch
+
+from src.third_party.romatch.models.model_zoo.roma_models import tiny_roma_v1_model
+from src.third_party.romatch.models.tiny import pixel_grid
+from src.third_party.xfeat import XFeatModel
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return tiny_roma_v1_model(xfeat=XFeatModel(), exact_softmax=True).eval()
+
+
+def _corresps(h=12, w=16, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return {"flow": torch.rand(2, 2, h, w, generator=generator) * 2 - 1,
+            "certainty": torch.randn(2, 1, h, w, generator=generator) * 3}
+
+
+def test_warp_at_matches_the_upsampled_warp(model):
+    corresps = _corresps()
+    warp, certainty = model.upsample_warp(corresps, 48, 64)
+
+    sparse_warp, sparse_certainty = model.warp_at(corresps, warp[..., :2].reshape(2, -1, 2))
+
+    torch.testing.assert_close(sparse_warp, warp.reshape(2, -1, 4), atol=1e-5, rtol=0)
+    torch.testing.assert_close(sparse_certainty, certainty.reshape(2, -1), atol=1e-5, rtol=0)
+
+
+def test_match_resolution_and_cached_grids(model):
+    torch.manual_seed(0)
+    imA, imB = torch.rand(1, 3, 64, 96), torch.rand(1, 3, 64, 96)
+
+    warp, certainty = model.match(imA, imB, batched=False)
+    native, _ = model.match(imA, imB, batched=False, resolution="native")
+    half, _ = model.match(imA, imB, batched=False, resolution=(32, 48))
+    points, point_certainty = model.match(imA, imB, batched=False, num_points=300)
+
+    assert warp.shape == (64, 96, 4) and certainty.shape == (64, 96)
+    assert native.shape == (16, 24, 4) and half.shape == (32, 48, 4)
+    assert points.shape == (300, 4) and point_certainty.shape == (300,)
+    assert pixel_grid(64, 96, "cpu") is pixel_grid(64, 96, torch.device("cpu"))
+
+
+def test_sample_points_follow_the_certainty(model):
+    corresps = _corresps()
+    corresps["certainty"].fill_(-20)
+    corresps["certainty"][:, :, 4:8, 6:10] = 5
+    torch.manual_seed(0)
+
+    warp, certainty = model.sample_points(corresps, 2000)
+
+    assert warp.shape == (2, 2000, 4)
+    # cells 4..8 x 6..10 of a 12 x 16 flow, widened by the half cell over which the certainty is interpolated
+    x, y = (warp[..., 0] + 1) / 2 * 16, (warp[..., 1] + 1) / 2 * 12
+    assert ((x > 5.5) & (x < 10.5) & (y > 3.5) & (y < 8.5)).all()
+    # points below the sample threshold are only accepted with probability their certainty
+    assert (certainty > model.sample_thresh).float().mean() > 0.95
+    matches, _ = model.sample(warp[0], certainty[0], num=500)
+    assert matches.shape == (500, 4)
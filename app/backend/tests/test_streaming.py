@@ -0,0 +1,141 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src.model_mangers.streaming import FrameStream
+from src.utils.serialization import decode_raw, decode_stream_frame, encode_depth, encode_stream_frame
+
+
+async def _run(fn, arg):
+    return await asyncio.to_thread(fn, arg)
+
+
+async def _collect(stream):
+    return [r async for r in stream.results()]
+
+
+def test_results_are_in_order_and_pipelined():
+    active = set()
+    overlap = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def fn(x):
+            with lock:
+                active.add(name)
+                overlap.append(len(active))
+            threading.Event().wait(0.01)
+            with lock:
+                active.discard(name)
+            return x + [name]
+        return fn
+
+    async def main():
+        stream = FrameStream([stage("a"), stage("b"), stage("c")], run=_run, policy="block", queue_size=8)
+        for i in range(6):
+            await stream.offer([i])
+        await stream.finish()
+        return await _collect(stream), stream.stats()
+
+    results, stats = asyncio.run(main())
+    assert [r.seq for r in results] == list(range(6))
+    assert [r.value for r in results] == [[i, "a", "b", "c"] for i in range(6)]
+    assert max(overlap) > 1
+    assert stats["processed"] == 6 and stats["dropped"] == 0
+
+
+@pytest.mark.parametrize("policy, expected", [("drop_oldest", [0, 4]), ("drop_newest", [0, 1])])
+def test_full_intake_drops_frames(policy, expected):
+    async def main():
+        release = asyncio.Event()
+
+        async def run(fn, arg):
+            await release.wait()
+            return fn(arg)
+
+        stream = FrameStream([lambda x: x], run=run, queue_size=1, policy=policy)
+        await stream.offer(0)
+        await asyncio.sleep(0)  # frame 0 is taken by the stage
+        for i in range(1, 5):
+            await stream.offer(i)
+        release.set()
+        await stream.finish()
+        return await _collect(stream)
+
+    results = asyncio.run(main())
+    assert [r.value for r in results] == expected
+    assert results[-1].dropped == 3
+
+
+def test_stage_errors_are_reported_per_frame():
+    def fail_odd(x):
+        if x % 2:
+            raise ValueError("Cannot decode image")
+        return x
+
+    async def main():
+        stream = FrameStream([fail_odd, lambda x: x * 10], run=_run, policy="block")
+        for i in range(4):
+            await stream.offer(i)
+        await stream.finish()
+        return await _collect(stream)
+
+    results = asyncio.run(main())
+    assert [(r.value, r.error) for r in results] == [
+        (0, None), (None, "Cannot decode image"), (20, None), (None, "Cannot decode image")
+    ]
+
+
+def test_close_ends_results():
+    async def main():
+        stream = FrameStream([lambda x: x], run=_run)
+        await stream.offer(0)
+        await stream.close()
+        return await asyncio.wait_for(_collect(stream), timeout=5)
+
+    assert asyncio.run(main()) == []
+
+
+def test_stages_run_on_their_own_runners():
+    calls = []
+
+    def runner(name):
+        async def run(fn, arg):
+            calls.append((name, arg))
+            return await _run(fn, arg)
+        return run
+
+    async def main():
+        stream = FrameStream([lambda x: x + 1, lambda x: x * 10],
+                             run=[runner("decode"), runner("infer")], policy="block")
+        await stream.offer(1)
+        await stream.finish()
+        return await _collect(stream)
+
+    assert [r.value for r in asyncio.run(main())] == [20]
+    assert calls == [("decode", 1), ("infer", 2)]
+
+
+def test_invalid_policy():
+    async def main():
+        FrameStream([lambda x: x], run=_run, policy="newest")
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+    async def mismatched():
+        FrameStream([lambda x: x, lambda x: x], run=[_run])
+
+    with pytest.raises(ValueError):
+        asyncio.run(mismatched())
+
+
+def test_stream_frame_roundtrip():
+    depth = np.arange(6, dtype=np.float32).reshape(2, 3)
+    body, _, headers = encode_depth(depth, "f16")
+    seq, dropped, scale, payload = decode_stream_frame(encode_stream_frame(7, 2, body, headers))
+
+    assert (seq, dropped, scale) == (7, 2, 1.0)
+    np.testing.assert_array_equal(decode_raw(payload), depth)
@@ -1,22 +1,53 @@
+"""
+RGB-D augmentation of zipped scenes: every `<scene>.zip` under the input directory is read in place, without
+extracting it, and each `*.color.png` frame is colour-jittered and blurred while its `*.depth.png` is cleaned,
+scaled and dropped out. Frames are spread over a pool of worker processes.
+
+Every frame draws its augmentation from its own generator, seeded by (seed, scene, frame), so the output is
+byte-identical for a given seed whatever the number of workers, and a resumed run produces the frames it missed
+exactly as an uninterrupted one would. Finished frames are appended to `manifest.jsonl` in the output directory
+and skipped by the next run with the same seed and depth format.
+
+    python augmentation.py INPUT_DIR OUTPUT_DIR --seed 0 --workers 8 --depth-save both
+"""
+import argparse
+import io
+import json
 import os
+import tempfile
+import time
 import zipfile
-import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
 import cv2
 import numpy as np
-from pathlib import Path
 from tqdm import tqdm
-from torchvision.transforms import Compose, ColorJitter, GaussianBlur, ToTensor
 
-INPUT_DIR  = Path(r"")
-OUTPUT_DIR = Path(r"")
 DEPTH_SAVE = 'both'  # one of: 'png', 'npy', 'both'
+MANIFEST = "manifest.jsonl"
+
+# ColorJitter(brightness, contrast, saturation, hue) and GaussianBlur(kernel_size, sigma) of the RGB augmentation
+JITTER = (0.2, 0.2, 0.2, 0.1)
+BLUR_KERNEL = 3
+BLUR_SIGMA = (0.1, 2.0)
+
 
 # Depth loader + cleaner
-def load_and_clean_depth(path):
-    dr = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+def load_and_clean_depth(data):
+    """
+    Decode a depth image and clean it: invalid pixels zeroed, median filtered, holes closed, normalized to (0, 1].
+    :param data: bytes or path, the encoded depth image or its file path
+    :return: np.ndarray, (H, W) float32 depth
+    """
+    if isinstance(data, (str, Path)):
+        dr = cv2.imread(str(data), cv2.IMREAD_UNCHANGED)
+    else:
+        dr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
     if dr is None:
-        raise RuntimeError(f"Can't load depth: {path}")
-    
+        raise RuntimeError(f"Can't load depth: {data if isinstance(data, (str, Path)) else '<bytes>'}")
+
     # flatten to a single float32 channel + alpha mask
     if dr.ndim == 2:
         depth = dr.astype(np.float32); alpha = (depth>0).astype(np.uint8)
@@ -25,7 +56,7 @@ def load_and_clean_depth(path):
     else:
         depth = dr[...,0].astype(np.float32); alpha = (depth>0).astype(np.uint8)
 
-    depth = np.where(alpha>0, depth, 0.0)
+    depth = np.where(alpha>0, depth, 0.0).astype(np.float32)
     depth = cv2.medianBlur(depth, 5)
     k = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7,7))
     depth = cv2.morphologyEx(depth, cv2.MORPH_CLOSE, k)
@@ -33,66 +64,263 @@ def load_and_clean_depth(path):
     m = float(depth.max() or 1.0)
     return (depth/m).astype(np.float32)
 
-rgb_augment = Compose([
-        ColorJitter(0.2, 0.2, 0.2, 0.1),
-        GaussianBlur(kernel_size=3, sigma=(0.1, 2.0))
-    ])
-
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-# iterate all .zip under INPUT_DIR
-for zip_path in sorted(INPUT_DIR.glob("*.zip")):
-    scene = zip_path.stem
-    extract_dir = INPUT_DIR/scene
-
-    if not extract_dir.exists():
-        extract_dir.mkdir()
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extractall(extract_dir)
-
-    out_img = OUTPUT_DIR/scene/"images"
-    out_dep = OUTPUT_DIR/scene/"depths"
-    out_img.mkdir(parents=True, exist_ok=True)
-    out_dep.mkdir(parents=True, exist_ok=True)
-
-    # Process every .color.png under extract_dir/images
-    img_dir = extract_dir/"images"
-    for rgb_path in tqdm(sorted(img_dir.glob("*.color.png")), desc=f"Augment {scene}"):
-        base = rgb_path.name[:-len(".color.png")]
-        frame_id = base
-
-        # RGB augmentation
-        img_bgr = cv2.imread(str(rgb_path), cv2.IMREAD_COLOR)
-        img_rgb = img_bgr[...,::-1].astype(np.float32)/255.0
-        tensor  = ToTensor()(img_rgb).unsqueeze(0)
-        aug_t   = rgb_augment(tensor).squeeze(0)
-        aug_np  = aug_t.permute(1,2,0).numpy()
-        aug_bgr = (np.clip(aug_np*255,0,255).astype(np.uint8))[...,::-1]
-        cv2.imwrite(str(out_img/f"{frame_id}.color.png"), aug_bgr)
-
-        # Depth cleaning & saving
-        depth_path = extract_dir/"depths"/f"{base}.depth.png"
-        if depth_path.exists():
-            depth = load_and_clean_depth(depth_path)
-            # multiplicative noise + dropout
-            depth *= np.random.uniform(0.98,1.02)
-            mask   = (np.random.rand(*depth.shape)>0.02).astype(np.float32)
-            depth *= mask
-
-            if DEPTH_SAVE in ('npy','both'):
-                np.save(str(out_dep/f"{frame_id}.depth.npy"), depth)
-
-            if DEPTH_SAVE in ('png','both'):
-                d16 = (depth*65535).clip(0,65535).astype(np.uint16)
-                cv2.imwrite(str(out_dep/f"{frame_id}.depth.png"), d16)
+
+def _grayscale(rgb):
+    return rgb[..., 0] * 0.2989 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+
+
+def augment_rgb(rgb, rng):
+    """
+    ColorJitter followed by GaussianBlur, with the semantics of torchvision's transforms (factors drawn uniformly,
+    the four jitters in random order, reflected borders) but on NumPy arrays and drawing from `rng`.
+    :param rgb: np.ndarray, (H, W, 3) float32 RGB in [0, 1]
+    :param rng: np.random.Generator, the generator of the frame
+    :return: np.ndarray, the augmented image, float32 in [0, 1]
+    """
+    brightness, contrast, saturation, hue = JITTER
+    factors = (rng.uniform(1 - brightness, 1 + brightness), rng.uniform(1 - contrast, 1 + contrast),
+               rng.uniform(1 - saturation, 1 + saturation), rng.uniform(-hue, hue))
+    for fn in rng.permutation(4):
+        factor = factors[fn]
+        if fn == 0:
+            rgb = np.clip(rgb * factor, 0, 1)
+        elif fn == 1:
+            mean = np.float32(_grayscale(rgb).mean())
+            rgb = np.clip(factor * rgb + (1 - factor) * mean, 0, 1)
+        elif fn == 2:
+            gray = _grayscale(rgb)[..., None]
+            rgb = np.clip(factor * rgb + (1 - factor) * gray, 0, 1)
         else:
-            tqdm.write(f"[WARN] Missing depth for {base}")
+            hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+            hsv[..., 0] = np.mod(hsv[..., 0] + factor * 360, 360)
+            rgb = np.clip(cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB), 0, 1)
+        rgb = rgb.astype(np.float32)
+    sigma = rng.uniform(*BLUR_SIGMA)
+    return cv2.GaussianBlur(rgb, (BLUR_KERNEL, BLUR_KERNEL), sigma, borderType=cv2.BORDER_REFLECT_101)
+
+
+def augment_depth(depth, rng):
+    """
+    Multiplicative noise and 2% dropout of a cleaned depth map.
+    :param depth: np.ndarray, (H, W) float32 depth from `load_and_clean_depth`
+    :param rng: np.random.Generator, the generator of the frame
+    :return: np.ndarray, the augmented depth
+    """
+    depth = depth * np.float32(rng.uniform(0.98, 1.02))
+    mask = (rng.random(depth.shape) > 0.02).astype(np.float32)
+    return depth * mask
+
+
+def frame_rng(seed, scene, frame):
+    """
+    The generator of a frame, independent of the worker and the order frames are processed in.
+    :return: np.random.Generator
+    """
+    return np.random.default_rng(np.random.SeedSequence([seed, zlib.crc32(f"{scene}/{frame}".encode())]))
+
+
+def list_frames(zip_path):
+    """
+    Frames of a zipped scene, with the archive members of their colour and depth images.
+    A depth image is paired with the colour image of the same frame name, wherever it is in the archive.
+    :param zip_path: Path, the archive
+    :return: list[tuple[str, str, str | None]], sorted (frame, colour member, depth member or None)
+    """
+    colors, depths = {}, {}
+    with zipfile.ZipFile(zip_path) as z:
+        for name in z.namelist():
+            base = PurePosixPath(name).name
+            if base.endswith(".color.png"):
+                colors[base[:-len(".color.png")]] = name
+            elif base.endswith(".depth.png"):
+                depths[base[:-len(".depth.png")]] = name
+    return [(frame, colors[frame], depths.get(frame)) for frame in sorted(colors)]
+
+
+def _outputs(frame, depth_save, has_depth):
+    outputs = [f"images/{frame}.color.png"]
+    if has_depth and depth_save in ('npy', 'both'):
+        outputs.append(f"depths/{frame}.depth.npy")
+    if has_depth and depth_save in ('png', 'both'):
+        outputs.append(f"depths/{frame}.depth.png")
+    return outputs
+
+
+def _write(path, data):
+    # written next to the target and renamed, an interrupted run never leaves a truncated frame behind
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+_archives = {}
+
+
+def _archive(zip_path):
+    # one open archive per worker process and scene
+    if zip_path not in _archives:
+        _archives[zip_path] = zipfile.ZipFile(zip_path)
+    return _archives[zip_path]
+
+
+def _close_archives():
+    for archive in _archives.values():
+        archive.close()
+    _archives.clear()
+
+
+def _init_worker():
+    # parallelism comes from the worker processes, not from OpenCV threads inside each of them
+    cv2.setNumThreads(1)
+    # forked workers must not share the file offsets of archives opened by the parent
+    _archives.clear()
+
+
+def augment_frame(task):
+    """
+    Augment one frame and write its outputs. Runs in the worker processes.
+    :param task: tuple, (zip path, scene, frame, colour member, depth member or None, scene output dir, seed,
+        depth_save)
+    :return: dict, the manifest entry of the frame
+    """
+    zip_path, scene, frame, color_member, depth_member, out_dir, seed, depth_save = task
+    archive = _archive(zip_path)
+    rng = frame_rng(seed, scene, frame)
+
+    # RGB augmentation
+    img_bgr = cv2.imdecode(np.frombuffer(archive.read(color_member), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img_bgr is None:
+        raise RuntimeError(f"Can't load image: {zip_path}:{color_member}")
+    img_rgb = img_bgr[..., ::-1].astype(np.float32) / 255.0
+    aug_rgb = augment_rgb(np.ascontiguousarray(img_rgb), rng)
+    aug_bgr = np.ascontiguousarray(np.clip(aug_rgb * 255, 0, 255).astype(np.uint8)[..., ::-1])
+    _write(out_dir / "images" / f"{frame}.color.png", cv2.imencode(".png", aug_bgr)[1].tobytes())
+
+    # Depth cleaning & saving
+    if depth_member is not None:
+        depth = augment_depth(load_and_clean_depth(archive.read(depth_member)), rng)
+        if depth_save in ('npy', 'both'):
+            buf = io.BytesIO()
+            np.save(buf, depth, allow_pickle=False)
+            _write(out_dir / "depths" / f"{frame}.depth.npy", buf.getvalue())
+        if depth_save in ('png', 'both'):
+            d16 = (depth * 65535).clip(0, 65535).astype(np.uint16)
+            _write(out_dir / "depths" / f"{frame}.depth.png", cv2.imencode(".png", d16)[1].tobytes())
+
+    return {"scene": scene, "frame": frame, "seed": seed, "depth_save": depth_save,
+            "outputs": _outputs(frame, depth_save, depth_member is not None)}
+
+
+def read_manifest(output_dir, seed, depth_save):
+    """
+    Frames finished by previous runs with the same seed and depth format whose outputs all exist.
+    :return: set[tuple[str, str]], the (scene, frame) pairs to skip
+    """
+    done = set()
+    path = Path(output_dir) / MANIFEST
+    if not path.exists():
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted run
+                continue
+            if entry["seed"] != seed or entry["depth_save"] != depth_save:
+                continue
+            scene_dir = Path(output_dir) / entry["scene"]
+            if all((scene_dir / output).exists() for output in entry["outputs"]):
+                done.add((entry["scene"], entry["frame"]))
+    return done
+
+
+def augment(input_dir, output_dir, seed=0, workers=None, depth_save=DEPTH_SAVE, resume=True, scenes=None,
+            chunksize=4, progress=True):
+    """
+    Augment every zipped scene of a directory.
+    :param input_dir: Path, directory of the `<scene>.zip` archives
+    :param output_dir: Path, written as `<scene>/images/*.color.png` and `<scene>/depths/*.depth.{npy,png}`
+    :param seed: int, seed of the augmentation
+    :param workers: int, number of worker processes, 0 to augment on the calling process, os.cpu_count() if None
+    :param depth_save: str, one of 'png', 'npy', 'both'
+    :param resume: bool, skip the frames of the manifest
+    :param scenes: list[str], names of the scenes to augment, all of them if None
+    :param chunksize: int, frames sent to a worker at a time
+    :param progress: bool, show a progress bar
+    :return: dict, the number of frames augmented and skipped, the seconds it took and the frames per second
+    """
+    if depth_save not in ('png', 'npy', 'both'):
+        raise ValueError(f"depth_save must be one of 'png', 'npy', 'both', got '{depth_save}'")
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = os.cpu_count() if workers is None else workers
+    done = read_manifest(output_dir, seed, depth_save) if resume else set()
+
+    tasks, skipped, missing_depth = [], 0, 0
+    for zip_path in sorted(input_dir.glob("*.zip")):
+        scene = zip_path.stem
+        if scenes is not None and scene not in scenes:
+            continue
+        for frame, color_member, depth_member in list_frames(zip_path):
+            if (scene, frame) in done:
+                skipped += 1
+                continue
+            missing_depth += depth_member is None
+            tasks.append((str(zip_path), scene, frame, color_member, depth_member, output_dir / scene, seed,
+                          depth_save))
+    if missing_depth:
+        tqdm.write(f"[WARN] {missing_depth} frame(s) without depth")
+
+    started = time.perf_counter()
+    with open(output_dir / MANIFEST, "a") as manifest, \
+            tqdm(total=len(tasks), desc="Augment", unit="frame", disable=not progress) as bar:
+        if workers == 0:
+            results = map(augment_frame, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            results = pool.map(augment_frame, tasks, chunksize=chunksize)
+        try:
+            for entry in results:
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+                bar.update()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            else:
+                _close_archives()
+    seconds = time.perf_counter() - started
+    return {"frames": len(tasks), "skipped": skipped, "seconds": seconds,
+            "fps": len(tasks) / seconds if seconds > 0 else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", type=Path, help="directory of the <scene>.zip archives")
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, 0 runs in-process "
+                                                                  "(default: one per CPU)")
+    parser.add_argument("--depth-save", choices=('png', 'npy', 'both'), default=DEPTH_SAVE)
+    parser.add_argument("--scenes", nargs="+", default=None, help="only augment these scenes")
+    parser.add_argument("--no-resume", action="store_true", help="redo the frames of the manifest")
+    parser.add_argument("--chunksize", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    stats = augment(args.input_dir, args.output_dir, seed=args.seed, workers=args.workers,
+                    depth_save=args.depth_save, resume=not args.no_resume, scenes=args.scenes,
+                    chunksize=args.chunksize)
+    print(f"{stats['frames']} frames augmented ({stats['skipped']} already done) in {stats['seconds']:.1f} s, "
+          f"{stats['fps']:.1f} frames/s")
 
-        # # Pose Copy
-        # pose_path = extract_dir/"poses"/f"{base}.pose.txt"
-        # if pose_path.exists():
-        #     shutil.copy(str(pose_path), str(out_dep.parent/f"{base}.pose.txt"))
-        # else:
-        #     tqdm.write(f"[WARN] Missing pose for {base}")
 
-print("All scenes processed.")
+if __name__ == "__main__":
+    main()
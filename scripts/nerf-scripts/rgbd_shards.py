@@ -0,0 +1,361 @@
+"""
+Packs an RGB-D scene into a few contiguous shards, so training reads frames from memory-mapped arrays instead of
+decoding thousands of small PNGs.
+
+A scene is either in the 7-Scenes layout (`*.color.png`, `*.depth.png`, `*.pose.txt`) or a NeRF-Stereo capture with
+a `cameras.json` (colour images named by its `file_path` entries, `*.depth.png` next to them). The packed scene is
+
+    index.json                    scene metadata, depth encoding and the files of the current pack
+    frames-<pack>.npy             one record per frame: name, shard, row, size, camera-to-world pose and intrinsics
+    shard-<pack>-00000.rgb.npy    (n, H, W, 3) uint8 RGB
+    shard-<pack>-00000.depth.npy  (n, H, W) uint16 raw depth, 0 where invalid or missing
+
+Depth is kept as the raw 16-bit values of the PNGs, losslessly; metres are raw * scale + offset with the scale and
+offset of the depth encoding recorded in index.json. The encoding of a scene must be given when packing, the same
+PNG format holds millimetres in 7-Scenes and normalized depth in the NeRF renders (including dataset-preview).
+
+Frames of a shard share their size; every array is an `.npy` file opened with `np.load(..., mmap_mode=...)`,
+i.e. an `np.memmap` read without copies. A repack writes files of a new pack and replaces index.json last, so an
+interrupted repack leaves the previous pack intact. `PackedRGBDDataset` serves the frames to a
+`torch.utils.data.DataLoader`.
+
+    python rgbd_shards.py 7-scenes/fire packed/fire --depth-encoding millimetres
+    python rgbd_shards.py dataset-preview/fire packed/fire-preview --depth-encoding normalized
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+INDEX = "index.json"
+SHARD_BYTES = 1024 ** 3
+
+# Depth encodings of the 16-bit depth PNGs: metres = raw * scale + offset, raw 0 and `invalid` mark missing depth.
+# 7-Scenes stores millimetres with 65535 for invalid pixels, the NeRF renders depth normalized between the
+# near (0.1) and far (20) planes of the training notebooks.
+DEPTH_ENCODINGS = {
+    'millimetres': {'scale': 1e-3, 'offset': 0.0, 'invalid': 65535},
+    'normalized': {'scale': (20.0 - 0.1) / 65535, 'offset': 0.1, 'invalid': None},
+}
+
+# 7-Scenes Kinect intrinsics (fx, fy, cx, cy), used for scenes without a cameras.json
+SEVEN_SCENES_INTRINSICS = (585.0, 585.0, 320.0, 240.0)
+
+COLOR_PATTERNS = ("*.color.png", "*.color.jpg")
+FRAME_DTYPE = np.dtype([
+    ("name", "U128"),
+    ("shard", "<i4"),
+    ("row", "<i4"),
+    ("height", "<i4"),
+    ("width", "<i4"),
+    ("has_depth", "?"),
+    ("has_pose", "?"),
+    ("pose", "<f4", (4, 4)),
+    ("K", "<f4", (3, 3)),
+])
+
+
+def _stem(path):
+    return Path(path).name.split('.')[0]
+
+
+def _intrinsics(fx, fy, cx, cy):
+    return np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float32)
+
+
+def scene_frames(scene_dir, intrinsics=None):
+    """
+    Frames of a scene with their depth, pose and intrinsics.
+    Depth maps and poses are paired with the colour image of the same frame name (`frame-000000`, `IMG_..._TIMEBURST1`)
+    anywhere in the scene; poses come from `<frame>.pose.txt` or the `transform_matrix` of a `cameras.json`.
+    :param scene_dir: Path, the scene directory, searched recursively
+    :param intrinsics: tuple, (fx, fy, cx, cy) of every frame, the cameras.json or 7-Scenes ones if None
+    :return: list[dict], sorted by name: name, color, depth (or None), pose (4x4 or None), K (3x3 or None to scale
+        from the `camera` of cameras.json once the image size is known)
+    """
+    scene_dir = Path(scene_dir)
+    colors = {_stem(p): p for pattern in COLOR_PATTERNS for p in scene_dir.rglob(pattern)}
+    depths = {_stem(p): p for p in scene_dir.rglob("*.depth.png")}
+    pose_files = {_stem(p): p for p in scene_dir.rglob("*.pose.txt")}
+
+    transforms, camera = {}, None
+    for cameras_path in sorted(scene_dir.rglob("cameras.json")):
+        cameras = json.loads(cameras_path.read_text())
+        camera = {k: v for k, v in cameras.items() if k != "frames"}
+        for frame in cameras.get("frames", []):
+            transforms[_stem(frame["file_path"])] = frame["transform_matrix"]
+            image = cameras_path.parent / frame["file_path"]
+            if _stem(image) not in colors and image.is_file():
+                colors[_stem(image)] = image
+
+    frames = []
+    for name in sorted(colors):
+        if name in pose_files:
+            pose = np.loadtxt(pose_files[name], dtype=np.float32).reshape(4, 4)
+        elif name in transforms:
+            pose = np.asarray(transforms[name], dtype=np.float32).reshape(4, 4)
+        else:
+            pose = None
+        if intrinsics is not None:
+            K = _intrinsics(*intrinsics)
+        elif camera is None:
+            K = _intrinsics(*SEVEN_SCENES_INTRINSICS)
+        else:
+            K = None
+        frames.append({"name": name, "color": colors[name], "depth": depths.get(name), "pose": pose, "K": K,
+                       "camera": camera})
+    return frames
+
+
+def _camera_K(camera, height, width):
+    # cameras.json intrinsics, scaled when the images were resized from the calibrated w x h
+    sx, sy = width / camera.get("w", width), height / camera.get("h", height)
+    return _intrinsics(camera["fl_x"] * sx, camera["fl_y"] * sy, camera["cx"] * sx, camera["cy"] * sy)
+
+
+def read_depth(path, size, invalid):
+    """
+    Decode a 16-bit depth image, with `invalid` values set to 0.
+    :param size: tuple, (height, width) of the colour image, the depth is resized to it with nearest neighbours
+    :return: np.ndarray, (H, W) uint16 raw depth
+    """
+    raw = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if raw is None:
+        raise RuntimeError(f"Can't load depth: {path}")
+    if raw.ndim == 3:
+        raw = raw[..., 0]
+    if raw.dtype != np.uint16:
+        raise RuntimeError(f"Expected a 16-bit depth image: {path}")
+    if raw.shape != tuple(size):
+        raw = cv2.resize(raw, (size[1], size[0]), interpolation=cv2.INTER_NEAREST)
+    if invalid is not None:
+        raw = np.where(raw == invalid, 0, raw).astype(np.uint16)
+    return raw
+
+
+def to_metres(raw, encoding):
+    """
+    Metric float32 depth of raw packed depth, 0 where it is missing.
+    :param raw: np.ndarray, uint16 depth of a shard
+    :param encoding: dict, the 'depth' entry of index.json
+    """
+    return np.where(raw > 0, raw.astype(np.float32) * encoding["scale"] + encoding["offset"], 0).astype(np.float32)
+
+
+def _replace(path, write):
+    # written next to the target and renamed, readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def pack_scene(scene_dir, out_dir, depth_encoding, shard_bytes=SHARD_BYTES, depth_scale=None, depth_offset=None,
+               intrinsics=None, workers=4):
+    """
+    Pack a scene into shards of at most `shard_bytes` (a shard always holds at least one frame).
+    :param scene_dir: Path, the scene
+    :param out_dir: Path, the packed scene, a previous pack is replaced
+    :param depth_encoding: str, one of DEPTH_ENCODINGS, the encoding of the depth PNGs of the scene
+    :param shard_bytes: int, size bound of a shard, RGB and depth together
+    :param depth_scale: float, metres per raw depth unit overriding the one of the encoding
+    :param depth_offset: float, metres added to valid depths overriding the one of the encoding
+    :param intrinsics: tuple, (fx, fy, cx, cy) overriding the intrinsics of every frame
+    :param workers: int, threads decoding the images
+    :return: dict, the number of frames and shards, the bytes written and the seconds it took
+    """
+    if depth_encoding not in DEPTH_ENCODINGS:
+        raise ValueError(f"Unknown depth encoding '{depth_encoding}', expected one of {', '.join(DEPTH_ENCODINGS)}")
+    encoding = dict(DEPTH_ENCODINGS[depth_encoding])
+    encoding["scale"] = encoding["scale"] if depth_scale is None else depth_scale
+    encoding["offset"] = encoding["offset"] if depth_offset is None else depth_offset
+    started = time.perf_counter()
+    frames = scene_frames(scene_dir, intrinsics)
+    if not frames:
+        raise FileNotFoundError(f"No colour frames found under '{scene_dir}'")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # frames of the same size are packed together, in name order, a shard at a time
+    sizes = []
+    for frame in frames:
+        with Image.open(frame["color"]) as image:
+            sizes.append((image.height, image.width))
+    groups = {}
+    for i, size in enumerate(sizes):
+        groups.setdefault(size, []).append(i)
+    shards = []
+    for (height, width), indices in sorted(groups.items(), key=lambda item: item[1][0]):
+        per_shard = max(1, shard_bytes // (height * width * (3 + 2)))
+        for start in range(0, len(indices), per_shard):
+            shards.append(((height, width), indices[start:start + per_shard]))
+
+    table = np.zeros(len(frames), dtype=FRAME_DTYPE)
+    index_shards = []
+
+    def load(i):
+        frame, size = frames[i], sizes[i]
+        bgr = cv2.imread(str(frame["color"]), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise RuntimeError(f"Can't load image: {frame['color']}")
+        depth = None
+        if frame["depth"] is not None:
+            depth = read_depth(frame["depth"], size, encoding["invalid"])
+        return bgr[..., ::-1], depth
+
+    # every file of a pack is new, index.json switches to them once they are all written
+    pack = uuid.uuid4().hex[:8]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for s, ((height, width), indices) in enumerate(shards):
+            rgb_name, depth_name = f"shard-{pack}-{s:05d}.rgb.npy", f"shard-{pack}-{s:05d}.depth.npy"
+            rgb = np.lib.format.open_memmap(out_dir / rgb_name, mode="w+", dtype=np.uint8,
+                                            shape=(len(indices), height, width, 3))
+            depth = np.lib.format.open_memmap(out_dir / depth_name, mode="w+", dtype=np.uint16,
+                                              shape=(len(indices), height, width))
+            for row, (i, (color, frame_depth)) in enumerate(zip(indices, pool.map(load, indices))):
+                frame = frames[i]
+                rgb[row] = color
+                depth[row] = frame_depth if frame_depth is not None else 0
+                K = frame["K"] if frame["K"] is not None else _camera_K(frame["camera"], height, width)
+                table[i] = (frame["name"], s, row, height, width, frame_depth is not None, frame["pose"] is not None,
+                            frame["pose"] if frame["pose"] is not None else np.full((4, 4), np.nan), K)
+            rgb.flush()
+            depth.flush()
+            del rgb, depth
+            index_shards.append({"rgb": rgb_name, "depth": depth_name, "frames": len(indices),
+                                 "height": height, "width": width})
+
+    table_name = f"frames-{pack}.npy"
+    _replace(out_dir / table_name, lambda f: np.save(f, table, allow_pickle=False))
+    camera = next((frame["camera"] for frame in frames if frame["camera"] is not None), None)
+    index = {
+        "version": 2,
+        "scene": Path(scene_dir).name,
+        "pack": pack,
+        "frames": len(frames),
+        "table": table_name,
+        "depth": {"dtype": "uint16", "encoding": depth_encoding, "scale": encoding["scale"],
+                  "offset": encoding["offset"], "invalid": 0},
+        "camera": camera,
+        "shards": index_shards,
+    }
+    _replace(out_dir / INDEX, lambda f: f.write(json.dumps(index, indent=2).encode()))
+
+    current = {table_name} | {name for shard in index_shards for name in (shard["rgb"], shard["depth"])}
+    for stale in [*out_dir.glob("shard-*.npy"), *out_dir.glob("frames-*.npy")]:
+        if stale.name not in current:
+            stale.unlink()
+
+    written = sum((out_dir / name).stat().st_size for shard in index_shards for name in (shard["rgb"], shard["depth"]))
+    return {"frames": len(frames), "shards": len(index_shards), "bytes": written,
+            "seconds": time.perf_counter() - started}
+
+
+def load_packed(packed_dir, mmap_mode="r"):
+    """
+    Open a packed scene without reading it.
+    :param packed_dir: Path, written by `pack_scene`
+    :param mmap_mode: str, 'r' for read-only arrays, 'c' for copy-on-write ones (writable, e.g. for torch.from_numpy)
+    :return: tuple, (index dict, frames table, list of (rgb, depth) np.memmap pairs)
+    """
+    packed_dir = Path(packed_dir)
+    index = json.loads((packed_dir / INDEX).read_text())
+    table = np.load(packed_dir / index["table"], mmap_mode=mmap_mode, allow_pickle=False)
+    shards = [(np.load(packed_dir / shard["rgb"], mmap_mode=mmap_mode, allow_pickle=False),
+               np.load(packed_dir / shard["depth"], mmap_mode=mmap_mode, allow_pickle=False))
+              for shard in index["shards"]]
+    return index, table, shards
+
+
+class PackedRGBDDataset(Dataset):
+    """
+    Frames of one or more packed scenes. A sample holds tensors viewing the memory-mapped shards, no PNG is decoded
+    and nothing but the metric depth is computed until the sample is converted or collated:
+        image  (3, H, W) uint8 RGB
+        depth  (H, W) float32 metres, or the uint16 raw depth viewing the shard with `raw_depth`; 0 where missing
+        pose   (4, 4) float32 camera-to-world, NaN without a pose
+        K      (3, 3) float32
+        name   str, the frame name
+    The shards are opened lazily in every DataLoader worker, the dataset itself pickles without them.
+    """
+
+    def __init__(self, packed_dirs, transform=None, raw_depth=False):
+        """
+        :param packed_dirs: Path or list[Path], packed scenes
+        :param transform: callable, applied to every sample dict
+        :param raw_depth: bool, return the raw packed depth instead of metres (see `to_metres`)
+        """
+        if isinstance(packed_dirs, (str, Path)):
+            packed_dirs = [packed_dirs]
+        self.packed_dirs = [Path(d) for d in packed_dirs]
+        self.transform = transform
+        self.raw_depth = raw_depth
+        self.frames = [(scene, i) for scene, d in enumerate(self.packed_dirs)
+                       for i in range(json.loads((d / INDEX).read_text())["frames"])]
+        self._scenes = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_scenes"] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self._scenes is None:
+            # copy-on-write maps are writable, so torch.from_numpy views them without copying or warning
+            self._scenes = [load_packed(d, mmap_mode="c") for d in self.packed_dirs]
+        scene, i = self.frames[idx]
+        index, table, shards = self._scenes[scene]
+        record = table[i]
+        rgb, depth = shards[record["shard"]]
+        depth = depth[record["row"]]
+        sample = {
+            "image": torch.from_numpy(rgb[record["row"]]).permute(2, 0, 1),
+            "depth": torch.from_numpy(depth if self.raw_depth else to_metres(depth, index["depth"])),
+            "pose": torch.from_numpy(np.array(record["pose"])),
+            "K": torch.from_numpy(np.array(record["K"])),
+            "name": str(record["name"]),
+        }
+        return self.transform(sample) if self.transform else sample
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scene_dir", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--shard-mb", type=int, default=SHARD_BYTES // 1024 ** 2)
+    parser.add_argument("--depth-encoding", choices=sorted(DEPTH_ENCODINGS), required=True,
+                        help="millimetres (7-Scenes) or normalized (NeRF renders)")
+    parser.add_argument("--depth-scale", type=float, default=None, help="metres per raw depth unit, overrides the "
+                                                                        "encoding")
+    parser.add_argument("--depth-offset", type=float, default=None, help="metres added to valid depths, overrides "
+                                                                         "the encoding")
+    parser.add_argument("--intrinsics", type=float, nargs=4, metavar=("FX", "FY", "CX", "CY"), default=None)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    stats = pack_scene(args.scene_dir, args.out_dir, args.depth_encoding, shard_bytes=args.shard_mb * 1024 ** 2,
+                       depth_scale=args.depth_scale, depth_offset=args.depth_offset, intrinsics=args.intrinsics,
+                       workers=args.workers)
+    print(f"{stats['frames']} frames packed into {stats['shards']} shard(s), {stats['bytes'] / 1024 ** 2:.1f} MB "
+          f"in {stats['seconds']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()